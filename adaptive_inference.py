@@ -0,0 +1,178 @@
+import cv2
+import numpy as np
+from landmarks import LandmarkArray, as_array
+from metrics import INFERENCE_FRAMES
+
+# Defaults for AdaptivePose; analyzers override them with ADAPTIVE_OPTIONS
+DEFAULT_OPTIONS = dict(
+    motion_threshold=1.5,     # Mean absolute grey-level change that counts as motion
+    max_skip=2,               # Consecutive frames that may reuse the last pose
+    roi_margin=0.25,          # Crop padding as a fraction of the landmark box size
+    redetect_interval=30,     # Inferences between full-frame passes
+    min_visibility=0.5,       # Landmarks below this do not shape the crop
+)
+
+# Motion is measured on a small greyscale thumbnail
+THUMBNAIL_SIZE = (64, 48)
+
+
+class PoseLandmarks:
+    __slots__ = ("landmark",)
+
+    def __init__(self, landmark):
+        self.landmark = landmark
+
+
+class PoseResults:
+    """Mimics the object returned by mp_pose.Pose.process."""
+    __slots__ = ("pose_landmarks",)
+
+    def __init__(self, landmarks=None):
+        self.pose_landmarks = PoseLandmarks(LandmarkArray(landmarks)) if landmarks is not None else None
+
+
+def landmark_box(landmarks, width, height, margin, min_visibility):
+    """Pixel box (x0, y0, x1, y1) around the visible landmarks, padded by
+    `margin` times its larger side; None when too few landmarks are visible
+    or the box would be tiny."""
+    points = landmarks[landmarks[:, 3] >= min_visibility]
+    if len(points) < 4:
+        return None
+    x0, y0 = points[:, 0].min() * width, points[:, 1].min() * height
+    x1, y1 = points[:, 0].max() * width, points[:, 1].max() * height
+    margin = margin * max(x1 - x0, y1 - y0)
+    box = (int(max(0, x0 - margin)), int(max(0, y0 - margin)),
+           int(min(width, x1 + margin)), int(min(height, y1 + margin)))
+    if box[2] - box[0] < 32 or box[3] - box[1] < 32:
+        return None
+    return box
+
+
+def infer_in_box(pose, rgb_frame, box):
+    """Run `pose` on the `box` crop of `rgb_frame` (the whole frame for None).
+
+    Returns a (33, 4) array normalized to the full frame, or None.
+    """
+    if box is None:
+        results = pose.process(rgb_frame)
+        if not results.pose_landmarks:
+            return None
+        return as_array(results.pose_landmarks.landmark).copy()
+    x0, y0, x1, y1 = box
+    results = pose.process(np.ascontiguousarray(rgb_frame[y0:y1, x0:x1]))
+    if not results.pose_landmarks:
+        return None
+    landmarks = as_array(results.pose_landmarks.landmark).copy()
+    return crop_to_frame(landmarks, box, rgb_frame.shape[1], rgb_frame.shape[0])
+
+
+def crop_to_frame(landmarks, box, width, height):
+    """Map crop-normalized landmark coordinates back to the full frame, in place."""
+    x0, y0, x1, y1 = box
+    landmarks[:, 0] = (landmarks[:, 0] * (x1 - x0) + x0) / width
+    landmarks[:, 1] = (landmarks[:, 1] * (y1 - y0) + y0) / height
+    landmarks[:, 2] *= (x1 - x0) / width
+    return landmarks
+
+
+class AdaptivePose:
+    """Wraps a Pose (or PoseLease, or HybridPose) with ROI cropping and motion-gated skipping.
+
+    While the person barely moves, up to `max_skip` frames in a row reuse
+    the last pose, extrapolated with its recent velocity, instead of running
+    inference. Otherwise inference runs on a crop around the previous
+    landmarks. The crop box only moves when the person nears its edge, so
+    the graph's own tracking sees a steady view. A full frame is used on
+    start, every `redetect_interval` inferences and whenever tracking is
+    lost.
+
+    `mode` is the last frame's inference mode (full, roi or skipped), for
+    process workers to report to the parent's INFERENCE_FRAMES.
+    """
+
+    def __init__(self, pose, **options):
+        self.pose = pose
+        self.options = dict(DEFAULT_OPTIONS, **options)
+        self.thumbnail = None
+        self.landmarks = None
+        self.velocity = None
+        self.box = None
+        self.skipped = 0
+        self.since_full = 0
+        self.frames_since_inference = 1
+        self.mode = None
+
+    def _motion(self, rgb_frame):
+        thumbnail = cv2.resize(cv2.cvtColor(rgb_frame, cv2.COLOR_RGB2GRAY), THUMBNAIL_SIZE, interpolation=cv2.INTER_AREA)
+        motion = float("inf") if self.thumbnail is None else float(cv2.absdiff(thumbnail, self.thumbnail).mean())
+        return thumbnail, motion
+
+    def _crop_box(self, width, height):
+        return landmark_box(self.landmarks, width, height, self.options["roi_margin"], self.options["min_visibility"])
+
+    def _box_still_fits(self, width, height):
+        points = self.landmarks[self.landmarks[:, 3] >= self.options["min_visibility"]]
+        # With too few visible landmarks there is nothing to fit; _crop_box drops the box
+        if self.box is None or len(points) < 4:
+            return False
+        x0, y0, x1, y1 = self.box
+        # Move the box once landmarks come within half a margin of its edge
+        pad = 0.5 * self.options["roi_margin"] * max(
+            (points[:, 0].max() - points[:, 0].min()) * width, (points[:, 1].max() - points[:, 1].min()) * height)
+        return (points[:, 0].min() * width - pad >= x0 or x0 == 0) and \
+               (points[:, 1].min() * height - pad >= y0 or y0 == 0) and \
+               (points[:, 0].max() * width + pad <= x1 or x1 == width) and \
+               (points[:, 1].max() * height + pad <= y1 or y1 == height)
+
+    def _infer(self, rgb_frame, box):
+        # A HybridPose picks its model per crop and maps the result back itself
+        if hasattr(self.pose, "infer"):
+            return self.pose.infer(rgb_frame, box)
+        return infer_in_box(self.pose, rgb_frame, box)
+
+    def process(self, rgb_frame):
+        options = self.options
+        thumbnail, motion = self._motion(rgb_frame)
+
+        if self.landmarks is not None and motion < options["motion_threshold"] and self.skipped < options["max_skip"]:
+            self.skipped += 1
+            self.frames_since_inference += 1
+            self.mode = "skipped"
+            INFERENCE_FRAMES.inc(mode=self.mode)
+            landmarks = self.landmarks.copy()
+            if self.velocity is not None:
+                landmarks[:, :3] += self.velocity * self.skipped
+            return PoseResults(landmarks)
+
+        height, width = rgb_frame.shape[:2]
+        landmarks = None
+        if self.landmarks is not None and self.since_full < options["redetect_interval"]:
+            if not self._box_still_fits(width, height):
+                self.box = self._crop_box(width, height)
+            if self.box is not None:
+                landmarks = self._infer(rgb_frame, self.box)
+                if landmarks is not None:
+                    self.mode = "roi"
+                    INFERENCE_FRAMES.inc(mode=self.mode)
+                    self.since_full += 1
+        if landmarks is None:
+            # First frame, scheduled re-detection or tracking lost in the crop
+            self.box = None
+            landmarks = self._infer(rgb_frame, None)
+            self.mode = "full"
+            INFERENCE_FRAMES.inc(mode=self.mode)
+            self.since_full = 0
+
+        if landmarks is not None and self.landmarks is not None:
+            self.velocity = (landmarks[:, :3] - self.landmarks[:, :3]) / self.frames_since_inference
+        else:
+            self.velocity = None
+        self.landmarks = landmarks
+        self.thumbnail = thumbnail
+        self.skipped = 0
+        self.frames_since_inference = 1
+        return PoseResults(landmarks)
+
+    def release(self):
+        if hasattr(self.pose, "release"):
+            self.pose.release()
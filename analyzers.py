@@ -0,0 +1,63 @@
+from bicep_curl import BicepCurlAnalyzer
+from lunge import LungeAnalyzer
+from plank import PlankAnalyzer
+from side_lateral_raise import SideLateralRaisesAnalyzer
+from session_store import analyzer_state, restore_analyzer
+
+# Analyzer class for every workoutType the server and tools accept
+ANALYZERS = {
+    'bicep_curl': BicepCurlAnalyzer,
+    'lunge': LungeAnalyzer,
+    'plank': PlankAnalyzer,
+    'lateral_raises': SideLateralRaisesAnalyzer,
+}
+
+
+class SessionAnalyzers(dict):
+    """A client's analyzers, each created on the first message for its workoutType.
+
+    Saved `states` (see session_store) are applied as analyzers are created,
+    and `wrap(name, analyzer)`, if given, may decorate each new one. Unknown
+    workout types raise KeyError.
+    """
+
+    def __init__(self, states=None, wrap=None):
+        super().__init__()
+        self.pending = dict(states or {})
+        self.wrap = wrap
+        # (workoutType, participant ID) -> analyzer, for multi-person sessions
+        self.participants = {}
+
+    def __missing__(self, name):
+        analyzer = ANALYZERS[name]()
+        if name in self.pending:
+            restore_analyzer(analyzer, self.pending.pop(name))
+        if self.wrap is not None:
+            analyzer = self.wrap(name, analyzer)
+        self[name] = analyzer
+        return analyzer
+
+    def participant(self, name, participant_id):
+        """The analyzer for one participant of a multi-person session.
+
+        Participant IDs only hold within one connection, so these analyzers
+        start fresh and are not part of get_state().
+        """
+        key = (name, participant_id)
+        analyzer = self.participants.get(key)
+        if analyzer is None:
+            analyzer = ANALYZERS[name]()
+            if self.wrap is not None:
+                analyzer = self.wrap(f"{name}-{participant_id}", analyzer)
+            self.participants[key] = analyzer
+        return analyzer
+
+    def drop_participant(self, name, participant_id):
+        """Forget a participant whose track has ended; returns their analyzer, if any."""
+        return self.participants.pop((name, participant_id), None)
+
+    def get_state(self):
+        """Saved states of every analyzer, including restored ones not used yet."""
+        states = dict(self.pending)
+        states.update((name, analyzer_state(analyzer)) for name, analyzer in self.items())
+        return states
@@ -0,0 +1,66 @@
+import numpy as np
+from landmarks import (
+    as_array, LANDMARK_FIELDS,
+    LEFT_SHOULDER, RIGHT_SHOULDER, LEFT_ELBOW, RIGHT_ELBOW, LEFT_WRIST, RIGHT_WRIST,
+    LEFT_HIP, RIGHT_HIP, LEFT_KNEE, RIGHT_KNEE, LEFT_ANKLE, RIGHT_ANKLE,
+)
+
+# Every joint angle the analyzers use, as (a, b, c) landmark triples with the
+# angle measured at b.
+JOINT_ANGLES = {
+    "left_elbow": (LEFT_SHOULDER, LEFT_ELBOW, LEFT_WRIST),
+    "right_elbow": (RIGHT_SHOULDER, RIGHT_ELBOW, RIGHT_WRIST),
+    "left_shoulder": (LEFT_HIP, LEFT_SHOULDER, LEFT_ELBOW),
+    "right_shoulder": (RIGHT_HIP, RIGHT_SHOULDER, RIGHT_ELBOW),
+    "left_hip": (LEFT_SHOULDER, LEFT_HIP, LEFT_ANKLE),
+    "right_hip": (RIGHT_SHOULDER, RIGHT_HIP, RIGHT_ANKLE),
+    "left_knee": (LEFT_HIP, LEFT_KNEE, LEFT_ANKLE),
+    "right_knee": (RIGHT_HIP, RIGHT_KNEE, RIGHT_ANKLE),
+}
+
+ANGLE_NAMES = tuple(JOINT_ANGLES)
+
+
+def angle_columns(triples, fields=LANDMARK_FIELDS):
+    """Columns compute_angles() reads from a flattened frame for `triples`.
+
+    `triples` are (a, b, c) landmark indices and `fields` the values per
+    landmark. The columns are the y then x coordinates of c and a, followed
+    by those of b for each, so one subtraction gives both vectors.
+    """
+    a, b, c = (np.array([triple[i] for triple in triples], dtype=np.intp).reshape(-1) * fields for i in range(3))
+    return np.concatenate((c + 1, a + 1, c, a, b + 1, b + 1, b, b))
+
+
+_COLUMNS = angle_columns(JOINT_ANGLES.values())
+
+
+def compute_angles(points, columns=None):
+    """Compute every angle in JOINT_ANGLES in one pass.
+
+    `points` is a (33, 4) landmark array or a (frames, 33, 4) batch.
+    `columns` (from angle_columns) computes other triples instead. Returns
+    degrees in [0, 180] with shape (angles,) or (frames, angles).
+    """
+    points = np.asarray(points)
+    # Columns along the first axis keep the slices in gathered_angles() the
+    # same for one frame and for a batch
+    flat = points.reshape(-1) if points.ndim == 2 else points.reshape(len(points), -1).T
+    angles = gathered_angles(flat.take(_COLUMNS if columns is None else columns, axis=0))
+    return angles if points.ndim == 2 else angles.T
+
+
+def gathered_angles(gathered):
+    """Angles from the values at angle_columns(), one row per column."""
+    n = len(gathered) // 8
+    if gathered.dtype != np.float64:
+        gathered = gathered.astype(np.float64)
+    vectors = gathered[:4 * n] - gathered[4 * n:]
+    directions = np.arctan2(vectors[:2 * n], vectors[2 * n:])
+    angles = np.abs(np.degrees(directions[:n] - directions[n:]))
+    return np.minimum(angles, 360.0 - angles)
+
+
+def joint_angles(landmarks):
+    """Angles for a single frame of landmarks, keyed by JOINT_ANGLES name."""
+    return dict(zip(ANGLE_NAMES, compute_angles(as_array(landmarks)).tolist()))
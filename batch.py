@@ -0,0 +1,192 @@
+"""Re-score recorded workout videos offline.
+
+Usage:
+    python batch.py videos/*.mp4 --exercise bicep_curl [--output results] [--format jsonl|parquet]
+        [--filter one_euro|kalman|none] [--hybrid]
+
+Each video is streamed frame by frame through one worker process (with its
+own Pose graph) and the exercise analyzer. For every video two files are
+written: `<name>.reps.*` with one row per completed rep and `<name>.frames.*`
+with the joint angles of every frame. With --hybrid, frames run through the
+lite Pose model except near the exercise's thresholds (see fidelity.py);
+each frame row records the model used and the summary the share of frames
+per model.
+"""
+import argparse
+import json
+import os
+import sys
+from multiprocessing import Pool
+from pathlib import Path
+import cv2
+import mediapipe as mp
+from analyzers import ANALYZERS
+from angles import ANGLE_NAMES, compute_angles
+from fidelity import HybridPose
+from landmark_filter import DEFAULT_FILTER, FILTERS, smoothed
+from landmarks import LandmarkArray, landmarks_to_array
+
+mp_pose = mp.solutions.pose
+
+# Rows buffered per Parquet row group; JSONL rows are written immediately
+PARQUET_CHUNK = 1024
+
+# Pose graphs of this worker process, by options
+_poses = {}
+
+
+def _acquire(pose_options):
+    key = tuple(sorted(pose_options.items()))
+    pose = _poses.get(key)
+    if pose is None:
+        pose = _poses[key] = mp_pose.Pose(**pose_options)
+    # Tracking state must not carry over from the previous video
+    pose.reset()
+    return pose
+
+
+class JsonlWriter:
+    def __init__(self, path):
+        self.file = open(path, "w")
+
+    def write(self, row):
+        self.file.write(json.dumps(row) + "\n")
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetWriter:
+    def __init__(self, path):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.pa = pa
+        self.pq = pq
+        self.path = path
+        self.writer = None
+        self.rows = []
+
+    def write(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= PARQUET_CHUNK:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        table = self.pa.Table.from_pylist(self.rows)
+        if self.writer is None:
+            self.writer = self.pq.ParquetWriter(self.path, table.schema)
+        self.writer.write_table(table)
+        self.rows = []
+
+    def close(self):
+        self.flush()
+        if self.writer is not None:
+            self.writer.close()
+
+
+WRITERS = {"jsonl": JsonlWriter, "parquet": ParquetWriter}
+
+
+def analyze_video(job):
+    """Stream one video through Pose and the analyzer; runs in a worker process."""
+    video_path, exercise, output_dir, output_format, landmark_filter, hybrid = job
+    analyzer = smoothed(ANALYZERS[exercise](), landmark_filter)
+    pose = HybridPose(_acquire, analyzer) if hybrid else _acquire(analyzer.POSE_OPTIONS)
+    stem = Path(video_path).stem
+    writer_class = WRITERS[output_format]
+    reps = writer_class(os.path.join(output_dir, f"{stem}.reps.{output_format}"))
+    frames = writer_class(os.path.join(output_dir, f"{stem}.frames.{output_format}"))
+
+    capture = cv2.VideoCapture(video_path)
+    frame_index = 0
+    # The latest rep's row, written once its tempo is known (for some
+    # exercises that is a few frames after the rep is counted)
+    pending = None
+    try:
+        while True:
+            ok, frame = capture.read()
+            if not ok:
+                break
+            timestamp = capture.get(cv2.CAP_PROP_POS_MSEC)
+            results = pose.process(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+
+            row = {"frame": frame_index, "timestampMs": timestamp, "detected": bool(results.pose_landmarks)}
+            if hybrid:
+                row["model"] = pose.model
+            if results.pose_landmarks:
+                points = landmarks_to_array(results.pose_landmarks.landmark)
+                # The frame rows keep every joint angle; the analyzer computes its own
+                row.update(zip(ANGLE_NAMES, compute_angles(points).tolist()))
+                # Holds and tempo are timed by the video's own timestamps
+                result = analyzer.analyze(LandmarkArray(points), timestamp)
+                feedback = result.get("feedback")
+                if isinstance(feedback, dict) and "count" in feedback:
+                    if pending is not None:
+                        reps.write(pending)
+                    pending = {
+                        "frame": frame_index,
+                        "timestampMs": timestamp,
+                        "rep": feedback["count"],
+                        "correct": feedback["intent"] == 1,
+                        "text": feedback["text"],
+                        "concentricSeconds": None,
+                        "eccentricSeconds": None,
+                        "timeUnderTension": None,
+                    }
+                tempo = result.get("tempo")
+                if tempo is not None and pending is not None and tempo.get("rep") == pending["rep"]:
+                    pending["concentricSeconds"] = tempo.get("concentric")
+                    pending["eccentricSeconds"] = tempo.get("eccentric")
+                    pending["timeUnderTension"] = tempo.get("timeUnderTension")
+                    reps.write(pending)
+                    pending = None
+            frames.write(row)
+            frame_index += 1
+        if pending is not None:
+            reps.write(pending)
+    finally:
+        capture.release()
+        reps.close()
+        frames.close()
+
+    summary = {
+        "video": video_path,
+        "frames": frame_index,
+        "totalReps": analyzer.total_reps,
+        "correctReps": analyzer.correct_reps,
+        "incorrectReps": analyzer.incorrect_reps,
+    }
+    if hybrid:
+        summary["models"] = pose.fractions()
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyze recorded workout videos.")
+    parser.add_argument("videos", nargs="+", help="Video files to analyze")
+    parser.add_argument("--exercise", required=True, choices=sorted(ANALYZERS))
+    parser.add_argument("--output", default="batch_results", help="Directory for result files")
+    parser.add_argument("--format", default="jsonl", choices=sorted(WRITERS))
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Worker processes (one Pose each)")
+    parser.add_argument("--filter", default=DEFAULT_FILTER, choices=["none", *FILTERS],
+                        help="Landmark smoothing before analysis (the server's LANDMARK_FILTER default)")
+    parser.add_argument("--hybrid", action="store_true",
+                        help="Use the lite Pose model away from thresholds (the server's HYBRID_FIDELITY)")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.output, exist_ok=True)
+    jobs = [(video, args.exercise, args.output, args.format, args.filter, args.hybrid) for video in args.videos]
+    workers = max(1, min(args.workers or 1, len(jobs)))
+
+    # Videos are independent, so they are spread across processes as they finish
+    with Pool(workers) as pool:
+        for summary in pool.imap_unordered(analyze_video, jobs):
+            print(json.dumps(summary))
+            sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""Stage-by-stage latency of the frame pipeline.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_pipeline [--exercise bicep_curl] [--iterations 200]
+        [--resolutions 480p,720p,1080p] [--video recording.mp4] [--trace session.trace]
+
+Synthetic frames are rendered at each resolution; `--video` adds recorded
+frames at their native size. The analyze stage runs on the landmarks
+MediaPipe finds, falling back to `--trace` frames or a synthetic pose.
+Results are printed and saved as JSON under benchmarks/results/.
+"""
+import argparse
+import asyncio
+import base64
+import json
+import time
+import cv2
+import mediapipe as mp
+import numpy as np
+from analyzers import ANALYZERS
+from frame_mailbox import FrameMailbox
+from frame_pipeline import FrameExecutor, build_feedback
+from landmarks import LandmarkArray, landmarks_to_array
+from landmark_trace import LandmarkTrace
+from protocol import pack_frame, parse_binary
+from benchmarks.common import save_results, summarize, synthetic_frame, synthetic_landmarks
+
+mp_pose = mp.solutions.pose
+
+RESOLUTIONS = {
+    "360p": (640, 360),
+    "480p": (640, 480),
+    "720p": (1280, 720),
+    "1080p": (1920, 1080),
+}
+
+STAGES = ("json_loads", "b64decode", "parse_binary", "imdecode", "cvtColor", "pose_process", "analyze", "json_dumps")
+
+
+def load_video_frames(path, limit):
+    capture = cv2.VideoCapture(path)
+    frames = []
+    while len(frames) < limit:
+        ok, frame = capture.read()
+        if not ok:
+            break
+        frames.append(frame)
+    capture.release()
+    return frames
+
+
+def bench_stages(frames, exercise, pose, fallback_landmarks, iterations):
+    """Time each stage of decoding and processing, cycling through `frames`."""
+    messages = []
+    for index, frame in enumerate(frames):
+        encoded = cv2.imencode(".jpg", frame)[1].tobytes()
+        messages.append((
+            json.dumps({"workoutType": exercise, "frame": base64.b64encode(encoded).decode()}),
+            pack_frame(exercise, index, 0.0, encoded),
+        ))
+
+    analyzer = ANALYZERS[exercise]()
+    timings = {stage: [] for stage in STAGES}
+    detected = 0
+    for i in range(iterations):
+        text_message, binary_message = messages[i % len(messages)]
+
+        start = time.perf_counter()
+        data = json.loads(text_message)
+        t_json = time.perf_counter()
+        frame_data = base64.b64decode(data["frame"])
+        t_b64 = time.perf_counter()
+        parse_binary(binary_message)
+        t_binary = time.perf_counter()
+        frame = cv2.imdecode(np.frombuffer(frame_data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        t_decode = time.perf_counter()
+        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        t_color = time.perf_counter()
+        results = pose.process(rgb_frame) if pose is not None else None
+        t_pose = time.perf_counter()
+
+        if results is not None and results.pose_landmarks:
+            detected += 1
+            landmarks = LandmarkArray(landmarks_to_array(results.pose_landmarks.landmark))
+        else:
+            landmarks = LandmarkArray(fallback_landmarks[i % len(fallback_landmarks)])
+        t_analyze_start = time.perf_counter()
+        feedback = build_feedback(analyzer, landmarks)
+        t_analyze = time.perf_counter()
+        json.dumps(feedback)
+        t_dumps = time.perf_counter()
+
+        timings["json_loads"].append(t_json - start)
+        timings["b64decode"].append(t_b64 - t_json)
+        timings["parse_binary"].append(t_binary - t_b64)
+        timings["imdecode"].append(t_decode - t_binary)
+        timings["cvtColor"].append(t_color - t_decode)
+        if pose is not None:
+            timings["pose_process"].append(t_pose - t_color)
+        timings["analyze"].append(t_analyze - t_analyze_start)
+        timings["json_dumps"].append(t_dumps - t_analyze)
+
+    result = {stage: summarize(samples) for stage, samples in timings.items()}
+    result["poseDetectedFraction"] = detected / iterations
+    result["jpegBytes"] = int(np.mean([len(binary) for _, binary in messages]))
+    return result
+
+
+class FakeWebSocket:
+    async def send(self, message):
+        pass
+
+
+async def bench_handler(frames, exercise, iterations, workers):
+    """Time main.handle_message end to end, including the executor hop."""
+    import main
+
+    executor = FrameExecutor("thread", workers)
+    session = executor.session()
+    analyzers = {exercise: ANALYZERS[exercise]()}
+    mailbox = FrameMailbox()
+    websocket = FakeWebSocket()
+    encoded = [cv2.imencode(".jpg", frame)[1].tobytes() for frame in frames]
+    samples = []
+    try:
+        for i in range(iterations):
+            data = parse_binary(pack_frame(exercise, i, 0.0, encoded[i % len(encoded)]))
+            start = time.perf_counter()
+            await main.handle_message(websocket, data, start, analyzers, session, mailbox)
+            samples.append(time.perf_counter() - start)
+    finally:
+        session.close()
+        executor.shutdown()
+    return summarize(samples)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark each stage of the frame pipeline.")
+    parser.add_argument("--exercise", default="bicep_curl", choices=sorted(ANALYZERS))
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--resolutions", default="480p,720p,1080p", help=f"Comma list of {', '.join(RESOLUTIONS)}")
+    parser.add_argument("--video", help="Also benchmark frames from this recording")
+    parser.add_argument("--trace", help="Landmark trace to analyze when no pose is detected")
+    parser.add_argument("--skip-inference", action="store_true", help="Leave out pose.process and the handler")
+    parser.add_argument("--workers", type=int, default=2, help="Executor threads for the handler stage")
+    parser.add_argument("--output", help="Result file (default: benchmarks/results/pipeline-<time>.json)")
+    args = parser.parse_args(argv)
+
+    if args.trace:
+        fallback_landmarks = np.asarray(LandmarkTrace(args.trace).landmarks[:args.iterations])
+    else:
+        fallback_landmarks = synthetic_landmarks()[None]
+
+    inputs = {}
+    for name in args.resolutions.split(","):
+        width, height = RESOLUTIONS[name]
+        inputs[name] = [synthetic_frame(width, height)]
+    if args.video:
+        inputs["video"] = load_video_frames(args.video, args.iterations)
+
+    results = {"exercise": args.exercise, "iterations": args.iterations, "inputs": {}}
+    for name, frames in inputs.items():
+        if not frames:
+            print(f"{name}: no frames, skipped")
+            continue
+        pose = None if args.skip_inference else mp_pose.Pose(**ANALYZERS[args.exercise].POSE_OPTIONS)
+        try:
+            stage_results = bench_stages(frames, args.exercise, pose, fallback_landmarks, args.iterations)
+        finally:
+            if pose is not None:
+                pose.close()
+        if not args.skip_inference:
+            stage_results["handler"] = asyncio.run(bench_handler(frames, args.exercise, args.iterations, args.workers))
+        stage_results["resolution"] = list(frames[0].shape[1::-1])
+        results["inputs"][name] = stage_results
+
+        print(f"{name} ({frames[0].shape[1]}x{frames[0].shape[0]})")
+        for stage in STAGES + ("handler",):
+            summary = stage_results.get(stage)
+            if summary and summary.get("count"):
+                print(f"  {stage:<13} p50 {summary['p50Ms']:8.3f} ms  p95 {summary['p95Ms']:8.3f} ms  "
+                      f"p99 {summary['p99Ms']:8.3f} ms  {summary['fps']:10.1f} fps")
+
+    print(f"Saved {save_results('pipeline', results, args.output)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Server cold-start and time-to-first-feedback benchmark.
+
+Usage (from the repository root):
+    python -m benchmarks.cold_start [--runs 5] [--settle 0] [--warm-pool 1:1]
+        [--server-dir .] [--exercise bicep_curl]
+
+Each run starts a fresh `python main.py` and records (all in ms):
+  import       `import main` in a separate interpreter
+  ready        process start until the first WebSocket handshake succeeds
+  firstFrame   first JPEG frame sent until its feedback arrives
+  secondFrame  the next frame, for comparison with steady state
+`--settle` waits that many seconds between the server becoming ready and
+the first frame, so the background pool warm-up can finish (0 measures a
+client connecting the moment the server is up). `--server-dir` points at
+another checkout to compare against.
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+import cv2
+import websockets
+from protocol import pack_frame
+from benchmarks.common import save_results, summarize, synthetic_frame
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+URL = "ws://localhost:8765"
+
+
+def time_import(server_dir):
+    code = "import time; start = time.perf_counter(); import main; print(time.perf_counter() - start)"
+    output = subprocess.run([sys.executable, "-c", code], cwd=server_dir, capture_output=True, text=True, check=True)
+    return float(output.stdout.strip().splitlines()[-1])
+
+
+async def first_feedback(jpeg, exercise):
+    async with websockets.connect(URL, max_size=None) as websocket:
+        timings = []
+        for sequence in range(2):
+            start = time.perf_counter()
+            await websocket.send(pack_frame(exercise, sequence, time.time() * 1000, jpeg))
+            await websocket.recv()
+            timings.append(time.perf_counter() - start)
+        return timings
+
+
+async def run_once(args, jpeg, env):
+    start = time.perf_counter()
+    server = subprocess.Popen([sys.executable, "main.py"], cwd=args.server_dir, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            try:
+                async with websockets.connect(URL):
+                    break
+            except OSError:
+                if server.poll() is not None:
+                    raise RuntimeError("Server exited during start-up")
+                await asyncio.sleep(0.01)
+        ready = time.perf_counter() - start
+        await asyncio.sleep(args.settle)
+        first, second = await first_feedback(jpeg, args.exercise)
+        return ready, first, second
+    finally:
+        server.terminate()
+        server.wait()
+
+
+async def run(args):
+    jpeg = cv2.imencode(".jpg", synthetic_frame(640, 480))[1].tobytes()
+    env = dict(os.environ, METRICS_PORT="0")
+    if args.warm_pool is not None:
+        env["POSE_WARM_POOL"] = args.warm_pool
+    imports, readies, firsts, seconds = [], [], [], []
+    for _ in range(args.runs):
+        imports.append(time_import(args.server_dir))
+        ready, first, second = await run_once(args, jpeg, env)
+        readies.append(ready)
+        firsts.append(first)
+        seconds.append(second)
+        print(f"import {imports[-1]:.3f}s  ready {ready:.3f}s  first frame {first * 1000:.1f} ms  "
+              f"second frame {second * 1000:.1f} ms")
+    return {
+        "import": summarize(imports),
+        "ready": summarize(readies),
+        "firstFrame": summarize(firsts),
+        "secondFrame": summarize(seconds),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure server start-up and time to first feedback.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--settle", type=float, default=0.0, help="Seconds between server ready and first frame")
+    parser.add_argument("--warm-pool", help="POSE_WARM_POOL for the server (default: its own default)")
+    parser.add_argument("--server-dir", default=REPO_ROOT, help="Checkout whose main.py is started")
+    parser.add_argument("--exercise", default="bicep_curl")
+    parser.add_argument("--output", help="Result file (default: benchmarks/results/cold_start-<time>.json)")
+    args = parser.parse_args(argv)
+
+    results = asyncio.run(run(args))
+    settings = {key: value for key, value in vars(args).items() if key != "output"}
+    print(f"Saved {save_results('cold_start', {'settings': settings, **results}, args.output)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+import json
+import os
+import platform
+import time
+import numpy as np
+from landmarks import (
+    NUM_LANDMARKS, LANDMARK_FIELDS,
+    LEFT_SHOULDER, RIGHT_SHOULDER, LEFT_ELBOW, RIGHT_ELBOW, LEFT_WRIST, RIGHT_WRIST,
+    LEFT_HIP, RIGHT_HIP, LEFT_KNEE, RIGHT_KNEE, LEFT_ANKLE, RIGHT_ANKLE,
+)
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+# Normalized (x, y) of a person standing with arms down, used for synthetic input
+STANDING_POSE = {
+    LEFT_SHOULDER: (0.58, 0.30), RIGHT_SHOULDER: (0.42, 0.30),
+    LEFT_ELBOW: (0.60, 0.45), RIGHT_ELBOW: (0.40, 0.45),
+    LEFT_WRIST: (0.61, 0.58), RIGHT_WRIST: (0.39, 0.58),
+    LEFT_HIP: (0.55, 0.58), RIGHT_HIP: (0.45, 0.58),
+    LEFT_KNEE: (0.55, 0.75), RIGHT_KNEE: (0.45, 0.75),
+    LEFT_ANKLE: (0.55, 0.92), RIGHT_ANKLE: (0.45, 0.92),
+}
+
+SKELETON = [
+    (LEFT_SHOULDER, RIGHT_SHOULDER), (LEFT_HIP, RIGHT_HIP),
+    (LEFT_SHOULDER, LEFT_ELBOW), (LEFT_ELBOW, LEFT_WRIST),
+    (RIGHT_SHOULDER, RIGHT_ELBOW), (RIGHT_ELBOW, RIGHT_WRIST),
+    (LEFT_SHOULDER, LEFT_HIP), (RIGHT_SHOULDER, RIGHT_HIP),
+    (LEFT_HIP, LEFT_KNEE), (LEFT_KNEE, LEFT_ANKLE),
+    (RIGHT_HIP, RIGHT_KNEE), (RIGHT_KNEE, RIGHT_ANKLE),
+]
+
+
+def synthetic_landmarks():
+    """A (33, 4) landmark array for a standing person."""
+    landmarks = np.full((NUM_LANDMARKS, LANDMARK_FIELDS), 0.5, dtype=np.float32)
+    landmarks[:, 2] = 0.0
+    landmarks[:, 3] = 1.0
+    for index, (x, y) in STANDING_POSE.items():
+        landmarks[index, :2] = (x, y)
+    return landmarks
+
+
+def synthetic_frame(width, height):
+    """A BGR frame with a stick figure drawn from synthetic_landmarks()."""
+    import cv2
+
+    frame = np.full((height, width, 3), 90, dtype=np.uint8)
+    points = {index: (int(x * width), int(y * height)) for index, (x, y) in STANDING_POSE.items()}
+    thickness = max(2, width // 60)
+    for a, b in SKELETON:
+        cv2.line(frame, points[a], points[b], (210, 180, 160), thickness)
+    head = (width // 2, int(0.2 * height))
+    cv2.circle(frame, head, int(0.07 * height), (170, 190, 220), -1)
+    return frame
+
+
+def summarize(samples):
+    """Latency percentiles (ms) and throughput for a list of durations in seconds."""
+    if not samples:
+        return {"count": 0}
+    ms = np.asarray(samples) * 1000
+    mean = float(ms.mean())
+    return {
+        "count": len(samples),
+        "meanMs": mean,
+        "p50Ms": float(np.percentile(ms, 50)),
+        "p95Ms": float(np.percentile(ms, 95)),
+        "p99Ms": float(np.percentile(ms, 99)),
+        "fps": 1000 / mean if mean else None,
+    }
+
+
+def save_results(name, results, path=None):
+    """Write results with run metadata as JSON; returns the file path."""
+    if path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    payload = {
+        "benchmark": name,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "host": platform.node(),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "results": results,
+    }
+    with open(path, "w") as f:
+        json.dump(payload, f, indent=2)
+    return path
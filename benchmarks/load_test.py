@@ -0,0 +1,163 @@
+"""End-to-end load generator for the WebSocket server.
+
+Usage (from the repository root):
+    python -m benchmarks.load_test [--url ws://localhost:8765] [--clients 1,4,16,64]
+        [--duration 10] [--fps 0] [--resolution 480p] [--json] [--spawn]
+
+For each concurrency level N clients connect and stream frames for
+`--duration` seconds. With `--fps 0` every client waits for the reply
+before sending its next frame (closed loop); otherwise clients send at
+that rate regardless of replies and the server's frame dropping shows up
+in the results. `--spawn` starts `python main.py` for the run.
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import subprocess
+import sys
+import time
+import cv2
+import websockets
+from protocol import pack_frame
+from benchmarks.common import save_results, summarize, synthetic_frame
+from benchmarks.bench_pipeline import RESOLUTIONS
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class ClientStats:
+    def __init__(self):
+        self.sent = 0
+        self.received = 0
+        self.errors = 0
+        self.dropped = 0
+        self.latencies = []
+
+
+async def run_client(url, exercise, encoded, duration, fps, use_json, stats):
+    async with websockets.connect(url, max_size=None) as websocket:
+        send_times = {}
+        deadline = time.perf_counter() + duration
+        interval = 1 / fps if fps else 0
+
+        async def receive():
+            async for message in websocket:
+                reply = json.loads(message)
+                stats.received += 1
+                if reply.get("error") and reply["error"] != "No pose detected":
+                    stats.errors += 1
+                stats.dropped = max(stats.dropped, reply.get("droppedFrames", 0))
+                sent_at = send_times.pop(reply.get("seq"), None)
+                if sent_at is not None:
+                    stats.latencies.append(time.perf_counter() - sent_at)
+                if not fps:
+                    replied.set()
+
+        replied = asyncio.Event()
+        receiver = asyncio.create_task(receive())
+        sequence = 0
+        try:
+            while time.perf_counter() < deadline:
+                if use_json:
+                    # JSON replies carry no seq, so only closed-loop latency is exact
+                    send_times[None] = time.perf_counter()
+                    message = json.dumps({"workoutType": exercise, "frame": encoded["base64"]})
+                else:
+                    send_times[sequence] = time.perf_counter()
+                    message = pack_frame(exercise, sequence, time.time() * 1000, encoded["jpeg"])
+                replied.clear()
+                await websocket.send(message)
+                stats.sent += 1
+                sequence += 1
+                if fps:
+                    await asyncio.sleep(interval)
+                else:
+                    try:
+                        await asyncio.wait_for(replied.wait(), timeout=max(0.0, deadline - time.perf_counter()))
+                    except asyncio.TimeoutError:
+                        break
+        finally:
+            receiver.cancel()
+
+
+async def run_level(url, clients, exercise, encoded, duration, fps, use_json):
+    stats = [ClientStats() for _ in range(clients)]
+    start = time.perf_counter()
+    outcomes = await asyncio.gather(
+        *(run_client(url, exercise, encoded, duration, fps, use_json, s) for s in stats),
+        return_exceptions=True,
+    )
+    elapsed = time.perf_counter() - start
+    latencies = [latency for s in stats for latency in s.latencies]
+    received = sum(s.received for s in stats)
+    return {
+        "clients": clients,
+        "failedClients": sum(isinstance(outcome, Exception) for outcome in outcomes),
+        "sent": sum(s.sent for s in stats),
+        "received": received,
+        "errors": sum(s.errors for s in stats),
+        "droppedFrames": sum(s.dropped for s in stats),
+        "throughputFps": received / elapsed,
+        "latency": summarize(latencies),
+    }
+
+
+async def wait_for_server(url, timeout=60):
+    deadline = time.perf_counter() + timeout
+    while True:
+        try:
+            async with websockets.connect(url):
+                return
+        except OSError:
+            if time.perf_counter() > deadline:
+                raise
+            await asyncio.sleep(0.5)
+
+
+async def run(args):
+    width, height = RESOLUTIONS[args.resolution]
+    jpeg = cv2.imencode(".jpg", synthetic_frame(width, height))[1].tobytes()
+    encoded = {"jpeg": jpeg, "base64": base64.b64encode(jpeg).decode()}
+
+    server = None
+    if args.spawn:
+        server = subprocess.Popen([sys.executable, "main.py"], cwd=REPO_ROOT)
+    try:
+        await wait_for_server(args.url)
+        levels = []
+        for clients in (int(n) for n in args.clients.split(",")):
+            level = await run_level(args.url, clients, args.exercise, encoded, args.duration, args.fps, args.json)
+            latency = level["latency"]
+            print(f"{clients:4d} clients  {level['throughputFps']:8.1f} fps  "
+                  f"p50 {latency.get('p50Ms', 0):8.1f} ms  p95 {latency.get('p95Ms', 0):8.1f} ms  "
+                  f"p99 {latency.get('p99Ms', 0):8.1f} ms  dropped {level['droppedFrames']}")
+            levels.append(level)
+        return levels
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure server throughput and latency as concurrency grows.")
+    parser.add_argument("--url", default="ws://localhost:8765")
+    parser.add_argument("--clients", default="1,4,16,64", help="Comma list of concurrency levels")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per concurrency level")
+    parser.add_argument("--fps", type=float, default=0, help="Per-client send rate; 0 waits for each reply")
+    parser.add_argument("--exercise", default="bicep_curl")
+    parser.add_argument("--resolution", default="480p", choices=sorted(RESOLUTIONS))
+    parser.add_argument("--json", action="store_true", help="Send legacy JSON+base64 messages")
+    parser.add_argument("--spawn", action="store_true", help="Start main.py for the duration of the run")
+    parser.add_argument("--output", help="Result file (default: benchmarks/results/load-<time>.json)")
+    args = parser.parse_args(argv)
+
+    levels = asyncio.run(run(args))
+    settings = {key: value for key, value in vars(args).items() if key != "output"}
+    print(f"Saved {save_results('load', {'settings': settings, 'levels': levels}, args.output)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+from adaptive_inference import PoseResults, infer_in_box
+from metrics import MODEL_FRAMES
+
+# Defaults for HybridPose; analyzers override them with FIDELITY_OPTIONS
+DEFAULT_OPTIONS = dict(
+    margin=15.0,            # Degrees from a threshold within which the full model runs
+    min_visibility=0.7,     # The full model also runs while a landmark the analyzer reads is less visible
+    hold=1,                 # Full-model frames clear of both before the lite model takes over again
+    lite_complexity=0,      # model_complexity of the model used the rest of the time
+)
+
+# Frames by the model whose landmarks were used; "escalated" frames ran both
+MODELS = ("lite", "full", "escalated")
+
+
+def fidelity_options(analyzer):
+    return dict(DEFAULT_OPTIONS, **getattr(analyzer, "FIDELITY_OPTIONS", {}))
+
+
+def lite_pose_options(analyzer):
+    """Pose options of `analyzer`'s lite model: its own, at the lite complexity."""
+    return dict(analyzer.POSE_OPTIONS, model_complexity=fidelity_options(analyzer)["lite_complexity"])
+
+
+class HybridPose:
+    """Runs the lite Pose model, and the analyzer's own (full) model only near a decision.
+
+    `acquire(pose_options)` returns a Pose or PoseLease. After each frame
+    the analyzer's decision_margin() says how close the landmarks are to a
+    stage or form threshold and how visible the landmarks it reads are.
+    When a lite frame comes within `margin` degrees or drops below
+    `min_visibility`, the frame is run again with the full model, and the
+    full model stays in use until `hold` of its frames in a row are clear of
+    both; a larger `hold` stops landmark noise at the edge of the margin
+    from switching models back and forth. A model's tracking is reset when
+    it takes over, so it never starts from a pose it last saw many frames
+    ago.
+
+    `frames` counts frames by model (see MODELS); `model` is the last one.
+    """
+
+    def __init__(self, acquire, analyzer, **options):
+        self.analyzer = analyzer
+        self.options = dict(fidelity_options(analyzer), **options)
+        self.lite = acquire(lite_pose_options(analyzer))
+        self.full = acquire(analyzer.POSE_OPTIONS)
+        self.use_full = False
+        self.clear = 0
+        self.model = None
+        self.frames = dict.fromkeys(MODELS, 0)
+
+    def needs_full(self, landmarks):
+        if landmarks is None:
+            # Both models share the person detector; the full one finds nobody either
+            return False
+        margin, visibility = self.analyzer.decision_margin(landmarks)
+        return margin < self.options["margin"] or visibility < self.options["min_visibility"]
+
+    def infer(self, rgb_frame, box=None):
+        """infer_in_box() with the model this frame needs."""
+        if self.use_full:
+            model = "full"
+            landmarks = infer_in_box(self.full, rgb_frame, box)
+            self.clear = 0 if self.needs_full(landmarks) else self.clear + 1
+            if self.clear >= self.options["hold"]:
+                self.use_full = False
+                self.lite.reset()
+        else:
+            model = "lite"
+            landmarks = infer_in_box(self.lite, rgb_frame, box)
+            if self.needs_full(landmarks):
+                model = "escalated"
+                self.full.reset()
+                landmarks = infer_in_box(self.full, rgb_frame, box)
+                self.use_full = True
+                self.clear = 0
+        self.model = model
+        self.frames[model] += 1
+        MODEL_FRAMES.inc(model=model)
+        return landmarks
+
+    def process(self, rgb_frame):
+        return PoseResults(self.infer(rgb_frame))
+
+    def fractions(self):
+        """Share of frames by model, rounded to 0.001."""
+        total = sum(self.frames.values())
+        return {model: round(count / total, 3) if total else 0.0 for model, count in self.frames.items()}
+
+    def reset(self):
+        self.lite.reset()
+        self.full.reset()
+        self.use_full = False
+        self.clear = 0
+
+    def release(self):
+        for pose in (self.lite, self.full):
+            if hasattr(pose, "release"):
+                pose.release()
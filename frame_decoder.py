@@ -0,0 +1,81 @@
+import cv2
+import numpy as np
+from metrics import STAGE_SECONDS
+
+# Reduced-resolution JPEG decode modes by scale factor, largest first
+REDUCED_MODES = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2))
+
+# JPEG start-of-frame markers (baseline, progressive, ...) carry the image size
+_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def jpeg_size(data):
+    """(width, height) from a JPEG's header without decoding it, or None."""
+    data = memoryview(data)
+    if len(data) < 4 or data[0] != 0xFF or data[1] != 0xD8:
+        return None
+    i = 2
+    while i + 9 < len(data):
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:
+            i += 1
+            continue
+        if marker in _SOF_MARKERS:
+            height = (data[i + 5] << 8) | data[i + 6]
+            width = (data[i + 7] << 8) | data[i + 8]
+            return width, height
+        i += 2 + ((data[i + 2] << 8) | data[i + 3])
+    return None
+
+
+class FrameDecoder:
+    """Per-session decode stage.
+
+    JPEG frames larger than needed are decoded at 1/2, 1/4 or 1/8 scale so
+    their long side still reaches `target_size` (MediaPipe downsamples
+    anyway); 0 always decodes at full size. Color conversion writes into a
+    buffer reused across the session's frames.
+    """
+
+    def __init__(self, target_size=640):
+        self.target_size = target_size
+        self.rgb = None
+
+    def read_mode(self, frame_data):
+        if not self.target_size:
+            return cv2.IMREAD_COLOR
+        size = jpeg_size(frame_data)
+        if size is None:
+            return cv2.IMREAD_COLOR
+        long_side = max(size)
+        for factor, mode in REDUCED_MODES:
+            if long_side // factor >= self.target_size:
+                return mode
+        return cv2.IMREAD_COLOR
+
+    def decode(self, frame_data):
+        """Decode an encoded image (JPEG/PNG bytes) into a BGR frame."""
+        with STAGE_SECONDS.time(stage="decode"):
+            np_frame = np.frombuffer(frame_data, dtype=np.uint8)
+            return cv2.imdecode(np_frame, self.read_mode(frame_data))
+
+    def to_rgb(self, frame):
+        """Convert to RGB in the session's reused buffer.
+
+        The result is only valid until the next call.
+        """
+        with STAGE_SECONDS.time(stage="convert"):
+            if self.rgb is None or self.rgb.shape != frame.shape:
+                self.rgb = np.empty_like(frame)
+            return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=self.rgb)
+
+    def decode_rgb(self, frame_data):
+        return self.to_rgb(self.decode(frame_data))
+
+    def preferred_input_size(self):
+        """Frame size clients are asked to send, as [width, height]."""
+        if not self.target_size:
+            return None
+        return [self.target_size, self.target_size * 3 // 4]
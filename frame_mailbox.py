@@ -0,0 +1,57 @@
+import asyncio
+import time
+from collections import deque
+from metrics import DROPPED_FRAMES
+
+
+class FrameMailbox:
+    """Bounded per-client inbox where the newest frames win.
+
+    At most `capacity` frames are held; putting another one drops the oldest
+    waiting frame and counts it in `dropped`. Control messages (e.g. reset)
+    are never dropped and keep their place in the order.
+    """
+
+    def __init__(self, capacity=1):
+        self.capacity = capacity
+        self.items = deque()
+        self.frames = 0
+        self.dropped = 0
+        self.closed = False
+        self.ready = asyncio.Event()
+
+    def put(self, message, droppable=True):
+        if droppable:
+            if self.frames >= self.capacity:
+                self._drop_oldest_frame()
+            self.frames += 1
+        self.items.append((message, droppable, time.perf_counter()))
+        self.ready.set()
+
+    def _drop_oldest_frame(self):
+        for i, (_, droppable, _) in enumerate(self.items):
+            if droppable:
+                del self.items[i]
+                self.frames -= 1
+                self.dropped += 1
+                DROPPED_FRAMES.inc()
+                return
+
+    async def get(self):
+        """Wait for the next message; returns (message, received_at) or None once closed."""
+        while not self.items:
+            if self.closed:
+                return None
+            self.ready.clear()
+            await self.ready.wait()
+        message, droppable, received_at = self.items.popleft()
+        if droppable:
+            self.frames -= 1
+        return message, received_at
+
+    def close(self):
+        """Stop accepting work; anything still waiting is discarded."""
+        self.closed = True
+        self.items.clear()
+        self.frames = 0
+        self.ready.set()
@@ -0,0 +1,444 @@
+import asyncio
+import itertools
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import cv2
+import numpy as np
+from adaptive_inference import AdaptivePose, crop_to_frame
+from analyzers import ANALYZERS
+from fidelity import HybridPose
+from frame_decoder import FrameDecoder
+from landmarks import LandmarkArray, as_array
+from metrics import ERRORS, INFERENCE_FRAMES, MODEL_FRAMES, STAGE_SECONDS
+from multi_person import MultiPersonPose, PersonTracker
+from pose_pool import PosePools
+
+
+def build_feedback(analyzer, landmarks, timestamp=None):
+    """Run the analyzer on one frame's landmarks and prepare the client payload.
+
+    `timestamp` is the frame's capture time in ms; analyzer timing uses it
+    rather than the time the frame happens to be processed.
+    """
+    # Analyzers compute the angles they need in one vectorized pass
+    with STAGE_SECONDS.time(stage="analyze"):
+        feedback = analyzer.analyze(landmarks, timestamp=timestamp)
+    response = {
+        "totalReps": analyzer.total_reps,
+        "correctReps": analyzer.correct_reps,
+        "incorrectReps": analyzer.incorrect_reps,
+        "feedback":  feedback.get("feedback", ""),
+        "error": feedback.get("error", "")
+    }
+    # Rep-counting analyzers also report where in the movement the person is
+    stage = getattr(analyzer, "stage", None)
+    if stage is not None:
+        response["stage"] = stage
+    if "tempo" in feedback:
+        response["tempo"] = feedback["tempo"]
+    return response
+
+
+# Process a single frame and generate feedback using the given analyzer
+def process_frame(frame, analyzer, pose, decoder=None, timestamp=None):
+    try:
+        if decoder is not None:
+            rgb_frame = decoder.to_rgb(frame)
+        else:
+            with STAGE_SECONDS.time(stage="convert"):
+                rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        with STAGE_SECONDS.time(stage="inference"):
+            results = pose.process(rgb_frame)
+
+        if results.pose_landmarks:
+            return build_feedback(analyzer, results.pose_landmarks.landmark, timestamp)
+        else:
+            return {"error": "No pose detected"}
+    except Exception as e:
+        print(f"Error processing frame: {e}")
+        ERRORS.inc(kind="frame")
+        return {"error": "Frame processing failed"}
+
+
+def handle_frame(frame_data, analyzer, pose, decoder, timestamp=None):
+    """Decode and process one frame; runs on an executor thread."""
+    try:
+        frame = decoder.decode(frame_data)
+    except Exception as e:
+        print(f"Error decoding frame: {e}")
+        ERRORS.inc(kind="frame")
+        return {"error": "Frame processing failed"}
+    return process_frame(frame, analyzer, pose, decoder, timestamp)
+
+
+def build_group_feedback(people, participant, timestamp=None):
+    """Client payload for a multi-person frame: one entry per tracked participant.
+
+    `people` comes from PersonTracker.people() and `participant(track_id)`
+    returns that participant's analyzer.
+    """
+    participants = []
+    for track_id, box, landmarks in people:
+        if landmarks is None:
+            entry = {"error": "No pose detected"}
+        else:
+            entry = build_feedback(participant(track_id), LandmarkArray(landmarks), timestamp)
+        entry["id"] = track_id
+        entry["box"] = box
+        participants.append(entry)
+    detected = any(not entry["error"] for entry in participants)
+    return {"participants": participants, "error": "" if detected else "No pose detected"}
+
+
+def handle_group_frame(frame_data, participant, people_pose, decoder, timestamp=None):
+    """Decode one frame and analyze everyone in it; runs on an executor thread.
+
+    Returns the payload and the IDs of the tracks that ended.
+    """
+    try:
+        rgb_frame = decoder.decode_rgb(frame_data)
+        with STAGE_SECONDS.time(stage="inference"):
+            people, pruned = people_pose.process(rgb_frame)
+        return build_group_feedback(people, participant, timestamp), pruned
+    except Exception as e:
+        print(f"Error processing frame: {e}")
+        ERRORS.inc(kind="frame")
+        return {"error": "Frame processing failed"}, []
+
+
+def session_pose(acquire, analyzer, adaptive=False, fidelity=False):
+    """A session's pose for `analyzer`, from `acquire(pose_options)`: run as a
+    HybridPose with `fidelity`, and through an AdaptivePose with `adaptive`."""
+    if fidelity:
+        pose = HybridPose(acquire, analyzer)
+    else:
+        pose = acquire(analyzer.POSE_OPTIONS)
+    if adaptive:
+        pose = AdaptivePose(pose, **analyzer.ADAPTIVE_OPTIONS)
+    return pose
+
+
+# Per-process state for process-based executors
+_worker_pools = None
+_worker_leases = {}
+# Stand-in analyzers whose stage follows the session's, for HybridPose decisions
+_worker_analyzers = {}
+_worker_people = {}
+_worker_decoders = {}
+_worker_decode_size = None
+
+
+def _init_worker(pool_size, decode_size):
+    global _worker_pools, _worker_decode_size
+    _worker_pools = PosePools(pool_size)
+    _worker_decode_size = decode_size
+
+
+def _detect_landmarks(session_id, workout_name, adaptive, fidelity, stage, frame_data):
+    """Decode a frame and run inference in a worker process.
+
+    `stage` is the session analyzer's current stage, for HybridPose
+    decisions. Returns a (33, 4) landmark array (or None), the stage
+    timings, the Pose model used (None without `fidelity`) and the
+    AdaptivePose inference mode (None without `adaptive`); the parent
+    records them since metrics live in its process.
+    """
+    key = (session_id, workout_name)
+    lease = _worker_leases.get(key)
+    analyzer = _worker_analyzers.get(key)
+    if lease is None:
+        analyzer = _worker_analyzers[key] = ANALYZERS[workout_name]()
+        lease = _worker_leases[key] = session_pose(_worker_pools.acquire, analyzer, adaptive, fidelity)
+    analyzer.stage = stage
+    hybrid = lease.pose if adaptive else lease
+    if fidelity:
+        # Stays None on frames AdaptivePose skips
+        hybrid.model = None
+    decoder = _worker_decoders.get(session_id)
+    if decoder is None:
+        decoder = _worker_decoders[session_id] = FrameDecoder(_worker_decode_size)
+    start = time.perf_counter()
+    frame = decoder.decode(frame_data)
+    decoded = time.perf_counter()
+    rgb_frame = decoder.to_rgb(frame)
+    converted = time.perf_counter()
+    results = lease.process(rgb_frame)
+    timings = {"decode": decoded - start, "convert": converted - decoded, "inference": time.perf_counter() - converted}
+    model = hybrid.model if fidelity else None
+    mode = lease.mode if adaptive else None
+    if not results.pose_landmarks:
+        return None, timings, model, mode
+    return as_array(results.pose_landmarks.landmark), timings, model, mode
+
+
+def _detect_people(session_id, workout_name, pose_options, people_options, frame_data):
+    """Decode a frame and find, track and infer everyone in it in a worker process.
+
+    Returns PersonTracker.people(), the IDs of the tracks that ended, the
+    stage timings and the number of crops inference ran on, for the
+    parent's metrics.
+    """
+    key = (session_id, workout_name)
+    people_pose = _worker_people.get(key)
+    if people_pose is None:
+        people_pose = _worker_people[key] = MultiPersonPose(
+            lambda: _worker_pools.acquire(pose_options), **people_options)
+    decoder = _worker_decoders.get(session_id)
+    if decoder is None:
+        decoder = _worker_decoders[session_id] = FrameDecoder(_worker_decode_size)
+    start = time.perf_counter()
+    frame = decoder.decode(frame_data)
+    decoded = time.perf_counter()
+    rgb_frame = decoder.to_rgb(frame)
+    converted = time.perf_counter()
+    people, pruned = people_pose.process(rgb_frame)
+    timings = {"decode": decoded - start, "convert": converted - decoded, "inference": time.perf_counter() - converted}
+    return people, pruned, timings, people_pose.inferences
+
+
+def _warm_worker(pose_options, count):
+    _worker_pools.warm(pose_options, count)
+
+
+def _release_session(session_id):
+    _worker_decoders.pop(session_id, None)
+    for key in [key for key in _worker_leases if key[0] == session_id]:
+        _worker_leases.pop(key).release()
+        _worker_analyzers.pop(key, None)
+    for key in [key for key in _worker_people if key[0] == session_id]:
+        _worker_people.pop(key).release()
+
+
+class FrameSession:
+    """One client's view of a FrameExecutor.
+
+    Frames are awaited one at a time, so results come back in the order the
+    client sent them.
+    """
+
+    def __init__(self, executor, session_id):
+        self.executor = executor
+        self.id = session_id
+        self.leases = {}
+        # Multi-person trackers (MultiPersonPose, or PersonTracker with the batch executor) per workout type
+        self.people = {}
+        self.decoder = FrameDecoder(executor.decode_size)
+        # Set by the server: the client's resume token and whether its state was restored
+        self.token = None
+        self.resumed = False
+        # Set by the server when the client asks for multi-person mode in its hello
+        self.multi_person = False
+        # Process workers keep Pose tracking state, so a session sticks to one
+        self.shard = None
+        if executor.kind == "process":
+            self.shard = min(executor.shards, key=lambda shard: executor.shard_sessions[shard])
+            executor.shard_sessions[self.shard] += 1
+
+    async def process(self, frame_data, analyzer, workout_name, timestamp=None):
+        loop = asyncio.get_running_loop()
+        if self.executor.scheduler is not None:
+            try:
+                rgb_frame = await loop.run_in_executor(self.executor.pool, self.decoder.decode_rgb, frame_data)
+                landmarks = await self.executor.scheduler.submit(
+                    self.id, workout_name, analyzer.POSE_OPTIONS, rgb_frame)
+                if landmarks is None:
+                    return {"error": "No pose detected"}
+                return build_feedback(analyzer, LandmarkArray(landmarks), timestamp)
+            except Exception as e:
+                print(f"Error processing frame: {e}")
+                ERRORS.inc(kind="frame")
+                return {"error": "Frame processing failed"}
+
+        if self.shard is not None:
+            if isinstance(frame_data, memoryview):
+                frame_data = frame_data.tobytes()
+            try:
+                landmarks, timings, model, mode = await loop.run_in_executor(
+                    self.shard, _detect_landmarks, self.id, workout_name, self.executor.adaptive,
+                    self.executor.fidelity, getattr(analyzer, "stage", None), frame_data)
+                for stage, seconds in timings.items():
+                    STAGE_SECONDS.observe(seconds, stage=stage)
+                if model is not None:
+                    MODEL_FRAMES.inc(model=model)
+                if mode is not None:
+                    INFERENCE_FRAMES.inc(mode=mode)
+                if landmarks is None:
+                    return {"error": "No pose detected"}
+                return build_feedback(analyzer, LandmarkArray(landmarks), timestamp)
+            except Exception as e:
+                print(f"Error processing frame: {e}")
+                ERRORS.inc(kind="frame")
+                return {"error": "Frame processing failed"}
+
+        lease = self.leases.get(workout_name)
+        if lease is None:
+            # Building a Pose graph is slow, keep it off the event loop as well
+            lease = await loop.run_in_executor(
+                self.executor.pool, session_pose, self.executor.pose_pools.acquire, analyzer,
+                self.executor.adaptive, self.executor.fidelity)
+            self.leases[workout_name] = lease
+        return await loop.run_in_executor(
+            self.executor.pool, handle_frame, frame_data, analyzer, lease, self.decoder, timestamp)
+
+    async def process_group(self, frame_data, participant, analyzer_class, workout_name, timestamp=None, drop=None):
+        """Multi-person counterpart of process(): everyone in the frame is
+        tracked and analyzed by their own `participant(track_id)` analyzer.
+
+        `drop(track_id)`, if given, is called on the event loop for every
+        track that ends, so its participant's analyzer can be let go.
+        """
+        feedback, pruned = await self._process_group(frame_data, participant, analyzer_class, workout_name, timestamp)
+        if drop is not None:
+            for track_id in pruned:
+                drop(track_id)
+        return feedback
+
+    async def _process_group(self, frame_data, participant, analyzer_class, workout_name, timestamp):
+        loop = asyncio.get_running_loop()
+        pose_options = analyzer_class.POSE_OPTIONS
+        if self.executor.scheduler is not None:
+            try:
+                return await self._process_group_batched(frame_data, participant, pose_options, workout_name, timestamp)
+            except Exception as e:
+                print(f"Error processing frame: {e}")
+                ERRORS.inc(kind="frame")
+                return {"error": "Frame processing failed"}, []
+
+        if self.shard is not None:
+            if isinstance(frame_data, memoryview):
+                frame_data = frame_data.tobytes()
+            try:
+                people, pruned, timings, inferences = await loop.run_in_executor(
+                    self.shard, _detect_people, self.id, workout_name, pose_options,
+                    self.executor.people_options, frame_data)
+                for stage, seconds in timings.items():
+                    STAGE_SECONDS.observe(seconds, stage=stage)
+                INFERENCE_FRAMES.inc(inferences, mode="person")
+                return build_group_feedback(people, participant, timestamp), pruned
+            except Exception as e:
+                print(f"Error processing frame: {e}")
+                ERRORS.inc(kind="frame")
+                return {"error": "Frame processing failed"}, []
+
+        people_pose = self.people.get(workout_name)
+        if people_pose is None:
+            pose_pools = self.executor.pose_pools
+            # The HOG detector is cheap to build; Pose graphs are acquired per track on a worker thread
+            people_pose = self.people[workout_name] = MultiPersonPose(
+                lambda: pose_pools.acquire(pose_options), **self.executor.people_options)
+        return await loop.run_in_executor(
+            self.executor.pool, handle_group_frame, frame_data, participant, people_pose, self.decoder, timestamp)
+
+    async def _process_group_batched(self, frame_data, participant, pose_options, workout_name, timestamp):
+        # Detection and tracking run on the thread pool; every participant's
+        # crop goes to the BatchScheduler, batched with all other sessions' frames
+        loop = asyncio.get_running_loop()
+        scheduler = self.executor.scheduler
+        tracker = self.people.get(workout_name)
+        if tracker is None:
+            tracker = self.people[workout_name] = PersonTracker(**self.executor.people_options)
+        rgb_frame = await loop.run_in_executor(self.executor.pool, self.decoder.decode_rgb, frame_data)
+        tracks = await loop.run_in_executor(self.executor.pool, tracker.update, rgb_frame)
+        height, width = rgb_frame.shape[:2]
+        crops = [np.ascontiguousarray(rgb_frame[y0:y1, x0:x1]) for x0, y0, x1, y1 in (track.box for track in tracks)]
+        results = await asyncio.gather(*(
+            scheduler.submit(self.id, (workout_name, track.id), pose_options, crop)
+            for track, crop in zip(tracks, crops)))
+        for track, landmarks in zip(tracks, results):
+            if landmarks is not None:
+                landmarks = crop_to_frame(landmarks, track.box, width, height)
+            tracker.observe(track, landmarks, width, height)
+        pruned = [track.id for track in tracker.prune()]
+        for track_id in pruned:
+            scheduler.release(self.id, (workout_name, track_id))
+        return build_group_feedback(tracker.people(width, height), participant, timestamp), pruned
+
+    def close(self):
+        for lease in self.leases.values():
+            lease.release()
+        self.leases = {}
+        for people_pose in self.people.values():
+            if isinstance(people_pose, MultiPersonPose):
+                people_pose.release()
+        self.people = {}
+        if self.executor.scheduler is not None:
+            self.executor.scheduler.release(self.id)
+        if self.shard is not None:
+            self.shard.submit(_release_session, self.id)
+            self.executor.shard_sessions[self.shard] -= 1
+            self.shard = None
+
+
+class FrameExecutor:
+    """Runs frame decode and pose inference off the asyncio event loop.
+
+    `kind="thread"` shares one thread pool and one set of PosePools between
+    all sessions; OpenCV and MediaPipe release the GIL so this scales with
+    cores. `kind="process"` starts `workers` single-process shards, each
+    with its own PosePools, and pins every session to one shard.
+    `kind="batch"` decodes on the thread pool and hands inference to a
+    BatchScheduler shared by all sessions.
+
+    With `adaptive=True` the thread and process executors wrap each
+    session's Pose in an AdaptivePose (ROI crops and motion-gated skipping)
+    configured by the analyzer's ADAPTIVE_OPTIONS. With `fidelity=True`
+    they run each session on a HybridPose, which uses the lite model except
+    near the analyzer's decisions (see the analyzer's FIDELITY_OPTIONS). `decode_size` is the
+    long side FrameDecoder aims for when picking a reduced JPEG decode.
+    `people_options` override multi_person.DEFAULT_OPTIONS for sessions in
+    multi-person mode.
+    """
+
+    def __init__(self, kind="thread", workers=None, pool_size=4, scheduler=None, adaptive=False, decode_size=640,
+                 people_options=None, fidelity=False):
+        if kind not in ("thread", "process", "batch"):
+            raise ValueError(f"Unknown executor kind: {kind}")
+        self.kind = kind
+        self.adaptive = adaptive
+        self.fidelity = fidelity
+        self.decode_size = decode_size
+        self.people_options = people_options or {}
+        self.workers = workers or os.cpu_count() or 1
+        self.session_ids = itertools.count()
+        self.pool = None
+        self.pose_pools = None
+        self.shards = []
+        self.shard_sessions = {}
+        self.scheduler = None
+        if kind == "thread":
+            self.pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="frame")
+            self.pose_pools = PosePools(pool_size)
+        elif kind == "batch":
+            if scheduler is None:
+                raise ValueError("Batch executor needs a BatchScheduler")
+            self.pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="frame")
+            self.scheduler = scheduler
+        else:
+            for _ in range(self.workers):
+                shard = ProcessPoolExecutor(max_workers=1, initializer=_init_worker, initargs=(pool_size, decode_size))
+                self.shards.append(shard)
+                self.shard_sessions[shard] = 0
+
+    def session(self):
+        return FrameSession(self, next(self.session_ids))
+
+    def warm(self, pose_options, count):
+        """Build and initialize `count` Pose graphs for `pose_options` ahead of
+        the first sessions that need them (in every shard). Blocks until done."""
+        if self.pose_pools is not None:
+            self.pose_pools.warm(pose_options, count)
+        if self.scheduler is not None:
+            self.scheduler.backend.warm(pose_options, count)
+        for future in [shard.submit(_warm_worker, pose_options, count) for shard in self.shards]:
+            future.result()
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+        if self.pose_pools is not None:
+            self.pose_pools.close()
+        if self.scheduler is not None:
+            self.scheduler.shutdown()
+        for shard in self.shards:
+            shard.shutdown()
@@ -0,0 +1,340 @@
+"""WebSocket gateway in front of a set of inference worker processes.
+
+The gateway holds no analysis state: it accepts client connections, gives
+each a session ID and forwards its messages untouched over a Unix socket to
+one inference worker (inference_worker.py), which owns the analyzers and
+Pose graphs. Sessions stick to a worker, picked by rendezvous hashing of the
+session ID over the workers accepting new sessions. The ID is derived from
+the client's session token, so a client resuming with `?session=<token>`
+returns to the worker that holds its saved state.
+
+Workers are started and supervised by the gateway. If one exits, its
+sessions move to the remaining workers (their rep counts restart) and it is
+started again. SIGHUP performs a rolling restart: each worker in turn stops
+taking new sessions, drains for up to GATEWAY_DRAIN_TIMEOUT seconds,
+hands any remaining sessions over and is restarted. A handed-over session is
+ended on the old worker first, so with a shared SESSION_DB the new worker
+resumes it from the state the old one saved.
+
+    python gateway.py
+"""
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import signal
+import sys
+import tempfile
+import zlib
+import websockets
+from ipc import KIND_BINARY, KIND_CLOSE, KIND_OPEN, KIND_TEXT, frame_message, read_frame, write_frame, write_message
+from metrics import ACTIVE_SESSIONS, ERRORS, log_metrics, serve_metrics
+from session_store import new_token, token_from_path
+
+# Inference worker processes; each runs its own FRAME_EXECUTOR with FRAME_WORKERS
+GATEWAY_WORKERS = int(os.environ.get("GATEWAY_WORKERS", 2))
+# Directory for the worker Unix sockets (a temporary directory by default)
+GATEWAY_SOCKET_DIR = os.environ.get("GATEWAY_SOCKET_DIR")
+# Seconds a draining worker gets for its sessions to end before they are moved
+GATEWAY_DRAIN_TIMEOUT = float(os.environ.get("GATEWAY_DRAIN_TIMEOUT", 30))
+# Seconds to wait for a worker to start listening
+WORKER_START_TIMEOUT = float(os.environ.get("WORKER_START_TIMEOUT", 60))
+# Seconds a worker gets to save a session's state before the session is moved anyway
+WORKER_CLOSE_TIMEOUT = float(os.environ.get("WORKER_CLOSE_TIMEOUT", 5))
+# Gateway metrics on METRICS_PORT (0, the default, disables them); worker i
+# serves its own on METRICS_PORT + 1 + i
+METRICS_HOST = os.environ.get("METRICS_HOST", "localhost")
+METRICS_PORT = int(os.environ.get("METRICS_PORT", 0))
+METRICS_LOG_INTERVAL = float(os.environ.get("METRICS_LOG_INTERVAL", 0))
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "inference_worker.py")
+
+
+class ClientSession:
+    """One connected client and the worker currently serving it."""
+
+    def __init__(self, websocket, token):
+        self.websocket = websocket
+        self.token = token
+        self.id = int.from_bytes(hashlib.blake2b(token.encode(), digest_size=8).digest(), "little")
+        self.worker = None
+        # Replies are sent by a per-session task so one slow client never
+        # holds up replies to the others on the same worker
+        self.replies = asyncio.Queue()
+        self.sender = asyncio.create_task(self._send_replies())
+
+    async def _send_replies(self):
+        while True:
+            message = await self.replies.get()
+            if message is None:
+                return
+            try:
+                await self.websocket.send(message)
+            except websockets.ConnectionClosed:
+                return
+
+    def close(self):
+        self.replies.put_nowait(None)
+
+
+class Worker:
+    """A supervised inference worker process and its socket connection."""
+
+    def __init__(self, index, socket_path):
+        self.index = index
+        self.socket_path = socket_path
+        self.process = None
+        self.writer = None
+        # "starting", "live", "draining" or "down"; only live workers get new sessions
+        self.state = "down"
+        self.sessions = {}
+        # Session ID -> futures for close() calls the worker has not confirmed
+        self.closing = {}
+
+    def score(self, session_id):
+        return zlib.crc32(f"{session_id}:{self.index}".encode())
+
+    async def start(self):
+        self.state = "starting"
+        env = dict(os.environ)
+        env["METRICS_PORT"] = str(METRICS_PORT + 1 + self.index) if METRICS_PORT else "0"
+        # Workers get their own session so terminal signals (Ctrl-C, hangup)
+        # reach only the gateway, which stops or restarts them itself
+        self.process = await asyncio.create_subprocess_exec(
+            sys.executable, WORKER_SCRIPT, self.socket_path, env=env, start_new_session=True)
+        deadline = asyncio.get_running_loop().time() + WORKER_START_TIMEOUT
+        while True:
+            if self.process.returncode is not None:
+                raise RuntimeError(f"Worker {self.index} exited with code {self.process.returncode}")
+            try:
+                reader, self.writer = await asyncio.open_unix_connection(self.socket_path)
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                if asyncio.get_running_loop().time() > deadline:
+                    self.process.kill()
+                    raise RuntimeError(f"Worker {self.index} did not start listening")
+                await asyncio.sleep(0.1)
+        self.state = "live"
+        print(f"Worker {self.index} ready on {self.socket_path}")
+        return reader
+
+    def open(self, session):
+        self.sessions[session.id] = session
+        session.worker = self
+        self.send_frame(KIND_OPEN, session.id, session.token.encode())
+
+    def close(self, session):
+        """End a session on this worker. Returns a future that is done once
+        the worker has saved the session's state (at once if it is down)."""
+        closed = asyncio.get_running_loop().create_future()
+        if self.sessions.get(session.id) is session:
+            del self.sessions[session.id]
+            if self.send_frame(KIND_CLOSE, session.id):
+                self.closing.setdefault(session.id, []).append(closed)
+                return closed
+        closed.set_result(None)
+        return closed
+
+    def closed(self, session_id):
+        """The worker confirmed a close(): the session's state is saved."""
+        futures = self.closing.get(session_id)
+        if futures:
+            closed = futures.pop(0)
+            if not futures:
+                del self.closing[session_id]
+            if not closed.done():
+                closed.set_result(None)
+
+    def send_frame(self, kind, session_id, payload=b""):
+        if self.state == "down" or self.writer.is_closing():
+            return False
+        write_frame(self.writer, kind, session_id, payload)
+        return True
+
+    async def forward(self, session_id, message):
+        if self.state == "down" or self.writer.is_closing():
+            return
+        write_message(self.writer, session_id, message)
+        await self.writer.drain()
+
+    async def stop(self):
+        self.state = "down"
+        # Whatever the worker saved is all there will be
+        for futures in self.closing.values():
+            for closed in futures:
+                if not closed.done():
+                    closed.set_result(None)
+        self.closing.clear()
+        if self.writer is not None:
+            self.writer.close()
+        if self.process is not None and self.process.returncode is None:
+            self.process.terminate()
+            try:
+                await asyncio.wait_for(self.process.wait(), 10)
+            except asyncio.TimeoutError:
+                self.process.kill()
+
+
+class Gateway:
+    def __init__(self, num_workers, socket_dir):
+        self.workers = [Worker(i, os.path.join(socket_dir, f"worker-{i}.sock")) for i in range(num_workers)]
+        self.sessions = {}
+        self.restarting = set()
+        self.stopping = False
+
+    def pick_worker(self, session_id, exclude=None):
+        """Rendezvous hashing over live workers: a session keeps its worker
+        for as long as that worker is live."""
+        candidates = [worker for worker in self.workers if worker.state == "live" and worker is not exclude]
+        if not candidates:
+            return None
+        return max(candidates, key=lambda worker: worker.score(session_id))
+
+    async def start(self):
+        await asyncio.gather(*(self.run_worker(worker) for worker in self.workers))
+
+    async def run_worker(self, worker):
+        """Start a worker and keep its reply stream flowing; on exit it is restarted."""
+        reader = await worker.start()
+        asyncio.create_task(self._supervise(worker, reader))
+
+    async def _supervise(self, worker, reader):
+        while True:
+            frame = await read_frame(reader)
+            if frame is None:
+                break
+            kind, session_id, payload = frame
+            session = worker.sessions.get(session_id)
+            if kind == KIND_CLOSE:
+                worker.closed(session_id)
+            elif session is not None and kind in (KIND_TEXT, KIND_BINARY):
+                session.replies.put_nowait(frame_message(kind, payload))
+        if worker in self.restarting or self.stopping:
+            return
+        print(f"Worker {worker.index} exited; moving {len(worker.sessions)} sessions")
+        ERRORS.inc(kind="worker")
+        await worker.stop()
+        await self.migrate(worker)
+        while not self.stopping:
+            try:
+                await self.run_worker(worker)
+                return
+            except RuntimeError as e:
+                print(f"Error restarting worker: {e}")
+                await asyncio.sleep(1)
+
+    async def migrate(self, worker):
+        """Re-open a worker's remaining sessions on the other workers."""
+        await asyncio.gather(*(self._move(worker, session) for session in list(worker.sessions.values())))
+
+    async def _move(self, worker, session):
+        # The target restores the session from its saved state, so the old
+        # worker has to have ended it and saved that state first
+        try:
+            await asyncio.wait_for(worker.close(session), WORKER_CLOSE_TIMEOUT)
+        except asyncio.TimeoutError:
+            print(f"Worker {worker.index} did not save session {session.id:x} in time")
+        if self.sessions.get(session.id) is not session:
+            return  # The client disconnected or reconnected meanwhile
+        target = self.pick_worker(session.id, exclude=worker)
+        if target is None:
+            print(f"No worker available for session {session.id:x}")
+            asyncio.create_task(session.websocket.close(1013, "No inference worker available"))
+            return
+        target.open(session)
+        session.replies.put_nowait(json.dumps({"status": "Session moved to another worker"}))
+
+    async def drain(self, worker, timeout=GATEWAY_DRAIN_TIMEOUT):
+        """Stop routing new sessions to a worker, let it drain, then restart it."""
+        self.restarting.add(worker)
+        worker.state = "draining"
+        print(f"Draining worker {worker.index} ({len(worker.sessions)} sessions)")
+        deadline = asyncio.get_running_loop().time() + timeout
+        while worker.sessions and asyncio.get_running_loop().time() < deadline:
+            await asyncio.sleep(0.5)
+        # Hand remaining sessions over before the process goes away
+        await self.migrate(worker)
+        await worker.stop()
+        try:
+            await self.run_worker(worker)
+        finally:
+            self.restarting.discard(worker)
+
+    async def rolling_restart(self):
+        if self.restarting:
+            print("Restart already in progress")
+            return
+        for worker in self.workers:
+            if worker.state == "live":
+                await self.drain(worker)
+        print("Rolling restart complete")
+
+    async def handle_client(self, websocket):
+        session = ClientSession(websocket, token_from_path(websocket.request.path) or new_token())
+        previous = self.sessions.get(session.id)
+        worker = previous.worker if previous is not None else self.pick_worker(session.id)
+        if worker is None:
+            session.close()
+            await websocket.close(1013, "No inference worker available")
+            return
+        if previous is not None:
+            # The client reconnected before its old connection timed out; the
+            # worker hands the live state over when the new one opens
+            previous.worker.close(previous)
+            previous.close()
+            asyncio.create_task(previous.websocket.close())
+        ACTIVE_SESSIONS.inc()
+        self.sessions[session.id] = session
+        worker.open(session)
+        try:
+            async for message in websocket:
+                # session.worker changes when the session is moved
+                await session.worker.forward(session.id, message)
+        except Exception as e:
+            print(f"Connection error: {e}")
+            ERRORS.inc(kind="connection")
+        finally:
+            session.worker.close(session)
+            session.close()
+            if self.sessions.get(session.id) is session:
+                del self.sessions[session.id]
+            ACTIVE_SESSIONS.dec()
+
+    async def shutdown(self):
+        self.stopping = True
+        await asyncio.gather(*(worker.stop() for worker in self.workers))
+
+
+async def main():
+    socket_dir = GATEWAY_SOCKET_DIR or tempfile.mkdtemp(prefix="pose-gateway-")
+    os.makedirs(socket_dir, exist_ok=True)
+    gateway = Gateway(GATEWAY_WORKERS, socket_dir)
+    # Workers run in their own sessions, so nothing else stops them if the
+    # gateway fails from here on (a port in use, say)
+    try:
+        await gateway.start()
+        loop = asyncio.get_running_loop()
+        loop.add_signal_handler(signal.SIGHUP, lambda: asyncio.create_task(gateway.rolling_restart()))
+        # Stop the workers on SIGTERM too, not just on Ctrl-C
+        stop = loop.create_future()
+        loop.add_signal_handler(signal.SIGTERM, stop.cancel)
+        if METRICS_PORT:
+            await serve_metrics(METRICS_HOST, METRICS_PORT)
+            print(f"Metrics available on http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+        if METRICS_LOG_INTERVAL:
+            asyncio.create_task(log_metrics(METRICS_LOG_INTERVAL))
+        async with websockets.serve(gateway.handle_client, "localhost", 8765):
+            print(f"Gateway started on ws://localhost:8765 with {GATEWAY_WORKERS} workers")
+            try:
+                await stop  # Run until SIGTERM
+            except asyncio.CancelledError:
+                pass
+    finally:
+        await gateway.shutdown()
+        if not GATEWAY_SOCKET_DIR:
+            shutil.rmtree(socket_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,249 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+from landmarks import NUM_LANDMARKS, landmarks_to_array
+from metrics import BATCH_QUEUE_WAIT_SECONDS, BATCH_SIZE, STAGE_SECONDS
+from pose_pool import PosePools
+
+
+class InferenceRequest:
+    __slots__ = ("session_id", "workout_name", "pose_options", "rgb_frame", "future", "enqueued_at")
+
+    def __init__(self, session_id, workout_name, pose_options, rgb_frame, future):
+        self.session_id = session_id
+        self.workout_name = workout_name
+        self.pose_options = pose_options
+        self.rgb_frame = rgb_frame
+        self.future = future
+        self.enqueued_at = time.perf_counter()
+
+
+class SchedulerStats:
+    """Running batch-size and queue-wait figures for a BatchScheduler."""
+
+    def __init__(self):
+        self.batches = 0
+        self.frames = 0
+        self.max_batch_size = 0
+        self.queue_wait_total = 0.0
+        self.queue_wait_max = 0.0
+
+    def record(self, batch, started_at):
+        self.batches += 1
+        self.frames += len(batch)
+        self.max_batch_size = max(self.max_batch_size, len(batch))
+        BATCH_SIZE.observe(len(batch))
+        for request in batch:
+            wait = started_at - request.enqueued_at
+            BATCH_QUEUE_WAIT_SECONDS.observe(wait)
+            self.queue_wait_total += wait
+            self.queue_wait_max = max(self.queue_wait_max, wait)
+
+    def snapshot(self):
+        return {
+            "batches": self.batches,
+            "frames": self.frames,
+            "meanBatchSize": self.frames / self.batches if self.batches else 0.0,
+            "maxBatchSize": self.max_batch_size,
+            "meanQueueWaitMs": 1000 * self.queue_wait_total / self.frames if self.frames else 0.0,
+            "maxQueueWaitMs": 1000 * self.queue_wait_max,
+        }
+
+
+class BatchScheduler:
+    """Gathers frames from many sessions into micro-batches for one backend.
+
+    A batch is dispatched when it reaches `max_batch_size` or when its
+    oldest frame has waited `max_wait_ms`. Raising `max_wait_ms` trades
+    per-frame latency for larger batches and more throughput; 0 disables
+    waiting and only batches frames that are already queued.
+    """
+
+    def __init__(self, backend, max_batch_size=8, max_wait_ms=5.0, max_inflight=2):
+        self.backend = backend
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.inflight = asyncio.Semaphore(max_inflight)
+        self.executor = ThreadPoolExecutor(max_workers=max_inflight, thread_name_prefix="batch")
+        self.queue = asyncio.Queue()
+        self.stats = SchedulerStats()
+        self.task = None
+
+    async def submit(self, session_id, workout_name, pose_options, rgb_frame):
+        """Queue one RGB frame; resolves to a (33, 4) landmark array or None.
+
+        Backends keep per-(session_id, workout_name) state such as Pose
+        tracking; multi-person sessions pass (workout_name, track_id).
+        """
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put(InferenceRequest(session_id, workout_name, pose_options, rgb_frame, future))
+        return await future
+
+    async def _collect(self):
+        batch = [await self.queue.get()]
+        deadline = batch[0].enqueued_at + self.max_wait
+        while len(batch) < self.max_batch_size:
+            if not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+                continue
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            await self.inflight.acquire()
+            asyncio.create_task(self._dispatch(batch))
+
+    async def _dispatch(self, batch):
+        loop = asyncio.get_running_loop()
+        try:
+            self.stats.record(batch, time.perf_counter())
+            start = time.perf_counter()
+            results = await loop.run_in_executor(self.executor, self.backend.infer, batch)
+            STAGE_SECONDS.observe(time.perf_counter() - start, stage="inference")
+            for request, result in zip(batch, results):
+                if not request.future.done():
+                    request.future.set_result(result)
+        except Exception as e:
+            for request in batch:
+                if not request.future.done():
+                    request.future.set_exception(e)
+        finally:
+            self.inflight.release()
+
+    def release(self, session_id, workout_name=None):
+        """Free a session's backend state: all of it, or that of one `workout_name` key."""
+        self.backend.release(session_id, workout_name)
+
+    def shutdown(self):
+        if self.task is not None:
+            self.task.cancel()
+        self.executor.shutdown()
+        self.backend.close()
+
+
+class PosePoolBackend:
+    """Runs a batch across the shared MediaPipe Pose pools in parallel.
+
+    The legacy Pose graph takes one image per call, so a batch fans out to
+    each session's leased slot on a thread pool. Sessions keep their lease
+    between batches so tracking stays warm.
+    """
+
+    def __init__(self, pool_size=4, workers=4):
+        self.pose_pools = PosePools(pool_size)
+        # Filled on the pose threads and emptied by release() on the event loop
+        self.leases = {}
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pose")
+
+    def _infer_one(self, request):
+        key = (request.session_id, request.workout_name)
+        with self.lock:
+            lease = self.leases.get(key)
+            if lease is None:
+                lease = self.leases[key] = self.pose_pools.acquire(request.pose_options)
+        results = lease.process(request.rgb_frame)
+        if not results.pose_landmarks:
+            return None
+        return landmarks_to_array(results.pose_landmarks.landmark)
+
+    def infer(self, batch):
+        return list(self.executor.map(self._infer_one, batch))
+
+    def warm(self, pose_options, count):
+        self.pose_pools.warm(pose_options, count)
+
+    def release(self, session_id, workout_name=None):
+        with self.lock:
+            leases = [self.leases.pop(key) for key in list(self.leases)
+                      if key[0] == session_id and (workout_name is None or key[1] == workout_name)]
+        # Outside the lock: a lease waits for its slot's in-flight inference
+        for lease in leases:
+            lease.release()
+
+    def close(self):
+        self.executor.shutdown()
+        self.pose_pools.close()
+
+
+class OnnxPoseBackend:
+    """Batched CPU inference with an ONNX export of the BlazePose landmark model.
+
+    The model is run on the whole frame, letterboxed to its 256x256 input,
+    so it suits the single person filling the frame that our clients send.
+    The export must have a dynamic batch dimension (a fixed batch of 1 falls
+    back to one call per frame) and produce the 195 landmark values first
+    and the pose presence logit second. Requires `onnxruntime`.
+    """
+
+    INPUT_SIZE = 256
+
+    def __init__(self, model_path, threads=None):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.fixed_batch = model_input.shape[0] == 1
+
+    def _letterbox(self, image):
+        height, width = image.shape[:2]
+        scale = self.INPUT_SIZE / max(height, width)
+        resized = cv2.resize(image, (round(width * scale), round(height * scale)), interpolation=cv2.INTER_AREA)
+        canvas = np.zeros((self.INPUT_SIZE, self.INPUT_SIZE, 3), dtype=np.float32)
+        top = (self.INPUT_SIZE - resized.shape[0]) // 2
+        left = (self.INPUT_SIZE - resized.shape[1]) // 2
+        canvas[top:top + resized.shape[0], left:left + resized.shape[1]] = resized / 255.0
+        return canvas, (left, top, resized.shape[1], resized.shape[0])
+
+    def _run(self, tensor):
+        if not self.fixed_batch:
+            return self.session.run(None, {self.input_name: tensor})[:2]
+        outputs = [self.session.run(None, {self.input_name: tensor[i:i + 1]})[:2] for i in range(len(tensor))]
+        return [np.concatenate([output[k] for output in outputs]) for k in range(2)]
+
+    def infer(self, batch):
+        inputs, boxes = zip(*(self._letterbox(request.rgb_frame) for request in batch))
+        raw_landmarks, presence = self._run(np.stack(inputs))
+        raw_landmarks = raw_landmarks.reshape(len(batch), -1, 5)[:, :NUM_LANDMARKS]
+        presence = 1 / (1 + np.exp(-presence.reshape(len(batch))))
+
+        results = []
+        for request, points, score, (left, top, width, height) in zip(batch, raw_landmarks, presence, boxes):
+            if score < request.pose_options.get("min_detection_confidence", 0.5):
+                results.append(None)
+                continue
+            landmarks = np.empty((NUM_LANDMARKS, 4), dtype=np.float32)
+            # Undo the letterbox so coordinates are normalized to the original frame
+            landmarks[:, 0] = (points[:, 0] - left) / width
+            landmarks[:, 1] = (points[:, 1] - top) / height
+            landmarks[:, 2] = points[:, 2] / width
+            landmarks[:, 3] = 1 / (1 + np.exp(-points[:, 3]))
+            results.append(landmarks)
+        return results
+
+    def warm(self, pose_options, count):
+        # One throwaway run so the first real batch does not pay for allocation
+        self._run(np.zeros((1, self.INPUT_SIZE, self.INPUT_SIZE, 3), dtype=np.float32))
+
+    def release(self, session_id, workout_name=None):
+        pass
+
+    def close(self):
+        pass
@@ -0,0 +1,127 @@
+"""Inference worker process behind the gateway (see gateway.py).
+
+Serves the sessions the gateway routes to it over a Unix socket. Each
+session runs the same `main.server` handler as a direct WebSocket client,
+so analyzers, Pose leases, mailboxes and traces behave identically; only
+the transport differs.
+
+    python inference_worker.py /tmp/pose-gateway/worker-0.sock
+"""
+import asyncio
+import os
+import signal
+import sys
+import main
+from ipc import KIND_BINARY, KIND_CLOSE, KIND_OPEN, KIND_TEXT, frame_message, read_frame, write_frame, write_message
+from metrics import serve_metrics
+
+
+class GatewaySession:
+    """Stands in for a client WebSocket: messages arrive from the gateway
+    and replies go back tagged with the session ID."""
+
+    def __init__(self, writer, session_id, session_token):
+        self.writer = writer
+        self.session_id = session_id
+        self.session_token = session_token
+        self.queue = asyncio.Queue()
+
+    def feed(self, message):
+        self.queue.put_nowait(message)
+
+    def end(self):
+        self.queue.put_nowait(None)
+
+    async def close(self, code=1000, reason=""):
+        self.end()
+
+    async def send(self, message):
+        # Replies for a gateway that has gone away are dropped; the session
+        # ends once close() is processed
+        if self.writer.is_closing():
+            return
+        write_message(self.writer, self.session_id, message)
+        await self.writer.drain()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        message = await self.queue.get()
+        if message is None:
+            raise StopAsyncIteration
+        return message
+
+
+def _session_closed(writer, session_id):
+    """Tell the gateway a session has ended and its state is saved."""
+    if not writer.is_closing():
+        write_frame(writer, KIND_CLOSE, session_id)
+
+
+# Open gateway connections, closed on shutdown so their sessions end cleanly
+_connections = {}
+
+
+async def serve_gateway(reader, writer):
+    """Handle one gateway connection until it closes."""
+    _connections[asyncio.current_task()] = writer
+    sessions = {}
+    tasks = {}
+    try:
+        while True:
+            frame = await read_frame(reader)
+            if frame is None:
+                break
+            kind, session_id, payload = frame
+            if kind == KIND_OPEN:
+                if session_id not in sessions:
+                    sessions[session_id] = GatewaySession(writer, session_id, payload.decode())
+                    tasks[session_id] = asyncio.create_task(main.server(sessions[session_id]))
+            elif kind == KIND_CLOSE:
+                session = sessions.pop(session_id, None)
+                if session is not None:
+                    session.end()
+                    tasks.pop(session_id).add_done_callback(
+                        lambda task, session_id=session_id: _session_closed(writer, session_id))
+            elif kind in (KIND_TEXT, KIND_BINARY):
+                session = sessions.get(session_id)
+                if session is not None:
+                    session.feed(frame_message(kind, payload))
+    finally:
+        for session in sessions.values():
+            session.end()
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+        writer.close()
+        _connections.pop(asyncio.current_task(), None)
+
+
+async def run(socket_path):
+    main.start_executor()
+    if main.METRICS_PORT:
+        await serve_metrics(main.METRICS_HOST, main.METRICS_PORT)
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    stop = asyncio.get_running_loop().create_future()
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.cancel)
+    # The socket only appears once the executor is up, so the gateway can
+    # treat a successful connect as "ready"
+    gateway_server = await asyncio.start_unix_server(serve_gateway, socket_path)
+    print(f"Inference worker listening on {socket_path}")
+    asyncio.get_running_loop().run_in_executor(None, main.warm_pose_pools)
+    try:
+        await stop
+    except asyncio.CancelledError:
+        pass
+    finally:
+        gateway_server.close()
+        for writer in _connections.values():
+            writer.close()
+        await asyncio.gather(*_connections, return_exceptions=True)
+        main.frame_executor.shutdown()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+
+if __name__ == "__main__":
+    asyncio.run(run(sys.argv[1]))
@@ -0,0 +1,50 @@
+import asyncio
+import struct
+
+# Gateway <-> inference worker messages over a Unix stream socket. Each one is
+# a fixed little-endian header followed by the payload:
+#
+#   kind        uint8    KIND_* below
+#   session     uint64   gateway-assigned session ID
+#   length      uint32   payload size in bytes
+FRAME_HEADER = struct.Struct("<BQI")
+
+# A client connected (gateway -> worker); the payload is its session token
+KIND_OPEN = 1
+# A client message or a reply, forwarded untouched in either direction
+KIND_TEXT = 2
+KIND_BINARY = 3
+# A client disconnected (gateway -> worker); the payload is empty. The worker
+# sends it back once the session has ended and its state is saved
+KIND_CLOSE = 4
+
+
+async def read_frame(reader):
+    """Read one (kind, session_id, payload) frame, or None at end of stream."""
+    try:
+        header = await reader.readexactly(FRAME_HEADER.size)
+        kind, session_id, length = FRAME_HEADER.unpack(header)
+        payload = await reader.readexactly(length) if length else b""
+    except (asyncio.IncompleteReadError, ConnectionError):
+        return None
+    return kind, session_id, payload
+
+
+def write_frame(writer, kind, session_id, payload=b""):
+    """Queue one frame on a stream writer; call writer.drain() to flush."""
+    writer.write(FRAME_HEADER.pack(kind, session_id, len(payload)))
+    if payload:
+        writer.write(payload)
+
+
+def write_message(writer, session_id, message):
+    """Forward a WebSocket message (text or bytes) for one session."""
+    if isinstance(message, str):
+        write_frame(writer, KIND_TEXT, session_id, message.encode())
+    else:
+        write_frame(writer, KIND_BINARY, session_id, bytes(message))
+
+
+def frame_message(kind, payload):
+    """The WebSocket message carried by a KIND_TEXT or KIND_BINARY frame."""
+    return payload.decode() if kind == KIND_TEXT else payload
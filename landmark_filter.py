@@ -0,0 +1,233 @@
+import time
+import numpy as np
+from landmarks import NUM_LANDMARKS, LandmarkArray, as_array
+
+# Filter kind used by the server, batch.py and landmark_trace.py unless told
+# otherwise
+DEFAULT_FILTER = "one_euro"
+
+# Frames whose timestamp does not advance (clients that send none, or a
+# constant one) are taken to be this many ms after the previous frame
+FALLBACK_INTERVAL = 1000 / 30
+
+# Defaults per filter kind, for landmarks normalized to 0..1; analyzers
+# override them with FILTER_OPTIONS
+DEFAULT_OPTIONS = {
+    "one_euro": dict(
+        min_cutoff=1.0,       # Hz; lower smooths slow movement more
+        # Cutoff increase in Hz per unit/s of speed; higher lags less on fast
+        # moves. A wrist moves about 1 unit/s in a fast curl, so at 1.0 the
+        # lag kept fast reps from reaching the stage thresholds
+        beta=40.0,
+        d_cutoff=1.0,         # Hz; smoothing of the speed estimate itself
+        reset_after=1000.0,   # ms without frames after which the filter starts over
+    ),
+    "kalman": dict(
+        process_noise=1.0,        # Acceleration variance (units/s^2)^2; higher follows faster
+        measurement_noise=4e-4,   # Variance of one landmark coordinate; higher smooths more
+        reset_after=1000.0,
+    ),
+}
+
+
+def _interval(last_timestamp, timestamp, reset_after):
+    """Seconds since the previous frame, or None when the filter should start over."""
+    if last_timestamp is None or timestamp - last_timestamp > reset_after:
+        return None
+    if timestamp <= last_timestamp:
+        return FALLBACK_INTERVAL / 1000
+    return (timestamp - last_timestamp) / 1000
+
+
+class OneEuroFilter:
+    """One-Euro filter over the x, y, z columns of a (33, 4) landmark array.
+
+    Every landmark coordinate is filtered independently but in one
+    vectorized pass: a low-pass filter whose cutoff rises with the
+    coordinate's speed, so jitter at rest is smoothed away while fast
+    movement is followed with little lag. All state and the output array
+    are preallocated; the returned array is overwritten by the next call.
+    Visibility passes through unfiltered.
+    """
+
+    def __init__(self, min_cutoff, beta, d_cutoff, reset_after):
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.d_cutoff = d_cutoff
+        self.reset_after = reset_after
+        shape = (NUM_LANDMARKS, 3)
+        self.value = np.zeros(shape)
+        self.speed = np.zeros(shape)
+        self.scratch = np.zeros(shape)
+        self.alpha = np.zeros(shape)
+        self.output = np.zeros((NUM_LANDMARKS, 4), dtype=np.float32)
+        self.last_timestamp = None
+
+    def reset(self):
+        self.last_timestamp = None
+
+    def __call__(self, landmarks, timestamp):
+        """Filter one frame captured at `timestamp` ms."""
+        points = landmarks[:, :3]
+        dt = _interval(self.last_timestamp, timestamp, self.reset_after)
+        if dt is None:
+            self.value[:] = points
+            self.speed.fill(0.0)
+        else:
+            value, speed, scratch, alpha = self.value, self.speed, self.scratch, self.alpha
+            # Smoothed speed: speed += a_d * (raw speed - speed)
+            a_d = 1.0 / (1.0 + 1.0 / (2 * np.pi * self.d_cutoff * dt))
+            np.subtract(points, value, out=scratch)
+            scratch /= dt
+            scratch -= speed
+            scratch *= a_d
+            speed += scratch
+            # Cutoff and smoothing factor per coordinate
+            np.abs(speed, out=alpha)
+            alpha *= self.beta
+            alpha += self.min_cutoff
+            alpha *= 2 * np.pi * dt
+            # alpha = tau / (1 + tau), as 1 - 1 / (1 + tau)
+            alpha += 1.0
+            np.reciprocal(alpha, out=alpha)
+            np.subtract(1.0, alpha, out=alpha)
+            # value += alpha * (raw - value)
+            np.subtract(points, value, out=scratch)
+            scratch *= alpha
+            value += scratch
+        if dt is None or timestamp > self.last_timestamp:
+            self.last_timestamp = timestamp
+        self.output[:, :3] = self.value
+        self.output[:, 3] = landmarks[:, 3]
+        return self.output
+
+
+class KalmanFilter:
+    """Constant-velocity Kalman filter over the x, y, z columns of a (33, 4) array.
+
+    Each coordinate has its own position/velocity state and 2x2 covariance,
+    all updated together with array operations on preallocated state. Costs
+    a little more than OneEuroFilter per frame and carries the velocity
+    forward, so it lags less through steady movement. The returned array is
+    overwritten by the next call; visibility passes through unfiltered.
+    """
+
+    def __init__(self, process_noise, measurement_noise, reset_after):
+        self.process_noise = process_noise
+        self.measurement_noise = measurement_noise
+        self.reset_after = reset_after
+        shape = (NUM_LANDMARKS, 3)
+        self.position = np.zeros(shape)
+        self.velocity = np.zeros(shape)
+        # Covariance [[p00, p01], [p01, p11]] per coordinate
+        self.p00 = np.zeros(shape)
+        self.p01 = np.zeros(shape)
+        self.p11 = np.zeros(shape)
+        self.innovation = np.zeros(shape)
+        self.gain = np.zeros(shape)
+        self.velocity_gain = np.zeros(shape)
+        self.scratch = np.zeros(shape)
+        self.output = np.zeros((NUM_LANDMARKS, 4), dtype=np.float32)
+        self.last_timestamp = None
+
+    def reset(self):
+        self.last_timestamp = None
+
+    def __call__(self, landmarks, timestamp):
+        """Filter one frame captured at `timestamp` ms."""
+        points = landmarks[:, :3]
+        dt = _interval(self.last_timestamp, timestamp, self.reset_after)
+        if dt is None:
+            self.position[:] = points
+            self.velocity.fill(0.0)
+            self.p00.fill(self.measurement_noise)
+            self.p01.fill(0.0)
+            # Unknown velocity: a large initial variance lets the first
+            # frames set it
+            self.p11.fill(1.0)
+        else:
+            q = self.process_noise
+            p00, p01, p11 = self.p00, self.p01, self.p11
+            gain, velocity_gain, scratch = self.gain, self.velocity_gain, self.scratch
+            # Predict with white-noise acceleration
+            np.multiply(self.velocity, dt, out=scratch)
+            self.position += scratch
+            np.multiply(p11, dt, out=scratch)
+            scratch += p01
+            np.add(p01, scratch, out=gain)
+            gain *= dt
+            p00 += gain
+            p00 += q * dt ** 4 / 4
+            np.add(scratch, q * dt ** 3 / 2, out=p01)
+            p11 += q * dt ** 2
+            # Update with the measured position: gains are P[:, 0] / (p00 + r)
+            np.add(p00, self.measurement_noise, out=scratch)
+            np.reciprocal(scratch, out=scratch)
+            np.multiply(p00, scratch, out=gain)
+            np.multiply(p01, scratch, out=velocity_gain)
+            np.subtract(points, self.position, out=self.innovation)
+            np.multiply(velocity_gain, self.innovation, out=scratch)
+            self.velocity += scratch
+            np.multiply(velocity_gain, p01, out=scratch)
+            p11 -= scratch
+            self.innovation *= gain
+            self.position += self.innovation
+            np.subtract(1.0, gain, out=gain)
+            p01 *= gain
+            p00 *= gain
+        if dt is None or timestamp > self.last_timestamp:
+            self.last_timestamp = timestamp
+        self.output[:, :3] = self.position
+        self.output[:, 3] = landmarks[:, 3]
+        return self.output
+
+
+FILTERS = {"one_euro": OneEuroFilter, "kalman": KalmanFilter}
+
+
+def make_filter(kind, **options):
+    """A landmark filter of `kind` ("one_euro" or "kalman"), or None for "none" or ""."""
+    if not kind or kind == "none":
+        return None
+    return FILTERS[kind](**dict(DEFAULT_OPTIONS[kind], **options))
+
+
+def smoothed(analyzer, kind):
+    """`analyzer` wrapped in a FilteredAnalyzer of `kind`, or as is for "none"."""
+    if not kind or kind == "none":
+        return analyzer
+    return FilteredAnalyzer(analyzer, kind)
+
+
+class FilteredAnalyzer:
+    """Wraps an analyzer and smooths every frame's landmarks before it sees them.
+
+    `kind` is a make_filter() kind; the analyzer's FILTER_OPTIONS (per
+    kind) override the filter defaults.
+    """
+
+    def __init__(self, analyzer, kind):
+        self.analyzer = analyzer
+        options = getattr(analyzer, "FILTER_OPTIONS", {}).get(kind, {})
+        self.filter = make_filter(kind, **options)
+        if hasattr(analyzer, "analyze_batch"):
+            self.analyze_batch = self._analyze_batch
+
+    def analyze(self, landmarks, timestamp=None):
+        if timestamp is None:
+            timestamp = time.perf_counter() * 1000
+        smoothed = self.filter(as_array(landmarks), timestamp)
+        return self.analyzer.analyze(LandmarkArray(smoothed), timestamp)
+
+    def _analyze_batch(self, points, timestamps):
+        smoothed = np.empty_like(points)
+        for index, timestamp in enumerate(timestamps):
+            smoothed[index] = self.filter(points[index], timestamp)
+        return self.analyzer.analyze_batch(smoothed, timestamps)
+
+    def reset(self):
+        self.analyzer.reset()
+        self.filter.reset()
+
+    def __getattr__(self, name):
+        return getattr(self.analyzer, name)
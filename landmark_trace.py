@@ -0,0 +1,170 @@
+"""Record landmark traces and replay them through analyzers without MediaPipe.
+
+A trace is a directory holding:
+    landmarks.f32   float32 (frames, 33, 4) x/y/z/visibility, C order
+    timestamps.f64  float64 (frames,) milliseconds
+    meta.json       frame count plus free-form metadata (workoutType, source, ...)
+
+The raw files are appended to while recording and memory-mapped when read,
+so neither side ever holds a whole session in memory.
+
+Replay:
+    python landmark_trace.py traces/session.trace [--exercise bicep_curl] [--repeat 10] [--batch]
+        [--filter one_euro|kalman|none]
+"""
+import argparse
+import json
+import os
+import time
+import numpy as np
+from landmark_filter import DEFAULT_FILTER, FILTERS, smoothed
+from landmarks import NUM_LANDMARKS, LANDMARK_FIELDS, LandmarkArray, as_array
+
+LANDMARKS_FILE = "landmarks.f32"
+TIMESTAMPS_FILE = "timestamps.f64"
+META_FILE = "meta.json"
+# Frames read from the trace at a time (one analyze_batch call with --batch)
+REPLAY_CHUNK = 4096
+
+
+class TraceWriter:
+    """Appends one (33, 4) landmark array and timestamp per frame to a trace.
+
+    Nothing is created on disk until the first frame arrives.
+    """
+
+    def __init__(self, path, **metadata):
+        self.path = path
+        self.metadata = metadata
+        self.frames = 0
+        self.landmarks_file = None
+        self.timestamps_file = None
+
+    def append(self, landmarks, timestamp):
+        if self.landmarks_file is None:
+            os.makedirs(self.path, exist_ok=True)
+            self.landmarks_file = open(os.path.join(self.path, LANDMARKS_FILE), "wb")
+            self.timestamps_file = open(os.path.join(self.path, TIMESTAMPS_FILE), "wb")
+        self.landmarks_file.write(np.ascontiguousarray(landmarks, dtype=np.float32).tobytes())
+        self.timestamps_file.write(np.float64(timestamp).tobytes())
+        self.frames += 1
+
+    def close(self):
+        if self.landmarks_file is None or self.landmarks_file.closed:
+            return
+        self.landmarks_file.close()
+        self.timestamps_file.close()
+        with open(os.path.join(self.path, META_FILE), "w") as f:
+            json.dump(dict(self.metadata, frames=self.frames), f)
+
+
+class LandmarkTrace:
+    """A recorded trace with memory-mapped landmarks and timestamps."""
+
+    def __init__(self, path):
+        with open(os.path.join(path, META_FILE)) as f:
+            self.metadata = json.load(f)
+        frames = self.metadata["frames"]
+        self.path = path
+        self.landmarks = self._map(LANDMARKS_FILE, np.float32, (frames, NUM_LANDMARKS, LANDMARK_FIELDS))
+        self.timestamps = self._map(TIMESTAMPS_FILE, np.float64, (frames,))
+
+    def _map(self, name, dtype, shape):
+        if shape[0] == 0:
+            return np.empty(shape, dtype=dtype)
+        return np.memmap(os.path.join(self.path, name), dtype=dtype, mode="r", shape=shape)
+
+    def __len__(self):
+        return len(self.timestamps)
+
+
+class RecordingAnalyzer:
+    """Wraps an analyzer and records every frame of landmarks it sees into a trace."""
+
+    def __init__(self, analyzer, writer):
+        self.analyzer = analyzer
+        self.writer = writer
+
+    def analyze(self, landmarks, timestamp=None):
+        if timestamp is None:
+            timestamp = time.perf_counter() * 1000
+        points = as_array(landmarks)
+        self.writer.append(points, timestamp)
+        # The wrapped analyzer gets the array, so the landmarks are read only once
+        return self.analyzer.analyze(LandmarkArray(points), timestamp)
+
+    def close(self):
+        self.writer.close()
+
+    def __getattr__(self, name):
+        return getattr(self.analyzer, name)
+
+
+def replay(trace, analyzer, batch=False):
+    """Push every frame of `trace` through `analyzer` as fast as possible.
+
+    Frames keep their recorded timestamps, so holds and tempo come out the
+    same as live however fast the replay runs. The returned
+    `analyzeSeconds` is the analyzers' whole cost, signals and angles
+    included. With `batch`, analyzers that have analyze_batch get whole
+    chunks instead of single frames.
+    """
+    feedback = []
+    tempo = []
+    elapsed = 0.0
+    batch = batch and hasattr(analyzer, "analyze_batch")
+    for offset in range(0, len(trace), REPLAY_CHUNK):
+        chunk = np.asarray(trace.landmarks[offset:offset + REPLAY_CHUNK])
+        timestamps = trace.timestamps[offset:offset + REPLAY_CHUNK].tolist()
+        if batch:
+            start = time.perf_counter()
+            results = [result for _, result in analyzer.analyze_batch(chunk, timestamps)]
+            elapsed += time.perf_counter() - start
+        else:
+            start = time.perf_counter()
+            results = [analyzer.analyze(LandmarkArray(points), timestamp) for points, timestamp in zip(chunk, timestamps)]
+            elapsed += time.perf_counter() - start
+        feedback.extend(result["feedback"] for result in results if result.get("feedback"))
+        tempo.extend(result["tempo"] for result in results if "tempo" in result)
+    return {
+        "frames": len(trace),
+        "totalReps": analyzer.total_reps,
+        "correctReps": analyzer.correct_reps,
+        "incorrectReps": analyzer.incorrect_reps,
+        "analyzeSeconds": elapsed,
+        "usPerFrame": 1e6 * elapsed / len(trace) if len(trace) else 0.0,
+        "feedback": feedback,
+        "tempo": tempo,
+    }
+
+
+def main(argv=None):
+    from analyzers import ANALYZERS
+
+    parser = argparse.ArgumentParser(description="Replay a landmark trace through an analyzer.")
+    parser.add_argument("trace", help="Trace directory")
+    parser.add_argument("--exercise", choices=sorted(ANALYZERS), help="Defaults to the trace's workoutType")
+    parser.add_argument("--repeat", type=int, default=1, help="Replay this many times and report the fastest")
+    parser.add_argument("--feedback", action="store_true", help="Include per-rep feedback and tempo in the output")
+    parser.add_argument("--batch", action="store_true", help="Evaluate whole chunks where the analyzer supports it")
+    parser.add_argument("--filter", default=DEFAULT_FILTER, choices=["none", *FILTERS],
+                        help="Smooth landmarks before analysis, as the server's LANDMARK_FILTER does")
+    args = parser.parse_args(argv)
+
+    trace = LandmarkTrace(args.trace)
+    exercise = args.exercise or trace.metadata.get("workoutType")
+    if exercise not in ANALYZERS:
+        parser.error("Trace has no known workoutType; pass --exercise")
+
+    def make_analyzer():
+        return smoothed(ANALYZERS[exercise](), args.filter)
+
+    runs = [replay(trace, make_analyzer(), args.batch) for _ in range(args.repeat)]
+    result = min(runs, key=lambda run: run["analyzeSeconds"])
+    if not args.feedback:
+        del result["feedback"], result["tempo"]
+    print(json.dumps(dict(result, exercise=exercise)))
+
+
+if __name__ == "__main__":
+    main()
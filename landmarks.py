@@ -0,0 +1,100 @@
+import numpy as np
+
+# MediaPipe Pose emits 33 landmarks of (x, y, z, visibility)
+NUM_LANDMARKS = 33
+LANDMARK_FIELDS = 4
+
+# Indices of the landmarks used by the analyzers (same as mp_pose.PoseLandmark)
+LEFT_SHOULDER = 11
+RIGHT_SHOULDER = 12
+LEFT_ELBOW = 13
+RIGHT_ELBOW = 14
+LEFT_WRIST = 15
+RIGHT_WRIST = 16
+LEFT_HIP = 23
+RIGHT_HIP = 24
+LEFT_KNEE = 25
+RIGHT_KNEE = 26
+LEFT_ANKLE = 27
+RIGHT_ANKLE = 28
+
+
+class LandmarkView:
+    """Attribute access (x, y, z, visibility) onto one row of a landmark array."""
+    __slots__ = ("row",)
+
+    def __init__(self, row):
+        self.row = row
+
+    @property
+    def x(self):
+        return float(self.row[0])
+
+    @property
+    def y(self):
+        return float(self.row[1])
+
+    @property
+    def z(self):
+        return float(self.row[2])
+
+    @property
+    def visibility(self):
+        return float(self.row[3])
+
+
+class LandmarkArray:
+    """A (33, 4) float32 array that analyzers can index like MediaPipe landmarks."""
+    __slots__ = ("array",)
+
+    def __init__(self, array):
+        self.array = array
+
+    def __len__(self):
+        return len(self.array)
+
+    def __getitem__(self, index):
+        return LandmarkView(self.array[index])
+
+    def __iter__(self):
+        return (LandmarkView(row) for row in self.array)
+
+
+def landmarks_to_array(landmarks, out=None):
+    """Copy MediaPipe landmarks into a (33, 4) float32 array."""
+    values = [(lm.x, lm.y, lm.z, lm.visibility) for lm in landmarks]
+    if out is None:
+        return np.array(values, dtype=np.float32)
+    out[:] = values
+    return out
+
+
+def as_array(landmarks, rows=None):
+    """Return the (33, 4) array behind `landmarks`, converting MediaPipe landmarks once.
+
+    Reading a MediaPipe landmark's fields is the costly part, so callers
+    that use only some landmarks can pass their indices as `rows`; the
+    other rows of a converted array are then left zero.
+    """
+    if isinstance(landmarks, LandmarkArray):
+        return landmarks.array
+    if isinstance(landmarks, np.ndarray):
+        return landmarks
+    if rows is None:
+        return landmarks_to_array(landmarks)
+    array = np.zeros((NUM_LANDMARKS, LANDMARK_FIELDS), dtype=np.float32)
+    for row in rows:
+        lm = landmarks[row]
+        array[row] = lm.x, lm.y, lm.z, lm.visibility
+    return array
+
+
+def parse_landmarks(values):
+    """Turn packed little-endian float32 bytes or nested lists into a (33, 4) array."""
+    if isinstance(values, (bytes, bytearray, memoryview)):
+        array = np.frombuffer(values, dtype="<f4")
+    else:
+        array = np.asarray(values, dtype=np.float32).ravel()
+    if array.size != NUM_LANDMARKS * LANDMARK_FIELDS:
+        raise ValueError(f"Expected {NUM_LANDMARKS * LANDMARK_FIELDS} landmark values, got {array.size}")
+    return array.reshape(NUM_LANDMARKS, LANDMARK_FIELDS)
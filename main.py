@@ -1,111 +1,308 @@
-import cv2
-import mediapipe as mp
-import numpy as np
 import websockets
 import asyncio
 import json
 import base64
-from bicep_curl import BicepCurlAnalyzer
-from lunge import LungeAnalyzer
-from plank import PlankAnalyzer
-from side_lateral_raise import SideLateralRaisesAnalyzer
-
-# Initialize MediaPipe Pose
-mp_pose = mp.solutions.pose
-
-# Utility function to calculate angles between three points (if needed)
-def calculate_angle(a, b, c):
-    a = np.array([a.x, a.y])
-    b = np.array([b.x, b.y])
-    c = np.array([c.x, c.y])
-
-    radians = np.arctan2(c[1] - b[1], c[0] - b[0]) - \
-              np.arctan2(a[1] - b[1], a[0] - b[0])
-    angle = np.abs(radians * 180.0 / np.pi)
-    return angle if angle <= 180 else 360 - angle
-
-# Process a single frame and generate feedback using BicepCurlAnalyzer
-def process_frame(frame, analyzer):
-    try:
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        results = analyzer.pose.process(rgb_frame)
-
-        feedback = {}
-        if results.pose_landmarks:
-            landmarks = results.pose_landmarks.landmark
-
-            # Analyze bicep curls
-            feedback = analyzer.analyze(landmarks)
-
-            # Prepare feedback data to send back to the client
-            feedback_data = {
-                "totalReps": analyzer.total_reps,
-                "correctReps": analyzer.correct_reps,
-                "incorrectReps": analyzer.incorrect_reps,
-                "feedback":  feedback.get("feedback", ""),
-                "error": feedback.get("error", "")
-            }
-
-            return feedback_data
+import itertools
+import os
+import time
+from frame_mailbox import FrameMailbox
+from frame_pipeline import FrameExecutor, build_feedback, process_frame
+from landmarks import LandmarkArray, parse_landmarks
+from inference_scheduler import BatchScheduler, OnnxPoseBackend, PosePoolBackend
+from metrics import ACTIVE_SESSIONS, ERRORS, FRAMES, log_metrics, serve_metrics
+from landmark_trace import RecordingAnalyzer, TraceWriter
+from landmark_filter import DEFAULT_FILTER, smoothed
+from fidelity import lite_pose_options
+from protocol import PROTOCOL_VERSION, parse_binary
+from responses import MESSAGE_FAILED, RESET_INVALID, RESET_OK, ResponseEncoder, ResponseOutbox
+from session_store import SessionStore, decode_state, encode_state, new_token, token_from_path
+from analyzers import ANALYZERS, SessionAnalyzers
+
+# Pose graphs are shared by all clients; each distinct set of Pose options
+# gets its own pool of at most this many graphs (per worker process).
+POSE_POOL_SIZE = int(os.environ.get("POSE_POOL_SIZE", 4))
+# Decode and inference run on a "thread", "process" or "batch" executor off the event loop
+FRAME_EXECUTOR = os.environ.get("FRAME_EXECUTOR", "thread")
+FRAME_WORKERS = int(os.environ.get("FRAME_WORKERS", os.cpu_count() or 1))
+frame_executor = None
+# Batch executor: frames from all clients are grouped for up to BATCH_WAIT_MS
+# or BATCH_MAX_SIZE frames; a longer wait gives bigger batches at higher latency
+BATCH_MAX_SIZE = int(os.environ.get("BATCH_MAX_SIZE", 8))
+BATCH_WAIT_MS = float(os.environ.get("BATCH_WAIT_MS", 5))
+# "pose_pool" (MediaPipe) or "onnx" (needs ONNX_MODEL_PATH and onnxruntime)
+INFERENCE_BACKEND = os.environ.get("INFERENCE_BACKEND", "pose_pool")
+ONNX_MODEL_PATH = os.environ.get("ONNX_MODEL_PATH")
+# When set, every session's landmarks are recorded as traces under this directory
+TRACE_DIR = os.environ.get("TRACE_DIR")
+# Landmarks are smoothed per session before analysis: "one_euro", "kalman" or "none"
+LANDMARK_FILTER = os.environ.get("LANDMARK_FILTER", DEFAULT_FILTER)
+# Large JPEG frames are decoded at 1/2, 1/4 or 1/8 scale down to this long side,
+# which is also advertised to clients in the hello handshake (0 decodes full size)
+DECODE_TARGET_SIZE = int(os.environ.get("DECODE_TARGET_SIZE", 640))
+# Crop inference to the tracked person and skip near-static frames (thread/process executors)
+ADAPTIVE_INFERENCE = os.environ.get("ADAPTIVE_INFERENCE", "0") == "1"
+# Run the lite Pose model and switch to each analyzer's own model only near its
+# stage and form thresholds or when landmarks it reads are barely visible
+# (thread/process executors); pose_model_frames_total counts frames per model
+HYBRID_FIDELITY = os.environ.get("HYBRID_FIDELITY", "0") == "1"
+# Prometheus-style metrics on http://METRICS_HOST:METRICS_PORT/metrics, off unless
+# METRICS_PORT is set (e.g. 9100),
+# plus a stage latency summary printed every METRICS_LOG_INTERVAL seconds (0 disables)
+METRICS_HOST = os.environ.get("METRICS_HOST", "localhost")
+METRICS_PORT = int(os.environ.get("METRICS_PORT", 0))
+METRICS_LOG_INTERVAL = float(os.environ.get("METRICS_LOG_INTERVAL", 0))
+# Pose graphs built and initialized at start-up, per model complexity, for every
+# analyzer's Pose options ("complexity:count,..."); "" leaves all graphs to first use.
+# With HYBRID_FIDELITY the lite graphs are warmed too by default
+POSE_WARM_POOL = {
+    int(complexity): int(count)
+    for complexity, count in (item.split(":") for item in os.environ.get(
+        "POSE_WARM_POOL", "0:1,1:1" if HYBRID_FIDELITY else "1:1").split(",") if item)
+}
+# Clients that send {"hello": true, "multiPerson": true} get every person in the
+# frame tracked and analyzed separately: at most MULTI_PERSON_MAX at once, with
+# person detection every MULTI_PERSON_DETECT_INTERVAL frames on a copy scaled to
+# MULTI_PERSON_DETECT_SIZE (long side; people under ~128 px there are missed).
+# Every participant holds a Pose graph for their track, so MULTI_PERSON_MAX is
+# capped at POSE_POOL_SIZE: past that, participants would share graphs and reset
+# each other's tracking every frame. The crops are batched into one inference
+# call only with FRAME_EXECUTOR=batch; the thread and process executors run
+# them one after another
+MULTI_PERSON_MAX = min(int(os.environ.get("MULTI_PERSON_MAX", POSE_POOL_SIZE)), POSE_POOL_SIZE)
+MULTI_PERSON_DETECT_INTERVAL = int(os.environ.get("MULTI_PERSON_DETECT_INTERVAL", 15))
+MULTI_PERSON_DETECT_SIZE = int(os.environ.get("MULTI_PERSON_DETECT_SIZE", 480))
+# "full" sends every frame's complete feedback; "delta" only what changed, plus a
+# heartbeat every RESPONSE_HEARTBEAT_INTERVAL seconds. Clients choose their own with
+# {"hello": true, "responses": "delta", "binaryResponses": true} (see protocol.py)
+RESPONSE_MODE = os.environ.get("RESPONSE_MODE", "full")
+RESPONSE_HEARTBEAT_INTERVAL = float(os.environ.get("RESPONSE_HEARTBEAT_INTERVAL", 1.0))
+# Newest frames kept per client while one is being processed; older ones are dropped
+MAILBOX_SIZE = int(os.environ.get("MAILBOX_SIZE", 1))
+# Analyzer state of disconnected clients is kept for SESSION_TTL seconds (at most
+# SESSION_STORE_SIZE sessions in memory) so they can resume with their token;
+# SESSION_DB also writes it to a SQLite file shared by all processes on the host
+SESSION_TTL = float(os.environ.get("SESSION_TTL", 300))
+SESSION_STORE_SIZE = int(os.environ.get("SESSION_STORE_SIZE", 1000))
+SESSION_DB = os.environ.get("SESSION_DB")
+session_store = SessionStore(SESSION_STORE_SIZE, SESSION_TTL, SESSION_DB)
+# Token -> (websocket, analyzers) for every connected client
+active_sessions = {}
+
+# Close the trace an analyzer records to, if any (None is ignored)
+def close_trace(analyzer):
+    if isinstance(analyzer, RecordingAnalyzer):
+        analyzer.close()
+
+
+# Apply one queued message from a client and queue the response
+async def handle_message(outbox, data, received_at, analyzers, session, mailbox):
+    # Handle handshake: tell the client what the server prefers to receive
+    if data.get("hello", False):
+        if "multiPerson" in data:
+            session.multi_person = bool(data["multiPerson"])
+        outbox.encoder.configure(data.get("responses"), data.get("binaryResponses"))
+        outbox.put(json.dumps({
+            "hello": True,
+            "protocolVersion": PROTOCOL_VERSION,
+            "preferredInputSize": session.decoder.preferred_input_size(),
+            "workoutTypes": list(ANALYZERS),
+            "sessionToken": session.token,
+            "resumed": session.resumed,
+            "multiPerson": session.multi_person,
+            "responses": outbox.encoder.mode,
+            "binaryResponses": outbox.encoder.binary,
+        }))
+        return
+
+    # Handle reset command
+    if data.get("reset", False):
+        workout_name = data.get("workoutType")
+        if workout_name in ANALYZERS:
+            analyzers[workout_name].reset()
+            for (name, _), participant in analyzers.participants.items():
+                if name == workout_name:
+                    participant.reset()
+            print(f"Analyzer for {workout_name} reset.")
+            outbox.put(RESET_OK)
         else:
-            return {"error": "No pose detected"}
-    except Exception as e:
-        print(f"Error processing frame: {e}")
-        return {"error": "Frame processing failed"}
+            outbox.put(RESET_INVALID)
+        return
+
+    workout_name = data["workoutType"]
+    # Analyzer timing follows the client's capture timestamps (ms); without
+    # them, the time the frame arrived, so queueing delay never counts
+    timestamp = data.get("timestamp")
+    if timestamp is None:
+        timestamp = received_at * 1000
+    if "landmarks" in data:
+        # Landmarks computed on the client skip decode and inference entirely
+        landmarks = parse_landmarks(data["landmarks"])
+        feedback = build_feedback(analyzers[workout_name], LandmarkArray(landmarks), timestamp)
+    else:
+        frame_data = data["frame"]
+        if isinstance(frame_data, str):
+            # Legacy JSON clients send the image base64 encoded
+            frame_data = base64.b64decode(frame_data)
+
+        # Decode and process the frame off the event loop
+        if session.multi_person:
+            feedback = await session.process_group(
+                frame_data, lambda track_id: analyzers.participant(workout_name, track_id),
+                ANALYZERS[workout_name], workout_name, timestamp,
+                lambda track_id: close_trace(analyzers.drop_participant(workout_name, track_id)))
+        else:
+            feedback = await session.process(frame_data, analyzers[workout_name], workout_name, timestamp)
+
+    # Report backpressure so clients can adapt their send rate
+    feedback["droppedFrames"] = mailbox.dropped
+    feedback["latencyMs"] = round((time.perf_counter() - received_at) * 1000, 1)
+    if "seq" in data:
+        feedback["seq"] = data["seq"]
+
+    error = feedback.get("error")
+    result = "ok" if not error else "no_pose" if error == "No pose detected" else "error"
+    FRAMES.inc(workout=workout_name, result=result)
+
+    # Sent in the background; a client that reads slowly gets merged responses
+    outbox.put_response(feedback)
+
+# Drain a client's mailbox one message at a time
+async def consume(outbox, mailbox, analyzers, session):
+    while True:
+        item = await mailbox.get()
+        if item is None:
+            return
+        data, received_at = item
+        try:
+            await handle_message(outbox, data, received_at, analyzers, session, mailbox)
+        except Exception as e:
+            print(f"Error handling message: {e}")
+            ERRORS.inc(kind="message")
+            outbox.put(MESSAGE_FAILED)
 
 # WebSocket server handler
 async def server(websocket):  # Added 'path' parameter
     print("Client connected")
+    ACTIVE_SESSIONS.inc()
+
+    # Clients resume with ws://host:8765/?session=<token>; the gateway passes it along
+    token = getattr(websocket, "session_token", None) or token_from_path(websocket.request.path) or new_token()
+    previous = active_sessions.get(token)
+    if previous is not None:
+        # The client reconnected before its old connection timed out; carry the
+        # live state over and close the old connection in the background
+        states = previous[1].get_state()
+        asyncio.create_task(previous[0].close())
+    else:
+        saved = session_store.take(token)
+        states = decode_state(saved) if saved is not None else None
+    if states is not None:
+        print("Session resumed")
 
-    # Create an instance of BicepCurlAnalyzer for this client
-    analyzers = {
-        'bicep_curl': BicepCurlAnalyzer(),
-        'lunge': LungeAnalyzer(),
-        'plank': PlankAnalyzer(),
-        'lateral_raises': SideLateralRaisesAnalyzer()
-    } 
+    # Frame processing session; Pose leases are taken on first use of a workout type
+    session = frame_executor.session()
+    session.token = token
+    session.resumed = states is not None
+    started = time.strftime("%Y%m%d-%H%M%S")
+
+    def wrap(name, analyzer):
+        analyzer = smoothed(analyzer, LANDMARK_FILTER)
+        if TRACE_DIR:
+            # Traces keep the raw landmarks, so replays can try other filters
+            path = os.path.join(TRACE_DIR, f"{started}-{session.id}-{name}.trace")
+            analyzer = RecordingAnalyzer(analyzer, TraceWriter(path, workoutType=name))
+        return analyzer
+    # Analyzers are created on the first message for their workout type
+    analyzers = SessionAnalyzers(states, wrap)
+    entry = active_sessions[token] = (websocket, analyzers)
+    # Frames that arrive while one is being processed wait here; stale ones are dropped
+    mailbox = FrameMailbox(MAILBOX_SIZE)
+    # Responses wait here until the client reads them
+    outbox = ResponseOutbox(websocket, ResponseEncoder(RESPONSE_MODE, False, RESPONSE_HEARTBEAT_INTERVAL))
+    consumer = asyncio.create_task(consume(outbox, mailbox, analyzers, session))
 
     try:
         async for message in websocket:
             try:
-                # Decode incoming frame
-                data = json.loads(message)
-
-                # Handle reset command
-                if data.get("reset", False):
-                    workout_name = data.get("workoutType")
-                    if workout_name in analyzers:
-                        analyzers[workout_name].reset()
-                        print(f"Analyzer for {workout_name} reset.")
-                        await websocket.send(json.dumps({"status": "Analyzer reset successful"}))
-                    else:
-                        await websocket.send(json.dumps({"error": "Invalid workout type for reset"}))
-                    continue
-
-                workout_name = data["workoutType"]
-                analyzer=analyzers[workout_name]
-                frame_data = base64.b64decode(data["frame"])
-                np_frame = np.frombuffer(frame_data, dtype=np.uint8)
-                frame = cv2.imdecode(np_frame, cv2.IMREAD_COLOR)
-
-                # Process the frame and generate feedback
-                feedback = process_frame(frame, analyzer)
-
-                # Send feedback to the client
-                await websocket.send(json.dumps(feedback))
+                # Binary messages carry raw image bytes, text messages are JSON
+                if isinstance(message, bytes):
+                    data = parse_binary(message)
+                else:
+                    data = json.loads(message)
+                # Only frames may be dropped; control messages always go through
+                mailbox.put(data, droppable="frame" in data or "landmarks" in data)
             except Exception as e:
                 print(f"Error handling message: {e}")
-                await websocket.send(json.dumps({"error": "Message handling failed"}))
+                ERRORS.inc(kind="message")
+                outbox.put(MESSAGE_FAILED)
     except Exception as e:
         print(f"Connection error: {e}")
+        ERRORS.inc(kind="connection")
     finally:
+        mailbox.close()
+        await asyncio.gather(consumer, return_exceptions=True)
+        await outbox.close()
+        session.close()
+        for analyzer in itertools.chain(analyzers.values(), analyzers.participants.values()):
+            close_trace(analyzer)
+        # Keep the counts so the client can pick up where it left off, unless
+        # a newer connection has already taken this session over
+        if active_sessions.get(token) is entry:
+            del active_sessions[token]
+            session_store.put(token, encode_state(analyzers.get_state()))
+        ACTIVE_SESSIONS.dec()
         print("Client disconnected")
 
+# Build the cross-session scheduler used by the batch executor
+def build_scheduler():
+    if INFERENCE_BACKEND == "onnx":
+        backend = OnnxPoseBackend(ONNX_MODEL_PATH)
+    else:
+        backend = PosePoolBackend(POSE_POOL_SIZE, FRAME_WORKERS)
+    return BatchScheduler(backend, BATCH_MAX_SIZE, BATCH_WAIT_MS)
+
+# Create the frame executor every session draws from
+def start_executor():
+    global frame_executor
+    scheduler = build_scheduler() if FRAME_EXECUTOR == "batch" else None
+    people_options = dict(max_people=MULTI_PERSON_MAX, detect_interval=MULTI_PERSON_DETECT_INTERVAL,
+                          detect_size=MULTI_PERSON_DETECT_SIZE)
+    frame_executor = FrameExecutor(
+        FRAME_EXECUTOR, FRAME_WORKERS, POSE_POOL_SIZE, scheduler, ADAPTIVE_INFERENCE, DECODE_TARGET_SIZE,
+        people_options, HYBRID_FIDELITY)
+    return frame_executor
+
+# Build the Pose graphs named by POSE_WARM_POOL; runs in the background after start-up
+def warm_pose_pools():
+    start = time.perf_counter()
+    warmed = []
+    option_sets = [analyzer_class.POSE_OPTIONS for analyzer_class in ANALYZERS.values()]
+    if HYBRID_FIDELITY:
+        # MediaPipe downloads the lite model on first use; warm the bundled ones first
+        option_sets += [lite_pose_options(analyzer_class) for analyzer_class in ANALYZERS.values()]
+    for options in option_sets:
+        count = POSE_WARM_POOL.get(options.get("model_complexity", 1), 0)
+        if count and options not in warmed:
+            frame_executor.warm(options, count)
+            warmed.append(options)
+    if warmed:
+        print(f"Warmed Pose pools for {len(warmed)} option sets in {time.perf_counter() - start:.2f}s")
+
 # Main function to start the WebSocket server
 async def main():
+    start_executor()
+    if METRICS_PORT:
+        await serve_metrics(METRICS_HOST, METRICS_PORT)
+        print(f"Metrics available on http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+    if METRICS_LOG_INTERVAL:
+        asyncio.create_task(log_metrics(METRICS_LOG_INTERVAL))
     print("WebSocket server started on ws://localhost:8765")
     async with websockets.serve(server, "localhost", 8765):  # 'server' matches the handler
-        await asyncio.Future()  # Run forever
+        asyncio.get_running_loop().run_in_executor(None, warm_pose_pools)
+        try:
+            await asyncio.Future()  # Run forever
+        finally:
+            frame_executor.shutdown()
 
 if __name__ == "__main__":
     asyncio.run(main())
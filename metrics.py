@@ -0,0 +1,257 @@
+"""In-process counters and histograms with a Prometheus text endpoint.
+
+Metrics are cheap enough to leave on in production: an observation is a
+bisect into a short bucket list plus a few additions under a lock. Set
+METRICS_ENABLED=0 to swap every metric for a no-op.
+"""
+import asyncio
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency buckets in seconds, from 0.25 ms to 5 s
+LATENCY_BUCKETS = (0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _label_key(label_names, labels):
+    return tuple(str(labels[name]) for name in label_names)
+
+
+def _format_labels(label_names, key, extra=()):
+    pairs = list(zip(label_names, key)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, label_names=()):
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(self.label_names, labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self.values.get(_label_key(self.label_names, labels), 0)
+
+    def samples(self):
+        with self.lock:
+            items = list(self.values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.label_names, key)} {value}"
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = _label_key(self.label_names, labels)
+        with self.lock:
+            self.values[key] = value
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, label_names=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+        self.buckets = tuple(buckets)
+        # Per label set: [bucket counts..., +Inf count], sum
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(self.label_names, labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def summary(self, **labels):
+        """Count, mean and approximate p50/p95/p99 (bucket upper bounds) for one label set."""
+        key = _label_key(self.label_names, labels)
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                return {"count": 0}
+            counts, total = list(entry[0]), entry[1]
+        count = sum(counts)
+        result = {"count": count, "mean": total / count}
+        for name, q in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99)):
+            running = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                running += bucket_count
+                if running >= q * count:
+                    result[name] = bound
+                    break
+        return result
+
+    def samples(self):
+        with self.lock:
+            items = [(key, list(entry[0]), entry[1]) for key, entry in self.values.items()]
+        for key, counts, total in items:
+            running = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                running += count
+                yield f"{self.name}_bucket{_format_labels(self.label_names, key, [('le', bound)])} {running}"
+            labels = _format_labels(self.label_names, key)
+            yield f"{self.name}_sum{labels} {total}"
+            yield f"{self.name}_count{labels} {running}"
+
+
+class NullMetric:
+    """Stands in for any metric when instrumentation is disabled."""
+
+    def inc(self, amount=1, **labels):
+        pass
+
+    def dec(self, amount=1, **labels):
+        pass
+
+    def set(self, value, **labels):
+        pass
+
+    def observe(self, value, **labels):
+        pass
+
+    @contextmanager
+    def time(self, **labels):
+        yield
+
+    def value(self, **labels):
+        return 0
+
+    def summary(self, **labels):
+        return {"count": 0}
+
+    def samples(self):
+        return iter(())
+
+
+class Registry:
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.metrics = []
+
+    def _register(self, metric):
+        if not self.enabled:
+            return NullMetric()
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, label_names=()):
+        return self._register(Counter(name, help, label_names))
+
+    def gauge(self, name, help, label_names=()):
+        return self._register(Gauge(name, help, label_names))
+
+    def histogram(self, name, help, label_names=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, help, label_names, buckets))
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry(enabled=os.environ.get("METRICS_ENABLED", "1") != "0")
+
+# Frame pipeline metrics shared by the server, executors and scheduler
+STAGE_SECONDS = registry.histogram(
+    "pose_stage_seconds", "Time spent in each frame processing stage", ("stage",))
+FRAMES = registry.counter(
+    "pose_frames_total", "Frames handled per workout type and outcome", ("workout", "result"))
+ERRORS = registry.counter(
+    "pose_errors_total", "Errors while handling client messages", ("kind",))
+DROPPED_FRAMES = registry.counter(
+    "pose_dropped_frames_total", "Frames dropped by per-client mailboxes")
+INFERENCE_FRAMES = registry.counter(
+    "pose_inference_frames_total", "Frames by inference mode (full, roi, skipped or person)", ("mode",))
+MODEL_FRAMES = registry.counter(
+    "pose_model_frames_total", "Hybrid-fidelity frames by Pose model (lite, full, or escalated to full)", ("model",))
+RESPONSES = registry.counter(
+    "pose_responses_total", "Feedback responses by kind (full, delta, heartbeat, suppressed or coalesced)", ("kind",))
+RESPONSE_BYTES = registry.counter(
+    "pose_response_bytes_total", "Size of feedback responses sent (characters for JSON text)")
+ACTIVE_SESSIONS = registry.gauge(
+    "pose_active_sessions", "Connected WebSocket clients")
+BATCH_SIZE = registry.histogram(
+    "pose_batch_size", "Frames per inference batch", buckets=(1, 2, 4, 8, 16, 32, 64))
+BATCH_QUEUE_WAIT_SECONDS = registry.histogram(
+    "pose_batch_queue_wait_seconds", "Time frames wait for an inference batch")
+
+# Stages reported by the periodic log dump
+LOGGED_STAGES = ("decode", "convert", "inference", "analyze", "send")
+
+
+async def _handle_http(reader, writer):
+    try:
+        request_line = await reader.readline()
+        # Drain the request headers
+        while (await reader.readline()).strip():
+            pass
+        path = request_line.split()[1].decode() if len(request_line.split()) > 1 else "/"
+        if path.split("?")[0] == "/metrics":
+            status, body = "200 OK", registry.render().encode()
+        else:
+            status, body = "404 Not Found", b"Not found\n"
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+        await writer.drain()
+    finally:
+        writer.close()
+
+
+async def serve_metrics(host="localhost", port=9100):
+    """Serve /metrics over plain HTTP on the running event loop."""
+    return await asyncio.start_server(_handle_http, host, port)
+
+
+async def log_metrics(interval):
+    """Print a one-line summary of stage latencies (and, with hybrid fidelity,
+    the share of frames per Pose model) every `interval` seconds."""
+    while True:
+        await asyncio.sleep(interval)
+        parts = []
+        for stage in LOGGED_STAGES:
+            summary = STAGE_SECONDS.summary(stage=stage)
+            if summary["count"]:
+                parts.append(f"{stage} n={summary['count']} mean={summary['mean'] * 1000:.2f}ms "
+                             f"p95<={summary['p95'] * 1000:g}ms")
+        models = {model: MODEL_FRAMES.value(model=model) for model in ("lite", "full", "escalated")}
+        total = sum(models.values())
+        if total:
+            parts.append("models " + " ".join(f"{model}={count / total:.0%}" for model, count in models.items()))
+        if parts:
+            print("Metrics: " + "; ".join(parts))
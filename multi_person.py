@@ -0,0 +1,214 @@
+import itertools
+import cv2
+import numpy as np
+from adaptive_inference import infer_in_box, landmark_box
+from metrics import INFERENCE_FRAMES
+
+# Defaults for multi-person sessions; the server sets some from MULTI_PERSON_* variables
+DEFAULT_OPTIONS = dict(
+    max_people=8,            # Participants tracked at once; further people are ignored
+    detect_interval=15,      # Frames between person detection passes
+    detect_size=480,         # Long side the frame is scaled to for detection
+    detect_scale=1.1,        # HOG pyramid step; smaller finds more sizes, costs more
+    iou_threshold=0.3,       # Overlap for a detection to continue a track
+    centroid_distance=0.5,   # Else, centre distance (in track box diagonals) that still matches
+    duplicate_iou=0.7,       # Tracks that overlap this much follow the same person
+    max_missed=5,            # Frames a track survives without a pose before it ends
+    roi_margin=0.25,         # Crop padding as a fraction of the landmark box size
+    min_visibility=0.5,      # Landmarks below this do not shape the crop
+)
+
+
+def box_iou(a, b):
+    """Intersection over union of every box in `a` (n, 4) with every box in `b` (m, 4)."""
+    x0 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y0 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x1 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y1 = np.minimum(a[:, None, 3], b[None, :, 3])
+    intersection = np.clip(x1 - x0, 0, None) * np.clip(y1 - y0, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return intersection / np.maximum(area_a[:, None] + area_b[None, :] - intersection, 1e-9)
+
+
+class PersonDetector:
+    """OpenCV's HOG people detector, run on a downscaled copy of the frame.
+
+    Returns pixel boxes (x0, y0, x1, y1) in full-frame coordinates. People
+    shorter than about 128 pixels at `detect_size` are not found.
+    """
+
+    def __init__(self, detect_size, detect_scale):
+        self.detect_size = detect_size
+        self.detect_scale = detect_scale
+        self.hog = cv2.HOGDescriptor()
+        self.hog.setSVMDetector(cv2.HOGDescriptor_getDefaultPeopleDetector())
+
+    def __call__(self, rgb_frame):
+        height, width = rgb_frame.shape[:2]
+        scale = min(1.0, self.detect_size / max(height, width))
+        image = rgb_frame
+        if scale < 1.0:
+            image = cv2.resize(rgb_frame, (round(width * scale), round(height * scale)), interpolation=cv2.INTER_AREA)
+        rects, weights = self.hog.detectMultiScale(image, winStride=(8, 8), padding=(8, 8), scale=self.detect_scale)
+        if len(rects) == 0:
+            return np.empty((0, 4))
+        keep = cv2.dnn.NMSBoxes([list(map(int, rect)) for rect in rects],
+                                np.asarray(weights, dtype=np.float32).ravel().tolist(), 0.0, 0.45)
+        rects = np.asarray(rects, dtype=np.float64)[np.asarray(keep).ravel()]
+        boxes = np.concatenate((rects[:, :2], rects[:, :2] + rects[:, 2:]), axis=1) / scale
+        # Most confident first, so they claim tracks before weaker detections
+        order = np.argsort(-np.asarray(weights).ravel()[np.asarray(keep).ravel()])
+        return boxes[order]
+
+
+class Track:
+    """One participant: their crop box, Pose lease and latest landmarks."""
+    __slots__ = ("id", "box", "missed", "lease", "landmarks")
+
+    def __init__(self, track_id, box):
+        self.id = track_id
+        self.box = box
+        self.missed = 0
+        self.lease = None
+        self.landmarks = None
+
+
+class PersonTracker:
+    """Keeps participant IDs stable across frames.
+
+    People are detected every `detect_interval` frames, so someone stepping
+    into view is picked up within that many frames. Detections continue the track they overlap most (IoU),
+    or failing that the nearest track by centre distance; the rest start
+    new tracks. Between detections each track's crop follows its own
+    landmarks, so the detector's cost is paid a few times a second rather
+    than per frame. A track ends after `max_missed` frames without a pose,
+    or when it converges on the same person as an older track.
+    """
+
+    def __init__(self, detector=None, **options):
+        self.options = dict(DEFAULT_OPTIONS, **options)
+        self.detector = detector or PersonDetector(self.options["detect_size"], self.options["detect_scale"])
+        self.tracks = []
+        self.ids = itertools.count(1)
+        self.frames = 0
+
+    def update(self, rgb_frame):
+        """Tracks to run pose inference for on this frame, each with its crop box."""
+        if self.frames % self.options["detect_interval"] == 0:
+            self._match(self.detector(rgb_frame), rgb_frame.shape[1], rgb_frame.shape[0])
+        self.frames += 1
+        return self.tracks
+
+    def _match(self, detections, width, height):
+        options = self.options
+        unmatched = list(range(len(detections)))
+        if self.tracks and len(detections):
+            boxes = np.array([track.box for track in self.tracks], dtype=np.float64)
+            overlap = box_iou(boxes, detections)
+            centres = (boxes[:, :2] + boxes[:, 2:]) / 2
+            diagonals = np.hypot(boxes[:, 2] - boxes[:, 0], boxes[:, 3] - boxes[:, 1])
+            distance = np.linalg.norm(
+                centres[:, None] - (detections[None, :, :2] + detections[None, :, 2:]) / 2, axis=2) / diagonals[:, None]
+            free = set(range(len(self.tracks)))
+            unmatched = []
+            for d in range(len(detections)):
+                candidates = [t for t in free if overlap[t, d] >= options["iou_threshold"]]
+                if candidates:
+                    t = max(candidates, key=lambda t: overlap[t, d])
+                else:
+                    candidates = [t for t in free if distance[t, d] <= options["centroid_distance"]]
+                    if not candidates:
+                        unmatched.append(d)
+                        continue
+                    t = min(candidates, key=lambda t: distance[t, d])
+                free.discard(t)
+                track = self.tracks[t]
+                # A track that still has a pose keeps its tighter landmark crop
+                if track.landmarks is None:
+                    track.box = self._pad(detections[d], width, height)
+        for d in unmatched:
+            if len(self.tracks) >= options["max_people"]:
+                break
+            self.tracks.append(Track(next(self.ids), self._pad(detections[d], width, height)))
+
+    def _pad(self, box, width, height):
+        # Detector boxes are tight around the body; pad them like landmark crops
+        margin = 0.5 * self.options["roi_margin"] * max(box[2] - box[0], box[3] - box[1])
+        return (int(max(0, box[0] - margin)), int(max(0, box[1] - margin)),
+                int(min(width, box[2] + margin)), int(min(height, box[3] + margin)))
+
+    def observe(self, track, landmarks, width, height):
+        """Record the pose found in `track`'s crop (None if there was none)."""
+        track.landmarks = landmarks
+        if landmarks is None:
+            track.missed += 1
+            return
+        track.missed = 0
+        box = landmark_box(landmarks, width, height, self.options["roi_margin"], self.options["min_visibility"])
+        if box is not None:
+            track.box = box
+
+    def prune(self):
+        """Drop lost and duplicate tracks; returns the ones removed."""
+        kept, removed = [], []
+        for track in self.tracks:
+            # Tracks are kept in creation order, so of two that follow the
+            # same person the older one survives
+            if track.missed > self.options["max_missed"] or (kept and box_iou(
+                    np.array([track.box], dtype=np.float64),
+                    np.array([other.box for other in kept], dtype=np.float64)).max() >= self.options["duplicate_iou"]):
+                removed.append(track)
+            else:
+                kept.append(track)
+        self.tracks = kept
+        return removed
+
+    def people(self, width, height):
+        """[(track_id, box, landmarks or None)] for the current tracks; boxes
+        are their crops normalized to the frame."""
+        return [(track.id, normalized_box(track.box, width, height), track.landmarks) for track in self.tracks]
+
+
+class MultiPersonPose:
+    """Person detection, tracking and per-participant landmark inference for one session.
+
+    Every track gets its own Pose (from `acquire()`), so each participant's
+    tracking state stays warm, and runs on that participant's crop.
+    `inferences` is the number of crops the last frame ran inference on.
+    """
+
+    def __init__(self, acquire, detector=None, **options):
+        self.acquire = acquire
+        self.tracker = PersonTracker(detector, **options)
+        self.inferences = 0
+
+    def process(self, rgb_frame):
+        """Find and track everyone in the frame; returns PersonTracker.people()
+        and the IDs of the tracks that ended on this frame.
+
+        Landmarks are (33, 4) arrays normalized to the full frame.
+        """
+        height, width = rgb_frame.shape[:2]
+        self.inferences = 0
+        for track in self.tracker.update(rgb_frame):
+            if track.lease is None:
+                track.lease = self.acquire()
+            self.tracker.observe(track, infer_in_box(track.lease, rgb_frame, track.box), width, height)
+            self.inferences += 1
+            INFERENCE_FRAMES.inc(mode="person")
+        pruned = self.tracker.prune()
+        for track in pruned:
+            track.lease.release()
+        return self.tracker.people(width, height), [track.id for track in pruned]
+
+    def release(self):
+        for track in self.tracker.tracks:
+            if track.lease is not None:
+                track.lease.release()
+        self.tracker.tracks = []
+
+
+def normalized_box(box, width, height):
+    x0, y0, x1, y1 = box
+    return [round(x0 / width, 4), round(y0 / height, 4), round(x1 / width, 4), round(y1 / height, 4)]
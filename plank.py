@@ -1,55 +1,63 @@
-import numpy as np
-import mediapipe as mp
+from angles import joint_angles
+from landmarks import LEFT_HIP, RIGHT_HIP, as_array
 import time
 
-mp_pose = mp.solutions.pose
 
 class PlankAnalyzer:
+    # Options for the shared Pose graph this analyzer's frames run through.
+    POSE_OPTIONS = dict(
+        static_image_mode=False,
+        model_complexity=1,
+        min_detection_confidence=0.7,
+        min_tracking_confidence=0.7
+    )
+    # AdaptivePose settings; a held plank needs only a few updates per second.
+    ADAPTIVE_OPTIONS = dict(max_skip=10, motion_threshold=3.0)
+    # HybridPose settings; a hold is only judged while both hips are over 0.9
+    # visible, so the full model runs as they approach that.
+    FIDELITY_OPTIONS = dict(margin=10.0, min_visibility=0.95)
+    # Fields saved when a client disconnects and restored when it resumes.
+    STATE_FIELDS = ("total_reps", "correct_reps", "incorrect_reps", "holding", "correct_duration")
+
     def __init__(self):
-        self.pose = mp_pose.Pose(
-            static_image_mode=False,
-            model_complexity=1,
-            min_detection_confidence=0.7,
-            min_tracking_confidence=0.7
-        )
+        self.reset()
+
+    def reset(self):
+        """Reset counts and the current hold to start a new session."""
         self.feedback = ''
-        self.total_reps = 0 
+        self.total_reps = 0
         self.correct_reps = 0
         self.incorrect_reps = 0
-        self.start_time = None
+        self.holding = False
+        # Seconds of the current (or last) correct hold, from frame timestamps
         self.correct_duration = 0
+        # Timestamp (ms) of the last correct frame; not saved, so the time a
+        # client spends disconnected is never counted
+        self.last_correct = None
 
-    def calculate_angle(self, a, b, c):
-        """Calculate the angle between three points."""
-        a = np.array([a.x, a.y])
-        b = np.array([b.x, b.y])
-        c = np.array([c.x, c.y])
-
-        radians = np.arctan2(c[1] - b[1], c[0] - b[0]) - \
-                  np.arctan2(a[1] - b[1], a[0] - b[0])
-        angle = np.abs(radians * 180.0 / np.pi)
-
-        if angle > 180.0:
-            angle = 360 - angle
+    def decision_margin(self, landmarks):
+        """Degrees between the average hip angle and the 160 a correct plank
+        needs, and the lower of the two hip visibilities."""
+        points = as_array(landmarks)
+        angles = joint_angles(points)
+        return abs((angles["left_hip"] + angles["right_hip"]) / 2 - 160), float(min(points[LEFT_HIP, 3], points[RIGHT_HIP, 3]))
 
-        return angle
-
-    def analyze(self, landmarks):
-        """Analyze the current frame for plank form."""
+    def analyze(self, landmarks, timestamp=None):
+        """Analyze the current frame, captured at `timestamp` ms (default: now), for plank form."""
         feedback = {}
 
         try:
-            # Get coordinates for shoulders, hips, and ankles
-            left_shoulder = landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value]
-            right_shoulder = landmarks[mp_pose.PoseLandmark.RIGHT_SHOULDER.value]
-            left_hip = landmarks[mp_pose.PoseLandmark.LEFT_HIP.value]
-            right_hip = landmarks[mp_pose.PoseLandmark.RIGHT_HIP.value]
-            left_ankle = landmarks[mp_pose.PoseLandmark.LEFT_ANKLE.value]
-            right_ankle = landmarks[mp_pose.PoseLandmark.RIGHT_ANKLE.value]
+            angles = joint_angles(landmarks)
+            if timestamp is None:
+                timestamp = time.perf_counter() * 1000
+
+            # Get hips for the visibility check
+            left_hip = landmarks[LEFT_HIP]
+            right_hip = landmarks[RIGHT_HIP]
 
-            # Calculate angles
-            left_shoulder_hip_ankle_angle = self.calculate_angle(left_shoulder, left_hip, left_ankle)
-            right_shoulder_hip_ankle_angle = self.calculate_angle(right_shoulder, right_hip, right_ankle)
+            # Shoulder-hip-ankle angles
+            left_shoulder_hip_ankle_angle = angles["left_hip"]
+            right_shoulder_hip_ankle_angle = angles["right_hip"]
 
             # Average angles for both sides
             avg_shoulder_hip_ankle_angle = (left_shoulder_hip_ankle_angle + right_shoulder_hip_ankle_angle) / 2
@@ -64,14 +72,22 @@ class PlankAnalyzer:
                 if 160 <= avg_shoulder_hip_ankle_angle <= 180:
                     feedback_data["text"] = "Good plank! Keep holding your body straight."
                     feedback_data["intent"] = 1
-                    if self.start_time is None:
-                        self.start_time = time.time()
-                    else:
-                        self.correct_duration = time.time() - self.start_time
+                    if not self.holding:
+                        self.holding = True
+                        self.correct_duration = 0
+                    elif self.last_correct is not None:
+                        # Time between correct frames counts, including frames
+                        # dropped or skipped in between; a clock running
+                        # backwards adds nothing
+                        self.correct_duration += max(timestamp - self.last_correct, 0) / 1000
+                    self.last_correct = timestamp
                 else:
                     feedback_data["text"] = "Incorrect plank. Ensure your body is in a straight line from shoulders to ankles."
                     feedback_data["intent"] = 0
-                    self.start_time = None
+                    if self.holding:
+                        # A hold is the plank's rep; report its length when it ends
+                        feedback["tempo"] = {"timeUnderTension": round(self.correct_duration, 3)}
+                    self.holding = False
 
                 feedback["feedback"] = feedback_data
                 feedback["correct_duration"] = self.correct_duration
@@ -80,4 +96,4 @@ class PlankAnalyzer:
 
         except Exception as e:
             feedback['error'] = f'Error in analyzing plank: {e}'
-            return feedback
\ No newline at end of file
+            return feedback
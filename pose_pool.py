@@ -0,0 +1,131 @@
+import threading
+import numpy as np
+
+# Blank frame run through new graphs so their start-up cost is paid up front
+WARMUP_FRAME = np.zeros((256, 256, 3), dtype=np.uint8)
+
+
+class PoseSlot:
+    def __init__(self, pose_options):
+        # Imported on first use; it dominates the server's start-up time
+        import mediapipe as mp
+
+        self.pose = mp.solutions.pose.Pose(**pose_options)
+        self.lock = threading.Lock()
+        self.leases = 0
+        self.owner = None  # Lease whose tracking state the graph currently holds
+
+    def warm(self):
+        """Initialize the graph (model load, first inference) before any session needs it."""
+        self.pose.process(WARMUP_FRAME)
+        self.pose.reset()
+
+
+class PoseLease:
+    """A session's handle on one slot of a PosePool."""
+
+    def __init__(self, pool, slot):
+        self.pool = pool
+        self.slot = slot
+
+    def process(self, rgb_frame):
+        """Run pose inference for this session on its leased slot."""
+        slot = self.slot
+        with slot.lock:
+            # Never let one person's tracking carry over into another's frames.
+            if slot.owner is not self:
+                if slot.owner is not None:
+                    slot.pose.reset()
+                slot.owner = self
+            return slot.pose.process(rgb_frame)
+
+    def reset(self):
+        """Drop this session's tracking state, so its next frame starts with detection."""
+        slot = self.slot
+        with slot.lock:
+            if slot.owner is self:
+                slot.pose.reset()
+                slot.owner = None
+
+    def release(self):
+        if self.slot is not None:
+            self.pool.release(self)
+            self.slot = None
+
+
+class PosePool:
+    """Fixed-size pool of MediaPipe Pose graphs shared by all sessions.
+
+    Slots are created lazily up to `size`. Each session leases the least
+    loaded slot and keeps it for its lifetime so tracking stays warm; when
+    there are more sessions than slots, a slot is shared and its tracking
+    state is reset whenever it switches between sessions.
+    """
+
+    def __init__(self, size=4, **pose_options):
+        self.size = size
+        self.pose_options = pose_options
+        self.slots = []
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            if len(self.slots) < self.size and all(slot.leases for slot in self.slots):
+                self.slots.append(PoseSlot(self.pose_options))
+            slot = min(self.slots, key=lambda s: s.leases)
+            slot.leases += 1
+            return PoseLease(self, slot)
+
+    def warm(self, count):
+        """Add warmed-up idle slots until the pool holds `count` (at most `size`).
+
+        Slots are built under the pool lock, so a session arriving meanwhile
+        waits for the warm slot rather than starting a cold graph of its own.
+        """
+        with self.lock:
+            while len(self.slots) < min(count, self.size):
+                slot = PoseSlot(self.pose_options)
+                slot.warm()
+                self.slots.append(slot)
+
+    def release(self, lease):
+        with self.lock:
+            lease.slot.leases -= 1
+            with lease.slot.lock:
+                if lease.slot.owner is lease:
+                    lease.slot.pose.reset()
+                    lease.slot.owner = None
+
+    def close(self):
+        with self.lock:
+            for slot in self.slots:
+                slot.pose.close()
+            self.slots = []
+
+
+class PosePools:
+    """One PosePool per distinct set of Pose options."""
+
+    def __init__(self, size=4):
+        self.size = size
+        self.pools = {}
+        self.lock = threading.Lock()
+
+    def pool(self, pose_options):
+        key = tuple(sorted(pose_options.items()))
+        with self.lock:
+            pool = self.pools.get(key)
+            if pool is None:
+                pool = self.pools[key] = PosePool(self.size, **pose_options)
+        return pool
+
+    def acquire(self, pose_options):
+        return self.pool(pose_options).acquire()
+
+    def warm(self, pose_options, count):
+        self.pool(pose_options).warm(count)
+
+    def close(self):
+        for pool in self.pools.values():
+            pool.close()
+        self.pools = {}
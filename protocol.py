@@ -0,0 +1,159 @@
+import json
+import struct
+import numpy as np
+from landmarks import parse_landmarks
+
+# Binary WebSocket messages start with a fixed little-endian header followed by
+# the payload:
+#
+#   version     uint8
+#   type        uint8    MSG_* below
+#   workout     uint8    index into WORKOUT_TYPES
+#   (padding)   1 byte
+#   sequence    uint32   client frame counter, echoed back as "seq"
+#   timestamp   float64  client capture time in milliseconds
+#
+# Text messages keep the original JSON format with a base64 "frame" field, or
+# a "landmarks" list of 33 [x, y, z, visibility] entries.
+HEADER = struct.Struct("<BBBxId")
+PROTOCOL_VERSION = 1
+
+# Payload is the raw JPEG/PNG bytes of one frame
+MSG_FRAME = 1
+# Payload is 33 x (x, y, z, visibility) float32 landmarks computed on the client
+MSG_LANDMARKS = 2
+
+WORKOUT_TYPES = ("bicep_curl", "lunge", "plank", "lateral_raises")
+
+
+def parse_binary(message):
+    """Parse a binary message into the same dict shape as a JSON message.
+
+    The "frame" entry is a memoryview into `message`, so the image bytes are
+    never copied before `np.frombuffer`.
+    """
+    if len(message) < HEADER.size:
+        raise ValueError("Binary message shorter than header")
+    version, msg_type, workout, sequence, timestamp = HEADER.unpack_from(message)
+    if version != PROTOCOL_VERSION:
+        raise ValueError(f"Unsupported protocol version: {version}")
+    if workout >= len(WORKOUT_TYPES):
+        raise ValueError(f"Unknown workout index: {workout}")
+    payload = memoryview(message)[HEADER.size:]
+    data = {
+        "workoutType": WORKOUT_TYPES[workout],
+        "seq": sequence,
+        "timestamp": timestamp,
+    }
+    if msg_type == MSG_FRAME:
+        data["frame"] = payload
+    elif msg_type == MSG_LANDMARKS:
+        data["landmarks"] = parse_landmarks(payload)
+    else:
+        raise ValueError(f"Unknown message type: {msg_type}")
+    return data
+
+
+def pack_frame(workout_name, sequence, timestamp, frame_bytes):
+    """Build a binary frame message (used by clients, tools and benchmarks)."""
+    header = HEADER.pack(PROTOCOL_VERSION, MSG_FRAME, WORKOUT_TYPES.index(workout_name), sequence, timestamp)
+    return header + bytes(frame_bytes)
+
+
+def pack_landmarks(workout_name, sequence, timestamp, landmarks):
+    """Build a binary landmark message from a (33, 4) array."""
+    header = HEADER.pack(PROTOCOL_VERSION, MSG_LANDMARKS, WORKOUT_TYPES.index(workout_name), sequence, timestamp)
+    return header + np.ascontiguousarray(landmarks, dtype="<f4").tobytes()
+
+
+# Clients that send {"hello": true, "binaryResponses": true} get feedback as
+# binary messages with their own little-endian header:
+#
+#   version        uint8
+#   type           uint8    RESP_* below
+#   flags          uint16   RESP_HAS_* below
+#   seq            uint32   echoed frame counter (RESP_HAS_SEQ)
+#   droppedFrames  uint32
+#   latencyMs      float32
+#   totalReps      uint16   \
+#   correctReps    uint16    > RESP_HAS_COUNTS
+#   incorrectReps  uint16   /
+#
+# followed, with RESP_HAS_EXTRA, by any other fields (feedback, error, stage,
+# tempo, participants, ...) as a UTF-8 JSON object. Header fields whose values
+# do not fit their type go there instead. Handshake and control
+# replies stay JSON text.
+RESPONSE_HEADER = struct.Struct("<BBHIIfHHH")
+
+RESP_FEEDBACK = 1
+RESP_HEARTBEAT = 2
+
+RESP_HAS_SEQ = 1
+RESP_HAS_COUNTS = 2
+RESP_HAS_EXTRA = 4
+
+COUNT_FIELDS = ("totalReps", "correctReps", "incorrectReps")
+_HEADER_FIELDS = {"heartbeat", "seq", "droppedFrames", "latencyMs", *COUNT_FIELDS}
+# Largest values the header's uint16, uint32 and float32 fields can hold
+_UINT16_MAX = 0xFFFF
+_UINT32_MAX = 0xFFFFFFFF
+_FLOAT32_MAX = 3.4028234663852886e38
+
+
+def _fits(value, limit):
+    return type(value) is int and 0 <= value <= limit
+
+
+def pack_response(message):
+    """Encode a feedback or heartbeat response dict as a binary message.
+
+    The three rep counts travel in the header when `message` has all of
+    them and they fit; anything else, including header fields whose values
+    do not fit their header type (a client's non-integer `seq`, counts past
+    65535), goes in the JSON tail, which parse_response applies last.
+    """
+    flags = 0
+    extra = {key: value for key, value in message.items() if key not in _HEADER_FIELDS}
+    seq = message.get("seq", 0)
+    if "seq" in message:
+        if _fits(seq, _UINT32_MAX):
+            flags |= RESP_HAS_SEQ
+        else:
+            extra["seq"], seq = seq, 0
+    dropped = message.get("droppedFrames", 0)
+    if not _fits(dropped, _UINT32_MAX):
+        extra["droppedFrames"], dropped = dropped, 0
+    latency = message.get("latencyMs", 0.0)
+    if type(latency) not in (int, float) or not abs(latency) <= _FLOAT32_MAX:
+        extra["latencyMs"], latency = latency, 0.0
+    counts = [message.get(field) for field in COUNT_FIELDS]
+    if all(_fits(count, _UINT16_MAX) for count in counts):
+        flags |= RESP_HAS_COUNTS
+    else:
+        extra.update((field, message[field]) for field in COUNT_FIELDS if field in message)
+        counts = (0, 0, 0)
+    if extra:
+        flags |= RESP_HAS_EXTRA
+    header = RESPONSE_HEADER.pack(
+        PROTOCOL_VERSION, RESP_HEARTBEAT if message.get("heartbeat") else RESP_FEEDBACK, flags,
+        seq, dropped, latency, *counts)
+    if not extra:
+        return header
+    return header + json.dumps(extra, separators=(",", ":")).encode()
+
+
+def parse_response(data):
+    """Decode a binary response back into the dict a JSON client would see."""
+    version, kind, flags, sequence, dropped, latency, *counts = RESPONSE_HEADER.unpack_from(data)
+    if version != PROTOCOL_VERSION:
+        raise ValueError(f"Unsupported protocol version: {version}")
+    message = {"heartbeat": True} if kind == RESP_HEARTBEAT else {}
+    if flags & RESP_HAS_SEQ:
+        message["seq"] = sequence
+    message["droppedFrames"] = dropped
+    message["latencyMs"] = round(latency, 1)
+    if flags & RESP_HAS_COUNTS:
+        message.update(zip(COUNT_FIELDS, counts))
+    if flags & RESP_HAS_EXTRA:
+        message.update(json.loads(bytes(data[RESPONSE_HEADER.size:])))
+    return message
@@ -0,0 +1,186 @@
+import asyncio
+import json
+import time
+from collections import deque
+from metrics import RESPONSE_BYTES, RESPONSES, STAGE_SECONDS
+from protocol import COUNT_FIELDS, pack_response
+
+# Fields describing the analyzer's state: delta responses carry them when they change
+STATE_FIELDS = (*COUNT_FIELDS, "stage", "error")
+# Fields reporting an event (a rep's feedback, a completed tempo cycle): sent whenever present
+EVENT_FIELDS = ("feedback", "tempo")
+# Transport fields carried by every response, including heartbeats
+META_FIELDS = ("seq", "droppedFrames", "latencyMs")
+
+# Control replies that never change, encoded once
+RESET_OK = json.dumps({"status": "Analyzer reset successful"})
+RESET_INVALID = json.dumps({"error": "Invalid workout type for reset"})
+MESSAGE_FAILED = json.dumps({"error": "Message handling failed"})
+# The most common feedback messages, filled in with the per-frame meta fields
+_HEARTBEAT = '{"heartbeat": true, "droppedFrames": %d, "latencyMs": %r}'
+_HEARTBEAT_SEQ = '{"heartbeat": true, "droppedFrames": %d, "latencyMs": %r, "seq": %d}'
+_NO_POSE = '{"error": "No pose detected", "droppedFrames": %d, "latencyMs": %r}'
+_NO_POSE_SEQ = '{"error": "No pose detected", "droppedFrames": %d, "latencyMs": %r, "seq": %d}'
+
+
+class ResponseEncoder:
+    """Turns each frame's feedback dict into the message a client asked for.
+
+    In "full" mode every response is sent as is (the original behaviour).
+    In "delta" mode a response only carries the state fields that changed
+    since the last one sent, plus any events; frames that change nothing
+    send nothing, except a heartbeat with the meta fields once every
+    `heartbeat_interval` seconds. Multi-person responses are diffed per
+    participant, and participants who left are listed in "left". With
+    `binary`, messages are packed with protocol.pack_response instead of
+    JSON.
+    """
+
+    def __init__(self, mode="full", binary=False, heartbeat_interval=1.0):
+        self.configure(mode, binary)
+        self.heartbeat_interval = heartbeat_interval
+        self.last_sent = 0.0
+        self.state = {}
+        self.participants = {}
+
+    def configure(self, mode=None, binary=None):
+        if mode is not None:
+            if mode not in ("full", "delta"):
+                raise ValueError(f"Unknown response mode: {mode}")
+            self.mode = mode
+        if binary is not None:
+            self.binary = binary
+        # The next response is sent in full, so a client switching modes starts from a known state
+        self.state = {}
+        self.participants = {}
+
+    def encode(self, response):
+        """The str or bytes message for `response`, or None if nothing needs sending."""
+        if self.mode == "delta":
+            message = self._delta(response)
+            if message is None:
+                if time.monotonic() - self.last_sent < self.heartbeat_interval:
+                    RESPONSES.inc(kind="suppressed")
+                    return None
+                message = {key: response[key] for key in META_FIELDS if key in response}
+                message["heartbeat"] = True
+        else:
+            message = response
+        self.last_sent = time.monotonic()
+        RESPONSES.inc(kind="heartbeat" if "heartbeat" in message else self.mode)
+        if self.binary:
+            return pack_response(message)
+        return _to_json(message)
+
+    def _delta(self, response):
+        message = _diff(self.state, response)
+        if "participants" in response:
+            changed = []
+            seen = set()
+            for entry in response["participants"]:
+                seen.add(entry["id"])
+                entry_changes = _diff(self.participants.setdefault(entry["id"], {}), entry)
+                if entry_changes:
+                    entry_changes["id"] = entry["id"]
+                    entry_changes["box"] = entry["box"]
+                    changed.append(entry_changes)
+            left = [participant for participant in self.participants if participant not in seen]
+            for participant in left:
+                del self.participants[participant]
+            if changed:
+                message["participants"] = changed
+            if left:
+                message["left"] = left
+        if not message:
+            return None
+        if self.binary and any(key in message for key in COUNT_FIELDS):
+            # The binary header carries all three counts or none
+            message.update((key, response[key]) for key in COUNT_FIELDS if key in response)
+        message.update((key, response[key]) for key in META_FIELDS if key in response)
+        return message
+
+
+def _diff(state, response):
+    """Changed state fields and present events of `response`; updates `state`."""
+    changes = {}
+    for key in STATE_FIELDS:
+        if key in response and state.get(key) != response[key]:
+            changes[key] = state[key] = response[key]
+    for key in EVENT_FIELDS:
+        if response.get(key):
+            changes[key] = response[key]
+    return changes
+
+
+def _to_json(message):
+    # Heartbeats and "No pose detected" make up most traffic when nothing
+    # happens; fill their templates instead of serializing a dict
+    keys = len(message) - ("seq" in message)
+    if keys == 3 and "droppedFrames" in message and "latencyMs" in message:
+        if message.get("heartbeat") is True:
+            template, seq_template = _HEARTBEAT, _HEARTBEAT_SEQ
+        elif message.get("error") == "No pose detected":
+            template, seq_template = _NO_POSE, _NO_POSE_SEQ
+        else:
+            return json.dumps(message)
+        if "seq" in message:
+            return seq_template % (message["droppedFrames"], message["latencyMs"], message["seq"])
+        return template % (message["droppedFrames"], message["latencyMs"])
+    return json.dumps(message)
+
+
+class ResponseOutbox:
+    """Per-client outbound queue, so a client that reads slowly never holds
+    up frame processing.
+
+    A background task sends queued messages in order. Feedback responses
+    are queued as dicts and encoded just before sending; while the client
+    has not caught up, a new one is merged into the feedback response still
+    waiting instead of queuing behind it (newer fields win, but an event
+    such as a rep's feedback survives an empty one). Control replies are
+    queued as ready-made messages and never merged or dropped.
+    """
+
+    def __init__(self, websocket, encoder):
+        self.websocket = websocket
+        self.encoder = encoder
+        self.items = deque()
+        self.coalesced = 0
+        self.ready = asyncio.Event()
+        self.task = asyncio.create_task(self._run())
+
+    def put(self, message):
+        """Queue a pre-encoded str/bytes control reply."""
+        self.items.append((message, False))
+        self.ready.set()
+
+    def put_response(self, response):
+        """Queue a feedback response dict, merging it into one still waiting."""
+        if self.items and self.items[-1][1]:
+            waiting = self.items[-1][0]
+            for key in EVENT_FIELDS:
+                if waiting.get(key) and not response.get(key):
+                    response[key] = waiting[key]
+            waiting.update(response)
+            self.coalesced += 1
+            RESPONSES.inc(kind="coalesced")
+        else:
+            self.items.append((response, True))
+        self.ready.set()
+
+    async def _run(self):
+        while True:
+            while not self.items:
+                self.ready.clear()
+                await self.ready.wait()
+            item, is_response = self.items.popleft()
+            with STAGE_SECONDS.time(stage="send"):
+                message = self.encoder.encode(item) if is_response else item
+                if message is None:
+                    continue
+                RESPONSE_BYTES.inc(len(message))
+                await self.websocket.send(message)
+
+    async def close(self):
+        self.task.cancel()
+        await asyncio.gather(self.task, return_exceptions=True)
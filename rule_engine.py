@@ -0,0 +1,448 @@
+"""Declarative rep-counting exercises.
+
+An exercise is a spec dict, compiled once by ExerciseRules into index arrays
+so every frame is evaluated with a handful of numpy operations, whether it
+is one (33, 4) landmark array or a (frames, 33, 4) batch:
+
+    angles       {name: (a, b, c)} joint triples, the angle measured at b
+    points       {name: landmark} landmarks whose coordinates become the
+                 signals "name.x", "name.y" and "name.z"
+    spans        {name: (coordinate, coordinate)} absolute difference of two
+                 point coordinates, e.g. ("left_knee.x", "left_ankle.x")
+    initial      stage before the first transition (default None)
+    transitions  [{"to", "when", "from", "rep", "clear", "side"}, ...]
+                 Each frame, the first transition whose `from` stage(s)
+                 match and whose `when` conditions all hold fires and moves
+                 to stage `to`. Separate enter and exit thresholds on the
+                 same signal give hysteresis. `rep` counts and scores a rep,
+                 `clear` restarts the tracked signals, `side` records which
+                 side the rep is on.
+    track        {name: (signal, ...)} signals whose running min/max are
+                 kept while a rep is under way
+    track_when   conditions a frame must meet to be tracked (default: all)
+    checks       [{"message", "require", "alone"}, ...] form checks scored
+                 when a rep fires; a check fails unless every `require`
+                 condition holds. `alone`, if given, replaces the message
+                 when this is the only check that failed
+    good, bad    feedback text for a correct rep, and the prefix put before
+                 the messages of the failed checks
+    sides        values a "{side}" in check names expands to (default
+                 left and right)
+    tempo        [(phase, from stage, to stage), ...] the movement phases of
+                 one rep cycle, e.g. concentric then eccentric
+
+Conditions are (signal, op, value) tuples, where op is one of < <= > >= and
+value is a number or another signal. In checks, (track, stat, op, value)
+compares the track's "min", "max" or "range" over the rep, component by
+component. Signal and track names in checks may contain "{side}", filled in
+with the side set by the last transition.
+
+A frame is near a decision when a transition out of the current stage
+fires on it, or when one of its angles is close to a threshold the rules
+compare it with: in a transition that would leave the current stage, in
+track_when, or in a check on the min/max of a track of angles.
+decision_margin() measures how close, so callers can spend more effort (a
+more accurate pose model) on those frames.
+
+Every frame carries a timestamp in milliseconds (client capture time or
+video PTS), and all timing comes from those, never from the clock at
+processing time. A phase lasts from the last frame at its `from` stage's
+position (whose transition condition held) to the first frame at its `to`
+stage, so pauses at either end are not counted. When a cycle's last phase
+ends, the result carries "tempo": the seconds of each phase and the time
+under tension, from leaving the start position to returning to it.
+"""
+import time
+import numpy as np
+from angles import angle_columns, gathered_angles
+from landmarks import LANDMARK_FIELDS, as_array
+from running_range import RunningRange
+
+AXES = {"x": 0, "y": 1, "z": 2}
+STATS = ("min", "max", "range")
+# Every condition is compiled to lhs - rhs < bound (operands swapped for > and
+# >=); the smallest positive double makes the test inclusive
+STRICT, INCLUSIVE = 0.0, np.nextafter(0.0, 1.0)
+OPERATORS = {"<": (False, STRICT), "<=": (False, INCLUSIVE), ">": (True, STRICT), ">=": (True, INCLUSIVE)}
+
+
+class Conditions:
+    """Condition groups evaluated together; a group holds when all of its conditions do.
+
+    `lookup` maps an operand to its column in the value arrays passed in:
+    a name, or a number that the caller stores as a constant column.
+    """
+
+    def __init__(self, groups, lookup):
+        lhs, rhs, bounds, starts = [], [], [], []
+        for group in groups:
+            if not group:
+                raise ValueError("A condition group needs at least one condition")
+            starts.append(len(lhs))
+            for left, op, right in group:
+                if op not in OPERATORS:
+                    raise ValueError(f"Unknown operator {op!r}")
+                swap, bound = OPERATORS[op]
+                left, right = (right, left) if swap else (left, right)
+                lhs.append(lookup(left))
+                rhs.append(lookup(right))
+                bounds.append(bound)
+        self.operands = np.array(lhs + rhs, dtype=np.intp)
+        self.count = len(lhs)
+        self.bounds = np.array(bounds)
+        self.starts = np.array(starts, dtype=np.intp)
+
+    def __call__(self, values):
+        """Which groups hold, for a (columns,) or (columns, frames) value array."""
+        operands = values.take(self.operands, axis=0)
+        bounds = self.bounds if values.ndim == 1 else self.bounds[:, None]
+        met = operands[:self.count] - operands[self.count:] < bounds
+        return np.logical_and.reduceat(met, self.starts, axis=0)
+
+
+class ExerciseRules:
+    """A spec compiled to vectorized signal and condition evaluation."""
+
+    def __init__(self, spec):
+        angles = spec.get("angles", {})
+        points = spec.get("points", {})
+        spans = spec.get("spans", {})
+        columns = {}
+        for name, landmark in points.items():
+            for axis, column in AXES.items():
+                columns[f"{name}.{axis}"] = landmark * LANDMARK_FIELDS + column
+        for name, pair in spans.items():
+            for operand in pair:
+                if operand not in columns:
+                    raise ValueError(f"Span {name!r} needs point coordinates, not {operand!r}")
+
+        # One gather pulls every landmark value a frame needs out of the
+        # flattened (..., 33 * 4) points: the angle_columns() that
+        # angles.gathered_angles() turns into the angles, then the point
+        # coordinates and the span operands
+        self.num_angles = len(angles)
+        self.gather = np.concatenate((
+            angle_columns(angles.values()),
+            [columns[name] for name in columns],
+            [columns[pair[0]] for pair in spans.values()],
+            [columns[pair[1]] for pair in spans.values()],
+        )).astype(np.intp)
+        self.num_points = len(columns)
+        self.num_spans = len(spans)
+        self.names = list(angles) + list(columns) + list(spans)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.num_signals = len(self.names)
+        # Landmarks the rules read, whose visibility decision_margin() reports
+        self.landmarks = np.unique(np.concatenate((
+            np.array(list(angles.values()), dtype=np.intp).reshape(-1), list(points.values())))).astype(np.intp)
+        # The same as a list, for as_array() to convert only these
+        self.rows = self.landmarks.tolist()
+        # Numbers in transition conditions are constant columns after the signals
+        self.constants = []
+        # (angle column, threshold, transition index or None when always relevant)
+        self.thresholds = []
+
+        self.initial = spec.get("initial")
+        self.transitions = []
+        groups = []
+        for transition in spec["transitions"]:
+            origin = transition.get("from")
+            self.transitions.append((
+                None if origin is None else frozenset([origin] if isinstance(origin, str) else origin),
+                transition["to"],
+                transition.get("rep", False),
+                transition.get("clear", False),
+                "side" in transition,
+                transition.get("side"),
+            ))
+            groups.append(transition["when"])
+            for condition in transition["when"]:
+                self._add_threshold(condition, len(self.transitions) - 1)
+        # The last group, when present, decides whether a frame is tracked
+        self.track_always = not spec.get("track_when")
+        if not self.track_always:
+            groups.append(spec["track_when"])
+            for condition in spec["track_when"]:
+                self._add_threshold(condition)
+        self.conditions = Conditions(groups, self._operand)
+        self.constants = np.array(self.constants)
+
+        # Tracked signals share one RunningRange; each track is a column slice
+        self.tracks = {}
+        signals = []
+        for name, track in spec.get("track", {}).items():
+            self.tracks[name] = (len(signals), len(track))
+            signals.extend(self._signal(signal) for signal in track)
+        self.track_signals = np.array(signals, dtype=np.intp)
+        self.track_width = len(signals)
+
+        # Checks see [signals, track min, track max, track range, their own constants]
+        self.good = spec["good"]
+        self.bad = spec["bad"]
+        self.check_messages = []
+        self.check_alone = []
+        self.check_sides = []
+        self.check_constants = []
+        check_groups = []
+        for check in spec.get("checks", []):
+            templated = any("{side}" in condition[0] for condition in check["require"])
+            for side in spec.get("sides", ("left", "right")) if templated else (None,):
+                group = []
+                for condition in check["require"]:
+                    group.extend(self._check_conditions(condition, side))
+                for operand, op, value in group:
+                    # A track's extreme is set on whichever frame the signal
+                    # comes near it. Plain signals are only read on the frame
+                    # a rep fires, which is a decision anyway
+                    if isinstance(operand, tuple) and operand[0] != "range":
+                        self._add_threshold((self.names[self.track_signals[operand[1]]], op, value))
+                check_groups.append(group)
+                self.check_messages.append(check["message"])
+                self.check_alone.append(check.get("alone", check["message"]))
+                self.check_sides.append(side)
+        self.checks = Conditions(check_groups, self._stat) if check_groups else None
+        self.check_constants = np.array(self.check_constants)
+
+        # (from stage, to stage) -> (phase name, position in the cycle)
+        tempo = spec.get("tempo", [])
+        self.phases = {(start, end): (name, i) for i, (name, start, end) in enumerate(tempo)}
+        self.num_phases = len(tempo)
+
+        # Per stage: the transitions that would leave it and the thresholds that matter in it
+        stages = {self.initial}
+        for origin, stage, *_ in self.transitions:
+            stages.add(stage)
+            stages.update(origin or ())
+        self.decisions = {stage: self._decisions(stage) for stage in stages}
+
+    def _add_threshold(self, condition, transition=None):
+        # Only angles, so that every margin is in degrees
+        left, _, right = condition
+        for signal, value in ((left, right), (right, left)):
+            if isinstance(signal, str) and not isinstance(value, str) and \
+                    self.index.get(signal, self.num_angles) < self.num_angles:
+                self.thresholds.append((self.index[signal], float(value), transition))
+
+    def _decisions(self, stage):
+        # Transitions back into `stage` itself only restart tracking
+        changes = [i for i, (origin, to, *_) in enumerate(self.transitions)
+                   if (origin is None or stage in origin) and to != stage]
+        thresholds = [(column, value) for column, value, transition in self.thresholds
+                      if transition is None or transition in changes]
+        return (np.array(changes, dtype=np.intp),
+                np.array([column for column, _ in thresholds], dtype=np.intp),
+                np.array([value for _, value in thresholds]))
+
+    def _signal(self, name):
+        if name not in self.index:
+            raise ValueError(f"Unknown signal {name!r}")
+        return self.index[name]
+
+    def _operand(self, operand):
+        if isinstance(operand, str):
+            return self._signal(operand)
+        self.constants.append(float(operand))
+        return self.num_signals + len(self.constants) - 1
+
+    def _stat(self, operand):
+        if isinstance(operand, str):
+            return self._signal(operand)
+        if isinstance(operand, tuple):
+            stat, column = operand
+            return self.num_signals + STATS.index(stat) * self.track_width + column
+        self.check_constants.append(float(operand))
+        return self.num_signals + len(STATS) * self.track_width + len(self.check_constants) - 1
+
+    def _check_conditions(self, condition, side):
+        """Expand one check condition into conditions on single stats columns."""
+        if len(condition) == 3:
+            signal, op, value = condition
+            return [(signal.format(side=side), op, value)]
+        track, stat, op, value = condition
+        track = track.format(side=side)
+        if stat not in STATS:
+            raise ValueError(f"Unknown statistic {stat!r}")
+        if track not in self.tracks:
+            raise ValueError(f"Unknown track {track!r}")
+        offset, width = self.tracks[track]
+        return [((stat, offset + i), op, value) for i in range(width)]
+
+    def values(self, points):
+        """Signals then constants for one (33, 4) frame, as a (columns,) array,
+        or for a (frames, 33, 4) batch, as (columns, frames)."""
+        points = np.asarray(points)
+        # Columns along the first axis keep every slice below the same for
+        # one frame and for a batch
+        if points.ndim == 2:
+            flat = points.reshape(-1)
+            constants = self.constants
+        else:
+            flat = points.reshape(len(points), -1).T
+            constants = np.repeat(self.constants[:, None], len(points), axis=1)
+        gathered = flat.take(self.gather, axis=0).astype(np.float64)
+        start = 8 * self.num_angles
+        end = start + self.num_points
+        spans = np.abs(gathered[end:end + self.num_spans] - gathered[end + self.num_spans:])
+        return np.concatenate((gathered_angles(gathered[:start]), gathered[start:end], spans, constants))
+
+    def evaluate(self, points):
+        """Signal values and which transition (and tracking) groups hold."""
+        values = self.values(points)
+        return values, self.conditions(values)
+
+    def decision_margin(self, points, stage):
+        """How close one (33, 4) frame is to a decision made from `stage`.
+
+        Returns the degrees between the frame's angles and the nearest
+        relevant threshold (0 when a transition out of `stage` would fire
+        on this frame) and the lowest visibility among the landmarks the
+        rules read.
+        """
+        values, groups = self.evaluate(points)
+        visibility = float(points[self.landmarks, 3].min())
+        decision = self.decisions.get(stage)
+        if decision is None:
+            decision = self._decisions(stage)
+        changes, columns, thresholds = decision
+        if groups[changes].any():
+            return 0.0, visibility
+        if not len(columns):
+            return float("inf"), visibility
+        return float(np.abs(values[columns] - thresholds).min()), visibility
+
+    def check_results(self, values, tracked):
+        """Whether each check passes for a rep ending on a frame with `values`."""
+        if self.checks is None:
+            return []
+        parts = [values[:self.num_signals]]
+        if tracked is not None:
+            parts += [tracked.low, tracked.high, tracked.range()]
+        return self.checks(np.concatenate(parts + [self.check_constants])).tolist()
+
+
+class RuleAnalyzer:
+    """Analyzer driven by a subclass's RULES (an ExerciseRules)."""
+    RULES = None
+    # Fields saved when a client disconnects and restored when it resumes.
+    STATE_FIELDS = ("total_reps", "correct_reps", "incorrect_reps", "stage", "side", "tracked")
+
+    def __init__(self):
+        self.tracked = RunningRange(self.RULES.track_width) if self.RULES.track_width else None
+        self.reset()
+
+    def reset(self):
+        """Reset counts, stage and tracked signals to start a new session."""
+        self.total_reps = 0
+        self.correct_reps = 0
+        self.incorrect_reps = 0
+        self.stage = self.RULES.initial
+        self.side = None
+        if self.tracked is not None:
+            self.tracked.clear()
+        # Timing is not part of the saved state; a resumed session starts a new cycle
+        self.clock = None
+        self.last_at = {}
+        self.cycle_start = None
+        self.phase_times = {}
+
+    def analyze(self, landmarks, timestamp=None):
+        """Analyze one frame captured at `timestamp` ms (default: now).
+
+        MediaPipe landmarks are converted once, and only the ones the rules read.
+        """
+        if timestamp is None:
+            timestamp = time.perf_counter() * 1000
+        values, groups = self.RULES.evaluate(as_array(landmarks, self.RULES.rows))
+        return self._step(values, groups.tolist(), timestamp)
+
+    def analyze_batch(self, points, timestamps):
+        """Analyze a (frames, 33, 4) array in order, as if frame by frame.
+
+        `timestamps` are the frames' capture times in ms. Returns (frame
+        index, feedback) for every frame that produced feedback.
+        """
+        values, groups = self.RULES.evaluate(points)
+        results = []
+        frames = zip(values.T, groups.T.tolist(), np.asarray(timestamps, dtype=np.float64).tolist())
+        for index, (frame_values, frame_groups, timestamp) in enumerate(frames):
+            feedback = self._step(frame_values, frame_groups, timestamp)
+            if feedback:
+                results.append((index, feedback))
+        return results
+
+    def decision_margin(self, landmarks):
+        """ExerciseRules.decision_margin() for one frame from the current stage."""
+        return self.RULES.decision_margin(as_array(landmarks, self.RULES.rows), self.stage)
+
+    def _step(self, values, groups, timestamp):
+        rules = self.RULES
+        tracked = self.tracked
+        feedback = {}
+        appended = False
+        # Time never runs backwards, whatever the client's clock does
+        if self.clock is not None and timestamp < self.clock:
+            timestamp = self.clock
+        self.clock = timestamp
+        # Tracking starts with the first transition
+        if self.stage is None and tracked is not None:
+            tracked.clear()
+        for fired, (origin, stage, rep, clear, sets_side, side) in zip(groups, rules.transitions):
+            if not fired or (origin is not None and self.stage not in origin):
+                continue
+            if rep:
+                if tracked is not None:
+                    tracked.append_row(values[rules.track_signals])
+                    appended = True
+                feedback["feedback"] = self._score(values)
+            if stage != self.stage and rules.num_phases:
+                self._end_phase(self.stage, stage, timestamp, feedback)
+            self.stage = stage
+            if sets_side:
+                self.side = side
+            if clear and tracked is not None:
+                tracked.clear()
+                appended = False
+            break
+        if tracked is not None and not appended and (rules.track_always or groups[-1]):
+            tracked.append_row(values[rules.track_signals])
+        if rules.num_phases:
+            # Each stage's position was last held when a transition into it could fire
+            for fired, transition in zip(groups, rules.transitions):
+                if fired:
+                    self.last_at[transition[1]] = timestamp
+        return feedback
+
+    def _end_phase(self, previous, stage, timestamp, feedback):
+        rules = self.RULES
+        phase = rules.phases.get((previous, stage))
+        if phase is None:
+            return
+        name, position = phase
+        left = self.last_at.get(previous)
+        if position == 0:
+            self.cycle_start = left
+            self.phase_times = {}
+        if left is None or self.cycle_start is None:
+            self.cycle_start = None
+            return
+        self.phase_times[name] = round((timestamp - left) / 1000, 3)
+        if position == rules.num_phases - 1 and len(self.phase_times) == rules.num_phases:
+            feedback["tempo"] = dict(self.phase_times, rep=self.total_reps,
+                                     timeUnderTension=round((timestamp - self.cycle_start) / 1000, 3))
+            self.cycle_start = None
+
+    def _score(self, values):
+        rules = self.RULES
+        self.total_reps += 1
+        failed = [index for index, (side, passed) in
+                  enumerate(zip(rules.check_sides, rules.check_results(values, self.tracked)))
+                  if not passed and (side is None or side == self.side)]
+        if failed:
+            self.incorrect_reps += 1
+            if len(failed) == 1:
+                text = rules.check_alone[failed[0]]
+            else:
+                text = " ".join(rules.check_messages[index] for index in failed)
+            return {"count": self.total_reps, "text": rules.bad + text, "intent": 0}
+        self.correct_reps += 1
+        return {"count": self.total_reps, "text": rules.good, "intent": 1}
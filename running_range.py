@@ -0,0 +1,36 @@
+import numpy as np
+
+
+class RunningRange:
+    """Running per-column min/max of the rows appended since the last clear().
+
+    Keeps no samples, so range checks stay exact however long a rep takes
+    while memory stays constant. Appending never allocates.
+    """
+
+    def __init__(self, width):
+        self.width = width
+        self.low = np.empty(width, dtype=np.float64)
+        self.high = np.empty_like(self.low)
+        self.clear()
+
+    def clear(self):
+        self.low.fill(np.inf)
+        self.high.fill(-np.inf)
+
+    def append_row(self, row):
+        """Take one length-`width` row into the min/max, without a Python loop."""
+        np.fmin(self.low, row, out=self.low)
+        np.fmax(self.high, row, out=self.high)
+
+    def range(self):
+        """max - min since the last clear()."""
+        return self.high - self.low
+
+    def get_state(self):
+        """Running min/max, enough to resume range checks."""
+        return {"low": self.low.tolist(), "high": self.high.tolist()}
+
+    def set_state(self, state):
+        self.low[:] = state["low"]
+        self.high[:] = state["high"]
@@ -0,0 +1,109 @@
+"""Analyzer state snapshots kept between a client's connections.
+
+When a client disconnects, the state of each of its analyzers (the fields
+named in the analyzer's STATE_FIELDS) is saved under its session token.
+A client that reconnects with the token within the TTL gets its counts
+back. Snapshots are zlib-compressed JSON, a few hundred bytes per session.
+"""
+import json
+import secrets
+import sqlite3
+import time
+import zlib
+from collections import OrderedDict
+from urllib.parse import parse_qs, urlsplit
+from running_range import RunningRange
+
+
+def new_token():
+    return secrets.token_urlsafe(16)
+
+
+def token_from_path(path):
+    """The `session` query parameter of a WebSocket request path, or None."""
+    values = parse_qs(urlsplit(path).query).get("session")
+    return values[0] if values else None
+
+
+def analyzer_state(analyzer):
+    """The resumable fields of one analyzer as plain values."""
+    state = {}
+    for name in analyzer.STATE_FIELDS:
+        value = getattr(analyzer, name)
+        state[name] = value.get_state() if isinstance(value, RunningRange) else value
+    return state
+
+
+def restore_analyzer(analyzer, state):
+    for name in analyzer.STATE_FIELDS:
+        if name not in state:
+            continue
+        value = getattr(analyzer, name)
+        if isinstance(value, RunningRange):
+            value.set_state(state[name])
+        else:
+            setattr(analyzer, name, state[name])
+    if hasattr(analyzer, "resume"):
+        analyzer.resume()
+
+
+def encode_state(states):
+    """Serialize a session's analyzer states, keyed by workout type."""
+    return zlib.compress(json.dumps(states, separators=(",", ":")).encode())
+
+
+def decode_state(data):
+    return json.loads(zlib.decompress(data))
+
+
+class SessionStore:
+    """Bounded, TTL-evicted store of encoded session states.
+
+    Holds at most `capacity` sessions in memory, evicting the least recently
+    saved. With `path`, states are also written through to a SQLite file, so
+    they survive eviction and restarts and can be shared by the inference
+    workers on one host. A state is handed out once: take() removes it.
+    """
+
+    def __init__(self, capacity=1000, ttl=300.0, path=None):
+        self.capacity = capacity
+        self.ttl = ttl
+        # token -> (expires_at, data), oldest first
+        self.entries = OrderedDict()
+        self.db = None
+        if path:
+            self.db = sqlite3.connect(path, timeout=5, isolation_level=None)
+            self.db.execute("CREATE TABLE IF NOT EXISTS sessions (token TEXT PRIMARY KEY, state BLOB, expires REAL)")
+
+    def _evict(self, now):
+        while self.entries and (len(self.entries) > self.capacity or next(iter(self.entries.values()))[0] <= now):
+            self.entries.popitem(last=False)
+
+    def put(self, token, data):
+        now = time.time()
+        self.entries.pop(token, None)
+        self.entries[token] = (now + self.ttl, data)
+        self._evict(now)
+        if self.db is not None:
+            self.db.execute("DELETE FROM sessions WHERE expires <= ?", (now,))
+            self.db.execute("INSERT OR REPLACE INTO sessions VALUES (?, ?, ?)", (token, data, now + self.ttl))
+
+    def take(self, token):
+        """The state saved under `token` if it has not expired, else None."""
+        now = time.time()
+        entry = self.entries.pop(token, None)
+        if self.db is not None:
+            row = self.db.execute("SELECT state, expires FROM sessions WHERE token = ?", (token,)).fetchone()
+            self.db.execute("DELETE FROM sessions WHERE token = ?", (token,))
+            if entry is None and row is not None:
+                entry = (row[1], row[0])
+        if entry is None or entry[0] <= now:
+            return None
+        return entry[1]
+
+    def __len__(self):
+        return len(self.entries)
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
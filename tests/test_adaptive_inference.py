@@ -0,0 +1,39 @@
+import numpy as np
+
+from adaptive_inference import AdaptivePose, PoseResults
+
+
+def person(visibility):
+    landmarks = np.zeros((33, 4), dtype=np.float32)
+    landmarks[:, 0] = np.linspace(0.3, 0.7, 33)
+    landmarks[:, 1] = np.linspace(0.2, 0.9, 33)
+    landmarks[:, 3] = visibility
+    return landmarks
+
+
+class ScriptedPose:
+    """Returns the next of `results` on every call, whatever the frame."""
+
+    def __init__(self, results):
+        self.results = iter(results)
+        self.calls = 0
+
+    def process(self, rgb_frame):
+        self.calls += 1
+        return PoseResults(next(self.results))
+
+
+def frames(count):
+    rng = np.random.default_rng(0)
+    # Fresh noise every frame, so no frame is skipped as motionless
+    return [rng.integers(0, 256, (240, 320, 3), dtype=np.uint8) for _ in range(count)]
+
+
+def test_recovers_after_all_landmarks_drop_below_visibility():
+    pose = ScriptedPose([person(0.99), person(0.1), person(0.99), person(0.99)])
+    adaptive = AdaptivePose(pose)
+    results = [adaptive.process(frame) for frame in frames(4)]
+    assert pose.calls == 4
+    assert all(result.pose_landmarks is not None for result in results)
+    # Nothing visible to crop around, so the next frame ran on the full frame
+    assert adaptive.box is not None
@@ -0,0 +1,75 @@
+import math
+
+import numpy as np
+import pytest
+
+from bicep_curl import BicepCurlAnalyzer
+from landmark_filter import DEFAULT_FILTER, FILTERS, make_filter, smoothed
+from landmarks import LandmarkArray
+
+REPS = 10
+
+# Standard deviation of the landmark noise, in normalized units
+JITTER = 0.003
+
+
+def standing_pose():
+    landmarks = np.full((33, 4), 0.5, dtype=np.float32)
+    landmarks[:, 2] = 0.0
+    landmarks[:, 3] = 0.99
+    for index, point in {11: (0.58, 0.30), 12: (0.42, 0.30), 23: (0.55, 0.60), 24: (0.45, 0.60),
+                         25: (0.55, 0.77), 26: (0.45, 0.77), 27: (0.55, 0.94), 28: (0.45, 0.94)}.items():
+        landmarks[index, :2] = point
+    return landmarks
+
+
+def fast_curls(fps, period):
+    """Curls with the elbow swinging 23..167 degrees, `period` seconds a rep."""
+    for i in range(int(round(fps * period * REPS)) + 1):
+        t = i / fps
+        angle = math.radians(95 + 72 * math.cos(2 * math.pi * t / period))
+        landmarks = standing_pose()
+        for side, (shoulder, elbow, wrist) in {1: (11, 13, 15), -1: (12, 14, 16)}.items():
+            landmarks[elbow, :2] = landmarks[shoulder, :2] + (0.0, 0.15)
+            landmarks[wrist, :2] = landmarks[elbow, :2] + 0.13 * np.array([side * math.sin(angle), -math.cos(angle)])
+        yield landmarks, t * 1000
+
+
+def jittered(frames, seed=0):
+    rng = np.random.default_rng(seed)
+    for landmarks, timestamp in frames:
+        landmarks[:, :3] += rng.normal(0.0, JITTER, (33, 3))
+        yield landmarks, timestamp
+
+
+@pytest.mark.parametrize("fps, period", [(30, 1.0), (15, 1.2), (10, 1.5)])
+def test_default_filter_counts_fast_reps(fps, period):
+    analyzer = smoothed(BicepCurlAnalyzer(), DEFAULT_FILTER)
+    for landmarks, timestamp in fast_curls(fps, period):
+        analyzer.analyze(LandmarkArray(landmarks), timestamp)
+    assert analyzer.total_reps == REPS
+
+
+@pytest.mark.parametrize("kind", sorted(FILTERS))
+@pytest.mark.parametrize("fps, period", [(30, 1.0), (15, 1.2), (10, 1.5)])
+def test_filters_count_jittered_fast_reps(kind, fps, period):
+    analyzer = smoothed(BicepCurlAnalyzer(), kind)
+    for landmarks, timestamp in jittered(fast_curls(fps, period)):
+        analyzer.analyze(LandmarkArray(landmarks), timestamp)
+    assert analyzer.total_reps == REPS
+
+
+@pytest.mark.parametrize("kind", sorted(FILTERS))
+@pytest.mark.parametrize("fps", [30, 10])
+def test_filters_reduce_jitter_at_rest(kind, fps):
+    pose = standing_pose()
+    landmark_filter = make_filter(kind)
+    frames = jittered((pose.copy(), i * 1000 / fps) for i in range(5 * fps))
+    errors = [landmark_filter(landmarks, timestamp)[:, :3] - pose[:, :3] for landmarks, timestamp in frames]
+    # Skip the first second, while the filter settles
+    assert np.std(errors[fps:]) < 0.8 * JITTER
+
+
+def test_none_leaves_analyzer_unwrapped():
+    analyzer = BicepCurlAnalyzer()
+    assert smoothed(analyzer, "none") is analyzer
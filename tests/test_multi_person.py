@@ -0,0 +1,67 @@
+import asyncio
+
+import cv2
+import numpy as np
+
+from adaptive_inference import PoseResults
+from analyzers import ANALYZERS, SessionAnalyzers
+from frame_pipeline import FrameExecutor
+from multi_person import MultiPersonPose
+
+
+class NobodyPose:
+    """A Pose lease that never finds anyone in its crop."""
+
+    def __init__(self):
+        self.released = False
+
+    def process(self, rgb_frame):
+        return PoseResults(None)
+
+    def release(self):
+        self.released = True
+
+
+def one_detection(rgb_frame):
+    return np.array([[100.0, 20.0, 220.0, 230.0]])
+
+
+def test_process_returns_pruned_track_ids():
+    leases = []
+
+    def acquire():
+        leases.append(NobodyPose())
+        return leases[-1]
+
+    people_pose = MultiPersonPose(acquire, one_detection, detect_interval=100, max_missed=1)
+    frame = np.zeros((240, 320, 3), dtype=np.uint8)
+    people, pruned = people_pose.process(frame)
+    assert [track_id for track_id, _, _ in people] == [1] and pruned == []
+    people, pruned = people_pose.process(frame)
+    assert people == [] and pruned == [1]
+    assert leases[0].released
+
+
+def test_session_drops_participants_of_pruned_tracks():
+    executor = FrameExecutor("thread", workers=1)
+    session = executor.session()
+    session.people["bicep_curl"] = MultiPersonPose(NobodyPose, one_detection, detect_interval=100, max_missed=1)
+    analyzers = SessionAnalyzers()
+    analyzers.participant("bicep_curl", 1)
+    dropped = []
+    frame_data = cv2.imencode(".jpg", np.zeros((240, 320, 3), dtype=np.uint8))[1].tobytes()
+
+    async def run():
+        for _ in range(2):
+            await session.process_group(
+                frame_data, lambda track_id: analyzers.participant("bicep_curl", track_id),
+                ANALYZERS["bicep_curl"], "bicep_curl", None,
+                lambda track_id: dropped.append(analyzers.drop_participant("bicep_curl", track_id)))
+
+    try:
+        asyncio.run(run())
+    finally:
+        session.close()
+        executor.shutdown()
+    assert len(dropped) == 1 and dropped[0] is not None
+    assert analyzers.participants == {}
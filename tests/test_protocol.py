@@ -0,0 +1,36 @@
+import pytest
+
+from protocol import RESP_HAS_COUNTS, RESP_HAS_SEQ, RESPONSE_HEADER, pack_response, parse_response
+
+FEEDBACK = {"totalReps": 3, "correctReps": 2, "incorrectReps": 1, "feedback": "Good rep", "error": "",
+            "droppedFrames": 0, "latencyMs": 12.5}
+
+
+def flags(data):
+    return RESPONSE_HEADER.unpack_from(data)[2]
+
+
+def test_round_trip_in_header():
+    message = dict(FEEDBACK, seq=7)
+    data = pack_response(message)
+    assert flags(data) & RESP_HAS_SEQ and flags(data) & RESP_HAS_COUNTS
+    assert parse_response(data) == message
+
+
+@pytest.mark.parametrize("seq", ["7", 7.5, -1, 2 ** 32, None, True])
+def test_seq_that_does_not_fit_travels_as_json(seq):
+    data = pack_response(dict(FEEDBACK, seq=seq))
+    assert not flags(data) & RESP_HAS_SEQ
+    assert parse_response(data)["seq"] == seq
+
+
+def test_counts_past_uint16_travel_as_json():
+    message = dict(FEEDBACK, totalReps=70000, correctReps=69999)
+    data = pack_response(message)
+    assert not flags(data) & RESP_HAS_COUNTS
+    assert parse_response(data) == message
+
+
+@pytest.mark.parametrize("field, value", [("droppedFrames", 2 ** 32), ("droppedFrames", "3"), ("latencyMs", 1e39)])
+def test_meta_fields_that_do_not_fit_travel_as_json(field, value):
+    assert parse_response(pack_response(dict(FEEDBACK, **{field: value})))[field] == value
@@ -0,0 +1,59 @@
+import json
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from analyzers import ANALYZERS
+from landmark_trace import LandmarkTrace
+from landmarks import LandmarkArray
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+
+# Feedback the hand-written analyzers gave on these traces before the rule
+# engine replaced them, as [frame index, feedback]
+with open(os.path.join(DATA_DIR, "rep_feedback.json")) as f:
+    EXPECTED = json.load(f)
+
+
+def load(name):
+    trace = LandmarkTrace(os.path.join(DATA_DIR, f"{name}.trace"))
+    assert trace.metadata["workoutType"] == name
+    return trace.landmarks, trace.timestamps.tolist()
+
+
+def as_landmark_list(points):
+    """Stand-in for a MediaPipe landmark list."""
+    return [SimpleNamespace(x=x, y=y, z=z, visibility=v) for x, y, z, v in points.tolist()]
+
+
+@pytest.mark.parametrize("name", sorted(EXPECTED))
+def test_rules_match_recorded_reps(name):
+    frames, timestamps = load(name)
+    analyzer = ANALYZERS[name]()
+    feedback = []
+    for index, (points, timestamp) in enumerate(zip(frames, timestamps)):
+        result = analyzer.analyze(LandmarkArray(points), timestamp)
+        if result.get("feedback"):
+            feedback.append([index, result["feedback"]])
+    assert feedback == EXPECTED[name]
+
+
+@pytest.mark.parametrize("name", sorted(EXPECTED))
+def test_landmark_lists_match_recorded_reps(name):
+    frames, timestamps = load(name)
+    analyzer = ANALYZERS[name]()
+    feedback = []
+    for index, (points, timestamp) in enumerate(zip(frames, timestamps)):
+        result = analyzer.analyze(as_landmark_list(points), timestamp)
+        if result.get("feedback"):
+            feedback.append([index, result["feedback"]])
+    assert feedback == EXPECTED[name]
+
+
+@pytest.mark.parametrize("name", sorted(EXPECTED))
+def test_batch_matches_recorded_reps(name):
+    frames, timestamps = load(name)
+    results = ANALYZERS[name]().analyze_batch(frames, timestamps)
+    feedback = [[index, result["feedback"]] for index, result in results if result.get("feedback")]
+    assert feedback == EXPECTED[name]
@@ -0,0 +1,117 @@
+import os
+
+import pytest
+
+import session_store
+from analyzers import SessionAnalyzers
+from landmark_trace import LandmarkTrace
+from landmarks import LandmarkArray
+from plank import PlankAnalyzer
+from session_store import SessionStore, analyzer_state, decode_state, encode_state, restore_analyzer
+
+TRACE = os.path.join(os.path.dirname(__file__), "data", "bicep_curl.trace")
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """session_store's time.time(), set by assigning clock.now."""
+    class Clock:
+        now = 1000.0
+    monkeypatch.setattr(session_store.time, "time", lambda: Clock.now)
+    return Clock
+
+
+def replay(analyzers, trace, frames):
+    for index in frames:
+        analyzers["bicep_curl"].analyze(LandmarkArray(trace.landmarks[index]), trace.timestamps[index])
+
+
+def test_encode_decode_round_trip():
+    states = {"bicep_curl": {"total_reps": 3, "stage": "up", "side": None,
+                             "tracked": {"low": [0.1, 0.2], "high": [0.3, 0.4]}}}
+    data = encode_state(states)
+    assert isinstance(data, bytes)
+    assert decode_state(data) == states
+
+
+def test_take_hands_a_state_out_once(clock):
+    store = SessionStore()
+    store.put("a", b"state")
+    assert store.take("a") == b"state"
+    assert store.take("a") is None
+
+
+def test_states_expire_after_ttl(clock):
+    store = SessionStore(ttl=10.0)
+    store.put("a", b"1")
+    store.put("b", b"2")
+    clock.now += 9.0
+    assert store.take("a") == b"1"
+    clock.now += 2.0
+    assert store.take("b") is None
+    # Expired states are dropped on the next put
+    store.put("c", b"3")
+    clock.now += 11.0
+    store.put("d", b"4")
+    assert len(store) == 1
+
+
+def test_least_recently_saved_is_evicted(clock):
+    store = SessionStore(capacity=2)
+    store.put("a", b"1")
+    store.put("b", b"2")
+    store.put("a", b"1 again")
+    store.put("c", b"3")
+    assert len(store) == 2
+    assert store.take("b") is None
+    assert store.take("a") == b"1 again"
+    assert store.take("c") == b"3"
+
+
+def test_sqlite_backend_shares_and_keeps_evicted_states(clock, tmp_path):
+    path = str(tmp_path / "sessions.db")
+    store = SessionStore(capacity=1, ttl=10.0, path=path)
+    store.put("a", b"1")
+    store.put("b", b"2")
+    assert len(store) == 1
+    # Another process on the host sees both, including the one evicted from memory
+    other = SessionStore(ttl=10.0, path=path)
+    assert other.take("a") == b"1"
+    assert store.take("a") is None
+    clock.now += 11.0
+    assert other.take("b") is None
+    store.close()
+    other.close()
+
+
+def test_restore_analyzer_round_trips_state_fields():
+    analyzer = PlankAnalyzer()
+    analyzer.total_reps, analyzer.holding, analyzer.correct_duration = 2, True, 4.5
+    analyzer.last_correct = 1234.0
+    restored = PlankAnalyzer()
+    restore_analyzer(restored, decode_state(encode_state(analyzer_state(analyzer))))
+    assert (restored.total_reps, restored.holding, restored.correct_duration) == (2, True, 4.5)
+    # Timing is not saved, so time spent disconnected never counts
+    assert restored.last_correct is None
+
+
+@pytest.mark.parametrize("split", [40, 77, 150])
+def test_resumed_session_counts_like_an_uninterrupted_one(clock, split):
+    trace = LandmarkTrace(TRACE)
+    uninterrupted = SessionAnalyzers()
+    replay(uninterrupted, trace, range(len(trace)))
+
+    store = SessionStore()
+    first = SessionAnalyzers()
+    replay(first, trace, range(split))
+    store.put("token", encode_state(first.get_state()))
+    resumed = SessionAnalyzers(decode_state(store.take("token")))
+    # States not used yet are saved again as they were
+    assert resumed.get_state() == first.get_state()
+    replay(resumed, trace, range(split, len(trace)))
+
+    expected, actual = uninterrupted["bicep_curl"], resumed["bicep_curl"]
+    assert expected.total_reps > 0
+    assert (actual.total_reps, actual.correct_reps, actual.incorrect_reps) == \
+        (expected.total_reps, expected.correct_reps, expected.incorrect_reps)
+    assert analyzer_state(actual) == analyzer_state(expected)
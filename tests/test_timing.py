@@ -0,0 +1,86 @@
+import math
+
+import numpy as np
+
+from bicep_curl import BicepCurlAnalyzer
+from landmarks import LandmarkArray
+from plank import PlankAnalyzer
+
+# (timestamp ms, elbow angle) for one curl with pauses at the bottom and the
+# top: down until 500, up from 1000 to 1800, down again at 2400
+CURL = [(0, 170), (500, 170), (700, 100), (1000, 20), (1400, 20), (1800, 20), (2000, 100), (2400, 170)]
+CURL_TEMPO = dict(concentric=0.5, eccentric=0.6, rep=1, timeUnderTension=1.9)
+
+
+def curl_pose(angle):
+    """Standing with both upper arms along the body and the elbows at `angle` degrees."""
+    landmarks = np.full((33, 4), 0.5, dtype=np.float32)
+    landmarks[:, 2] = 0.0
+    landmarks[:, 3] = 0.99
+    for side, (shoulder, elbow, wrist, hip) in ((1, (11, 13, 15, 23)), (-1, (12, 14, 16, 24))):
+        landmarks[shoulder, :2] = 0.5 + side * 0.08, 0.3
+        landmarks[hip, :2] = 0.5 + side * 0.05, 0.6
+        landmarks[elbow, :2] = landmarks[shoulder, :2] + (0.0, 0.15)
+        radians = math.radians(angle)
+        landmarks[wrist, :2] = landmarks[elbow, :2] + 0.13 * np.array([side * math.sin(radians), -math.cos(radians)])
+    return landmarks
+
+
+def plank_pose(hip_drop=0.0):
+    """Side-on plank; dropping the hips below the shoulder-ankle line bends it."""
+    landmarks = np.full((33, 4), 0.5, dtype=np.float32)
+    landmarks[:, 2] = 0.0
+    landmarks[:, 3] = 0.99
+    for shoulder, hip, ankle in ((11, 23, 27), (12, 24, 28)):
+        landmarks[shoulder, :2] = 0.2, 0.5
+        landmarks[hip, :2] = 0.5, 0.5 + hip_drop
+        landmarks[ankle, :2] = 0.9, 0.5
+    return LandmarkArray(landmarks)
+
+
+def test_plank_reset_clears_hold():
+    analyzer = PlankAnalyzer()
+    analyzer.analyze(plank_pose(), 0.0)
+    analyzer.analyze(plank_pose(), 1000.0)
+    assert analyzer.holding and analyzer.correct_duration == 1.0
+    analyzer.reset()
+    assert not analyzer.holding and analyzer.correct_duration == 0 and analyzer.last_correct is None
+    assert (analyzer.total_reps, analyzer.correct_reps, analyzer.incorrect_reps) == (0, 0, 0)
+    # The time before the reset never counts towards the next hold
+    analyzer.analyze(plank_pose(), 5000.0)
+    assert analyzer.analyze(plank_pose(), 5500.0)["correct_duration"] == 0.5
+
+
+def test_curl_tempo_comes_from_frame_timestamps():
+    analyzer = BicepCurlAnalyzer()
+    results = [analyzer.analyze(LandmarkArray(curl_pose(angle)), timestamp) for timestamp, angle in CURL]
+    assert results[3]["feedback"]["count"] == 1 and "tempo" not in results[3]
+    assert [result.get("tempo") for result in results] == [None] * 7 + [CURL_TEMPO]
+
+
+def test_batch_curl_tempo_matches_frame_by_frame():
+    points = np.stack([curl_pose(angle) for _, angle in CURL])
+    results = dict(BicepCurlAnalyzer().analyze_batch(points, [timestamp for timestamp, _ in CURL]))
+    assert results[7]["tempo"] == CURL_TEMPO
+
+
+def test_curl_tempo_ignores_clock_running_backwards():
+    analyzer = BicepCurlAnalyzer()
+    # The client's clock jumps back 300 ms during the eccentric phase; the
+    # frame stamped 1700 counts as 1800, so the phase ends 100 ms after it began
+    frames = CURL[:6] + [(1700, 100), (1900, 170)]
+    tempo = [analyzer.analyze(LandmarkArray(curl_pose(angle)), timestamp) for timestamp, angle in frames][-1]["tempo"]
+    assert tempo == dict(concentric=0.5, eccentric=0.1, rep=1, timeUnderTension=1.4)
+
+
+def test_plank_duration_comes_from_frame_timestamps():
+    analyzer = PlankAnalyzer()
+    # Frames arrive unevenly, the clock runs back once and the hold ends at 1500
+    frames = [(0, 0.0), (400, 0.0), (1000, 0.0), (900, 0.0), (1200, 0.0), (1500, 0.2)]
+    results = [analyzer.analyze(plank_pose(hip_drop), timestamp) for timestamp, hip_drop in frames]
+    assert [result["correct_duration"] for result in results] == [0, 0.4, 1.0, 1.0, 1.3, 1.3]
+    assert results[-1]["feedback"]["intent"] == 0
+    assert results[-1]["tempo"] == {"timeUnderTension": 1.3}
+    # A new hold starts from zero
+    analyzer.analyze(plank_pose(), 3000.0)
+    assert analyzer.analyze(plank_pose(), 3250.0)["correct_duration"] == 0.25
@@ -1,12 +1,13 @@
-import numpy as np 
+import math
 def calculate_angle(a, b, c):
-        """Calculate the angle between three points."""
-        a = np.array([a.x, a.y])
-        b = np.array([b.x, b.y])
-        c = np.array([c.x, c.y])
-        radians = np.arctan2(c[1]-b[1], c[0]-b[0]) - \
-                  np.arctan2(a[1]-b[1], a[0]-b[0])
-        angle = np.abs(radians * 180.0 / np.pi)
+        """Calculate the angle between three points.
+
+        Analyzers use the vectorized angles.compute_angles; this is kept for
+        one-off calculations on individual landmarks.
+        """
+        radians = math.atan2(c.y-b.y, c.x-b.x) - \
+                  math.atan2(a.y-b.y, a.x-b.x)
+        angle = abs(radians * 180.0 / math.pi)
         if angle > 180.0:
             angle = 360 - angle
         return angle
\ No newline at end of file